@@ -0,0 +1,121 @@
+import re
+import unicodedata
+import zlib
+
+
+# ==================== 文字分析 ==================== #
+#
+# 建立索引 (BM25 倒排列表、TF-IDF 詞頻、位置索引) 與查詢 (TF-IDF、BM25、布林查詢、
+# 快取鍵) 都使用同一個分析器，查詢詞與索引中的詞一定一致。
+# 流程：Unicode 正規化 → 小寫 → 依 token_pattern 分詞 → 切分中日韓文字 → 去除停用詞 → 詞幹。
+# 沒有停用詞與詞幹時只做一次 findall；否則每個詞的結果快取在 cache 中，
+# 同一個詞只處理一次。
+#
+# 中日韓文字之間沒有空白，\w+ 會把整句當成一個詞。cjk 開啟時每段連續的中日韓文字
+# 切成重疊的二字詞 (「資料庫備份」→ 資料、料庫、庫備、備份)，單獨一個字則保留原字；
+# 也可以傳入 segmenter (例如 jieba.lcut) 改用詞典分詞。只有二字詞時查詢單獨一個字
+# 永遠找不到出現在較長句子中的這個字，所以 unigrams 開啟時每個字也各自成詞，
+# 與二字詞交錯排列 (資、資料、料、料庫、庫)。索引與查詢使用同一個分析器，詞在位置索引中
+# 的順序一致：查詢「資料庫」會被分析成片語「資 資料 料 料庫 庫」，只符合這三個字連續
+# 出現的文檔；查詢「庫」則符合任何含有這個字的文檔。
+
+# 日文假名、CJK 統一表意文字 (含擴充 A 與相容字) 與韓文音節
+_CJK_RUN = re.compile('[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+')
+
+
+class Analyzer:
+    """可設定的文字分析器，呼叫時返回詞列表
+
+    normalization 是 unicodedata 的正規化形式 (例如 'NFKC')，None 表示不做；
+    stopwords 是要去除的詞；stemmer 把一個詞轉成詞幹，None 表示不做。
+    cjk 開啟時連續的中日韓文字切成二字詞，或交給 segmenter (字串 -> 詞列表) 分詞；
+    unigrams 開啟時二字詞之間再插入單字。
+    cjk 關閉時的分詞與 TfidfVectorizer(token_pattern=r'(?u)\\b\\w+\\b') 相同。
+    """
+
+    def __init__(self, token_pattern=r'(?u)\b\w+\b', lowercase=True, normalization=None,
+                 stopwords=(), stemmer=None, cjk=False, segmenter=None, unigrams=True, cache_size=1 << 16):
+        self.token_pattern = token_pattern
+        self.lowercase = lowercase
+        self.normalization = normalization
+        self.cjk = cjk
+        self.segmenter = segmenter
+        self.unigrams = unigrams
+        self.stopwords = frozenset(word.lower() if lowercase else word for word in stopwords)
+        self.stemmer = stemmer
+        self.cache_size = cache_size
+        self.cache = {}     # 詞 -> 詞項，停用詞為空字串
+        self._findall = re.compile(token_pattern).findall
+
+    def __call__(self, text):
+        if self.normalization:
+            text = unicodedata.normalize(self.normalization, text)
+        if self.lowercase:
+            text = text.lower()
+        tokens = self._findall(text)
+        if self.cjk and not text.isascii():
+            tokens = self._split_cjk(tokens)
+        if not self.stopwords and self.stemmer is None:
+            return tokens
+        terms = [self.term(token) for token in tokens]
+        return [term for term in terms if term]
+
+    def _split_cjk(self, tokens):
+        result = []
+        for token in tokens:
+            if token.isascii():
+                result.append(token)
+                continue
+            start = 0
+            for run in _CJK_RUN.finditer(token):
+                if run.start() > start:
+                    result.append(token[start:run.start()])
+                result.extend(self.segment(run.group()))
+                start = run.end()
+            if start < len(token):
+                result.append(token[start:])
+        return result
+
+    def segment(self, run):
+        """一段連續的中日韓文字切成的詞"""
+        if self.segmenter is not None:
+            return self.segmenter(run)
+        if len(run) == 1:
+            return [run]
+        bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+        if not self.unigrams:
+            return bigrams
+        tokens = [None] * (2 * len(run) - 1)
+        tokens[::2] = run
+        tokens[1::2] = bigrams
+        return tokens
+
+    def term(self, token):
+        """已分詞、已小寫的一個詞對應的詞項；停用詞返回空字串"""
+        term = self.cache.get(token)
+        if term is None:
+            if token in self.stopwords:
+                term = ''
+            else:
+                term = self.stemmer(token) if self.stemmer is not None else token
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[token] = term
+        return term
+
+    @property
+    def fingerprint(self):
+        """設定的摘要，寫入索引段；以不同設定建立的索引段不會被沿用"""
+        settings = (self.token_pattern, self.lowercase, self.normalization, sorted(self.stopwords),
+                    _name_of(self.stemmer), self.cjk, _name_of(self.segmenter), self.unigrams)
+        return zlib.crc32(repr(settings).encode('utf-8'))
+
+
+def _name_of(function):
+    if function is None:
+        return None
+    return f'{getattr(function, "__module__", "")}.{getattr(function, "__qualname__", type(function).__qualname__)}'
+
+
+# 索引與查詢共用的分析器；要改變分詞方式時修改這裡的設定，舊的索引段會在下次啟動時重建
+analyzer = Analyzer(cjk=True)
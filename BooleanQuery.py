@@ -0,0 +1,341 @@
+import re
+import time
+from Analyzer import analyzer
+from PositionIndex import Spans, near_spans, phrase_spans, term_spans
+from RoaringBitmap import RoaringBitmap
+
+
+# ==================== 布林查詢 ==================== #
+#
+# 相鄰的兩個運算元之間沒有運算子時視為 AND。查詢先剖析成運算樹，再由規劃器改寫：
+#   - 攤平連續的 AND/OR，消去 NOT NOT；
+#   - AND 的子節點依估計的文檔數由少到多求交集，需要位置的片語與 NEAR 放在最後，
+#     只在已經縮小的候選文檔中比對位置；NOT 子節點改成 ANDNOT 從結果中扣除；
+#   - 求值時交集一旦為空，其餘子節點直接略過。
+# 萬用字元詞 (perf*、*base、te?t) 在規劃時以詞典展開成符合的詞，求值時與 OR 相同。
+# 估計值來自整個語料的文檔頻率，同一個計畫在每個段上分別求值，
+# 每個節點累計各段實際的文檔數與耗時，供 explain 輸出。
+
+_TOKEN = re.compile(r'"[^"]*"|\bNEAR/\d+\b|\b(?:AND|OR|NOT)\b|[\w*?]*[*?][\w*?]*|\w+|[()]', re.IGNORECASE)
+_PRECEDENCE = {'NEAR': 4, 'NOT': 3, 'AND': 2, 'OR': 1}
+_POSITIONAL = {'PHRASE', 'NEAR'}
+
+
+def tokenize(query):
+    # 運算子不分大小寫，統一轉成大寫；詞與片語保持原樣，交給分析器處理
+    tokens = []
+    for token in _TOKEN.findall(query):
+        upper = token.upper()
+        tokens.append(upper if upper in _PRECEDENCE or upper.startswith('NEAR/') else token)
+    return tokens
+
+
+def operator_of(token):
+    # NEAR/k 的 k 是參數，優先順序與 NEAR 相同
+    return 'NEAR' if token.startswith('NEAR/') else token
+
+
+def phrase_words(token):
+    return analyzer(token)
+
+
+def is_wildcard(token):
+    return not token.startswith('"') and ('*' in token or '?' in token)
+
+
+def is_operand(token):
+    return operator_of(token) not in _PRECEDENCE and token not in {'(', ')'}
+
+
+def with_implicit_and(tokens):
+    """相鄰的兩個運算元之間補上 AND：data python 等於 data AND python，a NOT b 等於 a AND NOT b"""
+    result = []
+    for token in tokens:
+        if result and (is_operand(result[-1]) or result[-1] == ')') and \
+                (is_operand(token) or token in {'(', 'NOT'}):
+            result.append('AND')
+        result.append(token)
+    return result
+
+
+def to_postfix(tokens):
+    output = []
+    stack = []
+
+    for token in tokens:
+        if is_operand(token):
+            output.append(token)
+        elif token == '(':
+            stack.append(token)
+        elif token == ')':
+            while stack and stack[-1] != '(':
+                output.append(stack.pop())
+            if not stack:
+                raise ValueError('右括號沒有對應的左括號')
+            stack.pop()  # remove '('
+        elif token == 'NOT':
+            # 一元運算子的左邊沒有運算元，不彈出任何運算子 (NOT NOT a 才能剖析)
+            stack.append(token)
+        else:
+            while stack and stack[-1] != '(' and \
+                    _PRECEDENCE.get(operator_of(stack[-1]), 0) >= _PRECEDENCE[operator_of(token)]:
+                output.append(stack.pop())
+            stack.append(token)
+
+    while stack:
+        if stack[-1] == '(':
+            raise ValueError('左括號沒有對應的右括號')
+        output.append(stack.pop())
+
+    return output
+
+
+# ==================== 運算樹 ==================== #
+
+class Node:
+    """運算樹的節點
+
+    op 是 TERM、PHRASE、WILDCARD、NEAR、NOT、AND 或 OR；value 是詞、片語的詞列表、
+    萬用字元樣式或 NEAR 的距離。WILDCARD 的子節點是規劃時展開的詞。
+    estimate 是規劃時估計的文檔數，actual、elapsed 與 skipped 在求值時累計。
+    """
+
+    def __init__(self, op, children=(), value=None):
+        self.op = op
+        self.children = list(children)
+        self.value = value
+        self.estimate = 0
+        self.actual = 0
+        self.elapsed = 0.0
+        self.skipped = 0    # 因交集已經為空而略過的段數
+
+
+class Complement:
+    """NOT 的結果：只記錄被排除的文檔，與其他運算元結合時改用 ANDNOT"""
+
+    def __init__(self, bitmap):
+        self.bitmap = bitmap
+
+
+def parse(tokens):
+    """把查詢的詞元剖析成運算樹"""
+    stack = []
+
+    def pop():
+        if not stack:
+            raise ValueError('運算子缺少運算元')
+        return stack.pop()
+
+    for token in to_postfix(with_implicit_and(tokens)):
+        if operator_of(token) not in _PRECEDENCE and is_wildcard(token):
+            stack.append(Node('WILDCARD', value=token.lower() if analyzer.lowercase else token))
+        elif operator_of(token) not in _PRECEDENCE:
+            # 詞與片語都經過分析器；一個詞被分成多個詞項時視為片語，全是停用詞時不符合任何文檔
+            words = phrase_words(token)
+            stack.append(Node('TERM', value=words[0]) if len(words) == 1 else Node('PHRASE', value=words))
+        elif token.startswith('NEAR/'):
+            right = pop()
+            left = pop()
+            if left.op not in {'TERM'} | _POSITIONAL or right.op not in {'TERM'} | _POSITIONAL:
+                raise ValueError('NEAR 的兩邊必須是詞、片語或另一個 NEAR')
+            stack.append(Node('NEAR', [left, right], int(token[5:])))
+        elif token == 'NOT':
+            stack.append(Node('NOT', [pop()]))
+        else:
+            right = pop()
+            left = pop()
+            stack.append(Node(token, [left, right]))
+    if len(stack) > 1:
+        raise ValueError('查詢中有多餘的運算元')
+    return stack[0] if stack else Node('OR')
+
+
+def plan(node, df, universe, expand=None):
+    """改寫運算樹並估計每個節點的文檔數
+
+    df 以詞取得文檔頻率，universe 是文檔總數；expand 把萬用字元樣式展開成詞列表，
+    None 時萬用字元不符合任何文檔。
+    """
+    if node.op == 'TERM':
+        node.estimate = df(node.value)
+    elif node.op == 'PHRASE':
+        node.estimate = min((df(word) for word in node.value), default=0)
+    elif node.op == 'WILDCARD':
+        words = expand(node.value) if expand is not None else []
+        node.children = sorted((plan(Node('TERM', value=word), df, universe) for word in words),
+                               key=lambda child: child.estimate)
+        node.estimate = min(universe, sum(child.estimate for child in node.children))
+    elif node.op == 'NEAR':
+        node.children = [plan(child, df, universe, expand) for child in node.children]
+        node.estimate = min(child.estimate for child in node.children)
+    elif node.op == 'NOT':
+        child = node.children[0]
+        if child.op == 'NOT':
+            return plan(child.children[0], df, universe, expand)
+        node.children = [plan(child, df, universe, expand)]
+        node.estimate = max(universe - node.children[0].estimate, 0)
+    else:
+        children = []
+        for child in node.children:
+            child = plan(child, df, universe, expand)
+            children.extend(child.children if child.op == node.op else [child])
+        if node.op == 'AND':
+            positives = [child for child in children if child.op != 'NOT']
+            negatives = [child for child in children if child.op == 'NOT']
+            positives.sort(key=lambda child: (child.op in _POSITIONAL, child.estimate))
+            negatives.sort(key=lambda child: -child.children[0].estimate)
+            node.children = positives + negatives
+            node.estimate = min(child.estimate for child in positives) if positives else \
+                max(universe - sum(child.children[0].estimate for child in negatives), 0)
+        else:
+            node.children = sorted(children, key=lambda child: child.estimate)
+            node.estimate = min(universe, sum(child.estimate for child in children))
+    return node
+
+
+# ==================== 求值 ==================== #
+
+def _conjunction(left, right):
+    if isinstance(left, Complement) and isinstance(right, Complement):
+        return Complement(left.bitmap | right.bitmap)
+    if isinstance(left, Complement):
+        left, right = right, left
+    if isinstance(right, Complement):
+        return left - right.bitmap
+    return left & right
+
+
+def _disjunction(left, right):
+    if isinstance(left, Complement) and isinstance(right, Complement):
+        return Complement(left.bitmap & right.bitmap)
+    if isinstance(left, Complement):
+        left, right = right, left
+    if isinstance(right, Complement):
+        return Complement(right.bitmap - left)
+    return left | right
+
+
+def _candidates(node, index, segment, within):
+    """可能符合位置條件的文檔：各個詞的文檔集合的交集"""
+    if node.op == 'TERM':
+        bitmap = index.bitmap_of(segment, node.value)
+    elif node.op == 'PHRASE':
+        if not node.value:
+            return RoaringBitmap()
+        bitmap = index.bitmap_of(segment, node.value[0])
+        for word in node.value[1:]:
+            bitmap = bitmap & index.bitmap_of(segment, word)
+    else:
+        bitmap = _candidates(node.children[0], index, segment, within) & \
+            _candidates(node.children[1], index, segment, within)
+    return bitmap & within if within is not None else bitmap
+
+
+def _spans(node, index, segment, candidates):
+    """在候選文檔 (遞增的文檔ID陣列) 中找出位置運算元的區間，返回 Spans
+
+    詞的每個出現位置本身就是一個區間，不計入實際的文檔數。
+    """
+    started = time.perf_counter()
+    if node.op == 'TERM':
+        spans = term_spans(index.positions_of(segment), node.value, candidates)
+        node.elapsed += time.perf_counter() - started
+        return spans
+    if node.op == 'PHRASE':
+        spans = phrase_spans(index.positions_of(segment), node.value, candidates)
+    else:
+        left = _spans(node.children[0], index, segment, candidates)
+        right = _spans(node.children[1], index, segment, candidates)
+        spans = near_spans(left, right, node.value)
+    node.elapsed += time.perf_counter() - started
+    node.actual += spans.doc_ids().size
+    return spans
+
+
+def evaluate(node, index, segment, within=None):
+    """在一個段上求值，返回 RoaringBitmap 或 Complement
+
+    within 是上層 AND 目前的交集，結果只需要在其中正確，片語與 NEAR 只比對其中的文檔。
+    """
+    started = time.perf_counter()
+    if node.op == 'TERM':
+        result = index.bitmap_of(segment, node.value)
+    elif node.op in _POSITIONAL:
+        candidates = _candidates(node, index, segment, within).to_array()
+        spans = Spans()
+        if candidates.size and node.op == 'PHRASE':
+            spans = phrase_spans(index.positions_of(segment), node.value, candidates)
+        elif candidates.size:
+            left = _spans(node.children[0], index, segment, candidates)
+            right = _spans(node.children[1], index, segment, candidates)
+            spans = near_spans(left, right, node.value)
+        result = RoaringBitmap.from_sorted(spans.doc_ids())
+    elif node.op == 'NOT':
+        operand = evaluate(node.children[0], index, segment, within)
+        result = operand.bitmap if isinstance(operand, Complement) else Complement(operand)
+    elif node.op == 'AND':
+        result = None
+        for i, child in enumerate(node.children):
+            if isinstance(result, RoaringBitmap) and not result:
+                # 交集已經為空，其餘子節點不必求值
+                for skipped in node.children[i:]:
+                    skipped.skipped += 1
+                break
+            operand = evaluate(child, index, segment, result if isinstance(result, RoaringBitmap) else within)
+            result = operand if result is None else _conjunction(result, operand)
+    else:
+        # OR 與展開後的萬用字元
+        result = RoaringBitmap()
+        for child in node.children:
+            result = _disjunction(result, evaluate(child, index, segment, within))
+    node.elapsed += time.perf_counter() - started
+    node.actual += segment.doc_ids.size - len(result.bitmap) if isinstance(result, Complement) else len(result)
+    return result
+
+
+def matching_doc_ids(root, index, segment):
+    """在一個段上求值，返回符合查詢且未被刪除的文檔ID陣列"""
+    matched = evaluate(root, index, segment)
+    if isinstance(matched, Complement):
+        # 整個查詢都是否定時才需要段內的所有文檔
+        matched = RoaringBitmap.from_sorted(segment.doc_ids) - matched.bitmap
+    deleted = segment.deleted_doc_ids()
+    if deleted is not None:
+        matched = matched - RoaringBitmap.from_sorted(deleted)
+    return matched.to_array()
+
+
+def positive_words(node):
+    """不在 NOT 之下的詞 (含片語與 NEAR 中的詞)，用於計算相似度"""
+    if node.op == 'NOT':
+        return []
+    if node.op == 'TERM':
+        return [node.value]
+    if node.op == 'PHRASE':
+        return list(node.value)
+    return [word for child in node.children for word in positive_words(child)]
+
+
+def explain(node, parent=None):
+    """把已求值的運算樹轉成巢狀的 dict：估計與實際的文檔數、耗時與略過的段數"""
+    operator = 'ANDNOT' if node.op == 'NOT' and parent == 'AND' else node.op
+    children = node.children[0].children if operator == 'ANDNOT' and node.children[0].op == 'OR' else \
+        [node.children[0]] if operator == 'ANDNOT' else node.children
+    result = {"operator": operator}
+    if node.op == 'TERM':
+        result["term"] = node.value
+    elif node.op == 'PHRASE':
+        result["phrase"] = ' '.join(node.value)
+    elif node.op == 'WILDCARD':
+        result["pattern"] = node.value
+    elif node.op == 'NEAR':
+        result["distance"] = node.value
+    result.update({
+        "estimate": node.estimate,
+        "actual": node.actual,
+        "time_ms": round(node.elapsed * 1000, 3),
+        "skipped_segments": node.skipped,
+    })
+    if children:
+        result["children"] = [explain(child, node.op) for child in children]
+    return result
@@ -0,0 +1,202 @@
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，日誌只能由單一行程寫入
+    fcntl = None
+
+
+# ==================== 追加式文檔日誌 ==================== #
+#
+# 文檔的每次新增或刪除都只在日誌尾端追加一筆記錄，寫入成本只和文檔大小有關。
+#
+# 檔案格式 (little-endian)：
+#   MAGIC | 世代編號 (uint64) | 記錄 | 記錄 | ...
+# 每筆記錄：
+#   CRC32 (uint32) | 內容長度 (uint32) | 操作 (uint8) | 文檔ID (int64) | UTF-8 內容
+# CRC32 涵蓋操作、文檔ID與內容。重放時遇到長度不足或校驗失敗的記錄，
+# 代表上次寫到一半就當機，該記錄與其後的資料都會被截斷。
+#
+# 壓縮時只把仍存在的文檔寫成新的日誌並遞增世代編號，
+# 索引段會記錄自己涵蓋到哪一個世代的哪個位置。
+#
+# 多個行程 (例如多個 API worker) 可以共用同一個日誌：追加、commit 與壓縮都在
+# locked() 之內進行，它以 path + '.lock' 上的 flock 在行程之間互斥。取得鎖之後
+# 先以 replaced() / changed() 檢查其他行程是否壓縮了日誌或追加了記錄，追上之後
+# 才寫入；新文檔ID接續日誌中出現過的最大ID (next_doc_id)，不同行程不會分配到
+# 同一個ID。沒有 fcntl 的平台只能由單一行程寫入。
+
+LOG_MAGIC = b'PYSEEKL1'
+_LOG_HEADER = struct.Struct('<Q')
+_RECORD = struct.Struct('<IIBq')
+_BODY = struct.Struct('<Bq')
+
+OP_PUT = 1
+OP_DELETE = 2
+
+
+def _fsync_directory(path):
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def _record(op, doc_id, content=''):
+    payload = content.encode('utf-8')
+    crc = zlib.crc32(payload, zlib.crc32(_BODY.pack(op, doc_id)))
+    return _RECORD.pack(crc, len(payload), op, doc_id) + payload
+
+
+class DocumentLog:
+    """追加式、帶校驗碼的文檔日誌
+
+    開啟後必須先完整重放一次 (replay)，確認有效的結尾之後才能追加記錄。
+    put/delete 只寫入緩衝區，離開 locked() 時交給作業系統，commit 時才 fsync。
+    日誌不存在時以 initial() 返回的文檔建立第一個世代。
+    """
+
+    def __init__(self, path, initial=None):
+        self.path = path
+        self.file = None
+        self.next_doc_id = 0
+        self.lock_file = open(f'{path}.lock', 'ab')
+        self.thread_lock = threading.RLock()
+        self.lock_depth = 0
+        with self.locked():
+            self.is_new = not os.path.exists(path)
+            if self.is_new:
+                self._write_snapshot(path, 1, initial() if initial is not None else {})
+            self._read_header()
+
+    def _read_header(self):
+        with open(self.path, 'rb') as f:
+            header = f.read(len(LOG_MAGIC) + _LOG_HEADER.size)
+            stat = os.fstat(f.fileno())
+        if header[:len(LOG_MAGIC)] != LOG_MAGIC:
+            raise ValueError(f'{self.path} is not a document log')
+        self.generation = _LOG_HEADER.unpack_from(header, len(LOG_MAGIC))[0]
+        self.inode = stat.st_ino
+        self.size = stat.st_size
+        self.records_since_snapshot = 0
+
+    @contextmanager
+    def locked(self):
+        """在行程之間互斥地使用日誌，可重入；離開最外層時把緩衝的記錄寫給作業系統"""
+        with self.thread_lock:
+            if not self.lock_depth and fcntl is not None:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+            self.lock_depth += 1
+            try:
+                yield
+            finally:
+                self.lock_depth -= 1
+                if not self.lock_depth:
+                    try:
+                        if self.file is not None:
+                            self.file.flush()
+                    finally:
+                        if fcntl is not None:
+                            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+
+    def replaced(self):
+        """日誌是否已被其他行程壓縮 (換成另一個檔案)"""
+        return os.stat(self.path).st_ino != self.inode
+
+    def changed(self):
+        """其他行程是否追加了記錄或壓縮了日誌；不需要持有鎖，只用來判斷要不要追上"""
+        stat = os.stat(self.path)
+        return stat.st_ino != self.inode or stat.st_size != self.size
+
+    def reopen(self):
+        """改為開啟目前路徑上的日誌 (被替換後的新世代)，之後同樣要先完整重放"""
+        self.close()
+        self._read_header()
+
+    @property
+    def start(self):
+        """第一筆記錄的位置"""
+        return len(LOG_MAGIC) + _LOG_HEADER.size
+
+    def replay(self, offset=None):
+        """從 offset (預設為開頭) 依序讀出 (操作, 文檔ID, 內容)，並截斷損壞的尾端"""
+        position = self.start if offset is None else offset
+        with open(self.path, 'rb') as f:
+            f.seek(position)
+            data = f.read()
+        end = 0
+        while end + _RECORD.size <= len(data):
+            crc, length, op, doc_id = _RECORD.unpack_from(data, end)
+            payload = data[end + _RECORD.size:end + _RECORD.size + length]
+            if len(payload) < length or zlib.crc32(payload, zlib.crc32(_BODY.pack(op, doc_id))) != crc:
+                break
+            end += _RECORD.size + length
+            self.records_since_snapshot += 1
+            self.next_doc_id = max(self.next_doc_id, doc_id + 1)
+            yield op, doc_id, payload.decode('utf-8')
+
+        self.size = position + end
+        if self.size < os.path.getsize(self.path):
+            print(f"Warning: truncating {os.path.getsize(self.path) - self.size} bytes of incomplete log records")
+            os.truncate(self.path, self.size)
+        self.close()
+        self.file = open(self.path, 'ab')
+
+    def allocate_ids(self, count):
+        """分配 count 個連續的新文檔ID；呼叫者持有 locked() 並已追上其他行程的記錄"""
+        start = self.next_doc_id
+        self.next_doc_id += count
+        return list(range(start, start + count))
+
+    def put(self, doc_id, content):
+        self.next_doc_id = max(self.next_doc_id, doc_id + 1)
+        self._append(_record(OP_PUT, doc_id, content))
+
+    def delete(self, doc_id):
+        self._append(_record(OP_DELETE, doc_id))
+
+    def _append(self, record):
+        if self.file is None:
+            raise RuntimeError('replay the document log before appending to it')
+        self.file.write(record)
+        self.size += len(record)
+        self.records_since_snapshot += 1
+
+    def commit(self):
+        """把尚未寫入的記錄寫到磁碟並 fsync，返回後這些變更不會因當機而遺失"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def needs_compaction(self, live_count, min_records=1000, ratio=0.25):
+        """上次快照之後追加的記錄超過存活文檔數的一定比例時應該壓縮"""
+        return self.records_since_snapshot >= max(min_records, live_count * ratio)
+
+    def compact(self, documents_dict):
+        """以目前存活的文檔寫出新世代的日誌，原子替換舊日誌"""
+        self.close()
+        self._write_snapshot(self.path, self.generation + 1, documents_dict)
+        self._read_header()
+        self.file = open(self.path, 'ab')
+
+    @staticmethod
+    def _write_snapshot(path, generation, documents_dict):
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(LOG_MAGIC + _LOG_HEADER.pack(generation))
+            for doc_id, content in documents_dict.items():
+                f.write(_record(OP_PUT, doc_id, content))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+        _fsync_directory(path)
+
+    def close(self):
+        """關閉追加用的檔案；跨行程的鎖檔案保持開啟"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
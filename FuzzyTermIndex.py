@@ -0,0 +1,56 @@
+import numpy as np
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+
+
+# ==================== 模糊詞索引 ==================== #
+#
+# 詞典中每個詞前後加上 '\0' 後拆成相鄰兩字元的組合 (bigram)，記錄每個 bigram 出現在
+# 哪些詞中。一次編輯最多破壞查詢詞的兩個 bigram，所以編輯距離不超過 k 的詞至少包含
+# 查詢詞 (不重複的) bigram 數減去 2k 個；先以倒排列表計數篩出候選，再以 RapidFuzz
+# 計算真正的編輯距離，不必對整個詞典逐一比對。查詢詞太短、篩選條件不足以排除任何詞時，
+# 只以長度差不超過 k 篩選。
+
+_PAD = '\0'
+
+
+def _bigrams(word):
+    padded = f'{_PAD}{word}{_PAD}'
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def auto_distance(word):
+    """依詞長決定容許的編輯距離：2 個字以內不容錯，3 到 5 個字 1，更長 2"""
+    return 0 if len(word) <= 2 else 1 if len(word) <= 5 else 2
+
+
+class FuzzyTermIndex:
+    """詞典的 bigram 索引，找出與查詢詞編輯距離不超過 k 的詞"""
+
+    def __init__(self, words):
+        self.words = list(words)
+        self.lengths = np.array([len(word) for word in self.words], dtype=np.int64)
+        postings = {}
+        for term, word in enumerate(self.words):
+            for gram in _bigrams(word):
+                postings.setdefault(gram, []).append(term)
+        self.postings = {gram: np.array(terms, dtype=np.int64) for gram, terms in postings.items()}
+
+    def candidates(self, word, distance):
+        """可能在編輯距離內的詞編號陣列"""
+        close = np.abs(self.lengths - len(word)) <= distance
+        grams = _bigrams(word)
+        threshold = len(grams) - 2 * distance
+        if threshold <= 0:
+            return np.flatnonzero(close)
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not lists:
+            return np.zeros(0, dtype=np.int64)
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.words))
+        return np.flatnonzero((shared >= threshold) & close)
+
+    def search(self, word, distance):
+        """編輯距離不超過 distance 的詞，返回 [(詞, 距離)]"""
+        choices = [self.words[term] for term in self.candidates(word, distance).tolist()]
+        matches = process.extract(word, choices, scorer=Levenshtein.distance, score_cutoff=distance, limit=None)
+        return [(choice, score) for choice, score, _ in matches]
@@ -0,0 +1,265 @@
+import mmap
+import os
+import struct
+import numpy as np
+from collections.abc import Mapping, MutableMapping
+from Analyzer import analyzer
+from PositionIndex import PositionIndex
+from PostingList import PostingDictionary, SKIP_COLUMNS, SKIP_DTYPE
+
+
+# ==================== 磁碟索引段 ==================== #
+#
+# 索引段是單一檔案，以 mmap 唯讀開啟後所有 NumPy 陣列都直接指向映射的頁面，
+# 同一台機器上的多個 worker 共用作業系統的頁面快取，不會各自複製一份索引。
+#
+# 檔案格式 (little-endian)：
+#   MAGIC | 標頭 (_HEADER) | 區段表 (每個區段的位移與長度) | 各區段資料 (8 位元組對齊)
+#
+# 區段依序為：詞典 (排序後詞的 UTF-8 與位移)、每個詞的塊與資料起點、跳表、
+# 壓縮倒排資料、文檔長度 (BM25 的長度正規化)、保存的文檔內容、位置索引
+# (自己的詞典與 PositionIndex 的陣列；沒有寫入位置索引時這些區段為空)。
+
+MAGIC = b'PYSEEKS3'
+_HEADER = struct.Struct('<7q')  # 日誌世代、日誌位置、文檔數、總詞數、詞數、塊數、分析器設定摘要
+_SECTIONS = (
+    ('term_offsets', np.int64),
+    ('term_blob', np.uint8),
+    ('term_blocks', np.int64),
+    ('term_bytes', np.int64),
+    ('skips', SKIP_DTYPE),
+    ('postings', np.uint8),
+    ('doc_lengths', np.int32),
+    ('stored_ids', np.int64),
+    ('stored_offsets', np.int64),
+    ('stored_blob', np.uint8),
+    ('position_term_offsets', np.int64),
+    ('position_term_blob', np.uint8),
+    ('position_term_starts', np.int64),
+    ('position_docs', np.int64),
+    ('position_group_starts', np.int64),
+    ('positions', np.int32),
+)
+_SECTION_TABLE = struct.Struct('<%dq' % (2 * len(_SECTIONS)))
+
+
+def _utf8_blob(strings):
+    """把字串串接成一塊 UTF-8 資料，返回 (位移陣列, 位元組陣列)"""
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+def write_segment(path, inverted_index, documents_dict, log_position, positions=None):
+    """把倒排索引、文檔內容與位置索引寫成索引段，先寫暫存檔再原子替換
+
+    log_position 是 (日誌世代, 位元組位置)，表示索引段涵蓋了文檔日誌到該位置為止的記錄。
+    positions 為 None 時不寫入位置索引，開啟後第一次片語查詢才由文檔內容建立。
+    """
+    postings = inverted_index.postings
+    if postings.updated or postings.shadowed:
+        # 建立後又被修改過的索引，先重新整理成一塊共用資料
+        words = sorted(postings)
+        term_ids, doc_ids, tfs = [], [], []
+        for term, word in enumerate(words):
+            ids, counts = postings[word].decode()
+            term_ids.append(np.full(ids.size, term))
+            doc_ids.append(ids)
+            tfs.append(counts)
+        if words:
+            postings = PostingDictionary.build(words, np.concatenate(term_ids), np.concatenate(doc_ids),
+                                               np.concatenate(tfs))
+        else:
+            postings = PostingDictionary()
+    words = sorted(postings.terms, key=postings.terms.get)
+    term_offsets, term_blob = _utf8_blob(words)
+
+    stored_ids = np.array(sorted(documents_dict), dtype=np.int64)
+    stored_offsets, stored_blob = _utf8_blob(documents_dict[doc_id] for doc_id in stored_ids.tolist())
+
+    empty_index = np.zeros(1, dtype=np.int64)
+    empty = np.zeros(0, dtype=np.int64)
+    if positions is not None:
+        position_term_offsets, position_term_blob = _utf8_blob(positions.words())
+    else:
+        position_term_offsets, position_term_blob = empty, empty
+    arrays = {
+        'term_offsets': term_offsets,
+        'term_blob': term_blob,
+        'term_blocks': postings.term_blocks if postings.term_blocks is not None else empty_index,
+        'term_bytes': postings.term_bytes if postings.term_bytes is not None else empty_index,
+        'skips': postings.skips,
+        'postings': postings.data,
+        'doc_lengths': inverted_index.doc_lengths,
+        'stored_ids': stored_ids,
+        'stored_offsets': stored_offsets,
+        'stored_blob': stored_blob,
+        'position_term_offsets': position_term_offsets,
+        'position_term_blob': position_term_blob,
+        'position_term_starts': positions.term_starts if positions is not None else empty,
+        'position_docs': positions.group_docs if positions is not None else empty,
+        'position_group_starts': positions.group_starts if positions is not None else empty,
+        'positions': positions.positions if positions is not None else empty,
+    }
+
+    header = _HEADER.pack(log_position[0], log_position[1], inverted_index.doc_count,
+                          inverted_index.total_length, len(words), len(postings.skips), analyzer.fingerprint)
+    position = len(MAGIC) + _HEADER.size + _SECTION_TABLE.size
+    table = []
+    for name, dtype in _SECTIONS:
+        position += -position % 8
+        size = arrays[name].astype(dtype, copy=False).nbytes
+        table.extend((position, size))
+        position += size
+
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC + header + _SECTION_TABLE.pack(*table))
+        for (name, dtype), offset in zip(_SECTIONS, table[::2]):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+class IndexSegment:
+    """以 mmap 唯讀開啟的索引段"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not an index segment')
+        (self.log_generation, self.log_offset, self.doc_count, self.total_length,
+         term_count, block_count, self.analyzer_fingerprint) = _HEADER.unpack_from(self.buffer, len(MAGIC))
+        table = _SECTION_TABLE.unpack_from(self.buffer, len(MAGIC) + _HEADER.size)
+        for (name, dtype), offset, size in zip(_SECTIONS, table[::2], table[1::2]):
+            count = size // np.dtype(dtype).itemsize
+            setattr(self, name, np.frombuffer(self.buffer, dtype=dtype, count=count, offset=offset))
+        self.skips = self.skips.reshape(block_count, SKIP_COLUMNS)
+        self.terms = SegmentTerms(self.term_offsets, self.term_blob)
+
+    def posting_dictionary(self):
+        """返回直接指向映射資料的 PostingDictionary"""
+        return PostingDictionary(self.postings, self.skips, self.terms, self.term_blocks, self.term_bytes)
+
+    def position_index(self):
+        """返回直接指向映射資料的 PositionIndex；索引段沒有位置索引時返回 None"""
+        if not self.position_term_starts.size:
+            return None
+        return PositionIndex(SegmentTerms(self.position_term_offsets, self.position_term_blob),
+                             self.position_term_starts, self.position_docs, self.position_group_starts,
+                             self.positions)
+
+    def stored_document(self, doc_id):
+        i = int(np.searchsorted(self.stored_ids, doc_id))
+        if i == len(self.stored_ids) or self.stored_ids[i] != doc_id:
+            raise KeyError(doc_id)
+        return self.stored_blob[self.stored_offsets[i]:self.stored_offsets[i + 1]].tobytes().decode('utf-8')
+
+
+def open_segment(path, log_generation, log_size):
+    """開啟涵蓋目前文檔日誌前段的索引段；不存在、格式不符、屬於其他世代或以不同的分析器建立時返回 None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        segment = IndexSegment(path)
+    except (OSError, ValueError, struct.error):
+        return None
+    if segment.log_generation != log_generation or segment.log_offset > log_size or \
+            segment.analyzer_fingerprint != analyzer.fingerprint:
+        return None
+    return segment
+
+
+class SegmentTerms(Mapping):
+    """映射在索引段中的排序詞典：詞 -> 詞編號，以二分搜尋查詞，不需建立 dict"""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def _term(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def __getitem__(self, word):
+        # UTF-8 位元組順序與字元順序一致，可以直接比較位元組
+        key = word.encode('utf-8')
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self._term(low) == key:
+            return low
+        raise KeyError(word)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._term(i).decode('utf-8')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+# ==================== 索引段中的文檔內容 ==================== #
+
+class StoredDocuments(MutableMapping):
+    """以索引段保存的文檔內容為底、可增刪的文檔集合
+
+    未修改的文檔直接從映射的頁面解碼，新增的文檔放在記憶體中，
+    刪除只記錄文檔ID，索引段本身不會被改寫。沒有索引段 (segment 為 None) 時
+    所有文檔都在記憶體中。
+    """
+
+    def __init__(self, segment=None, documents_dict=None):
+        self.reset(segment, documents_dict)
+
+    def reset(self, segment=None, documents_dict=None):
+        """改以另一個索引段為底並捨棄之前的增刪，documents_dict 是索引段之外的文檔"""
+        self.segment = segment
+        self.stored_ids = segment.stored_ids if segment is not None else np.zeros(0, dtype=np.int64)
+        self.added = dict(documents_dict or {})
+        self.deleted = set()
+
+    def _stored(self, doc_id):
+        i = int(np.searchsorted(self.stored_ids, doc_id))
+        return i < len(self.stored_ids) and self.stored_ids[i] == doc_id
+
+    def __getitem__(self, doc_id):
+        if doc_id in self.added:
+            return self.added[doc_id]
+        segment = self.segment
+        if doc_id in self.deleted or segment is None:
+            raise KeyError(doc_id)
+        return segment.stored_document(doc_id)
+
+    def __setitem__(self, doc_id, content):
+        if self._stored(doc_id):
+            self.deleted.add(doc_id)
+        self.added[doc_id] = content
+
+    def __delitem__(self, doc_id):
+        if self.added.pop(doc_id, None) is not None:
+            return
+        if doc_id in self.deleted or not self._stored(doc_id):
+            raise KeyError(doc_id)
+        self.deleted.add(doc_id)
+
+    def __contains__(self, doc_id):
+        if doc_id in self.added:
+            return True
+        return isinstance(doc_id, int) and doc_id not in self.deleted and self._stored(doc_id)
+
+    def __iter__(self):
+        for doc_id in self.stored_ids.tolist():
+            if doc_id not in self.deleted:
+                yield doc_id
+        yield from self.added
+
+    def __len__(self):
+        return len(self.stored_ids) - len(self.deleted) + len(self.added)
@@ -0,0 +1,355 @@
+import math
+import numpy as np
+from collections import Counter
+from Analyzer import analyzer
+from PostingList import PostingDictionary, SKIP_LAST, SKIP_MAX_TF
+
+# 查詢詞的塊總數不超過這個數時直接整條解碼，區間上界的計算成本高於能略過的塊
+TOP_K_MIN_BLOCKS = 32
+
+
+# ==================== 常駐倒排索引 ==================== #
+
+class InvertedIndex:
+    """啟動時建立一次、隨文檔增刪原地更新的倒排索引
+
+    每個詞對應一條壓縮的 PostingList，倒排項保存文檔ID與詞頻；
+    文檔長度另存為以文檔ID為索引的陣列，使 BM25 評分完全不需要再讀取文檔內容。
+    寫入的方法都可以傳入呼叫者已經分好的詞 (tokens 是 文檔ID -> 詞列表)，同一篇文檔不必重複分詞。
+    """
+
+    def __init__(self, documents_dict=None, tokens=None):
+        self.postings = PostingDictionary()  # 詞 -> PostingList
+        self.doc_lengths = np.zeros(0, dtype=np.int32)  # 文檔ID -> 詞數，已刪除為0
+        self.doc_count = 0
+        self.total_length = 0
+        if documents_dict:
+            self._build(documents_dict, tokens)
+
+    @classmethod
+    def from_segment(cls, segment):
+        """由以 mmap 開啟的索引段建立索引，倒排資料與文檔長度都直接指向映射的頁面"""
+        index = cls()
+        index.postings = segment.posting_dictionary()
+        index.doc_lengths = segment.doc_lengths
+        index.doc_count = segment.doc_count
+        index.total_length = segment.total_length
+        return index
+
+    @classmethod
+    def merged(cls, indexes, deleted_ids=()):
+        """把多個文檔互不重疊的索引合併成一個，同時丟棄 deleted_ids 中的文檔
+
+        deleted_ids 必須是這些索引中確實存在的文檔。
+        """
+        deleted = np.asarray(sorted(deleted_ids), dtype=np.int64)
+        vocabulary = {}
+        term_ids, doc_ids, tfs = [], [], []
+        for index in indexes:
+            words, terms, ids, counts = index.postings.decode_all()
+            if deleted.size:
+                keep = ~np.isin(ids, deleted)
+                terms, ids, counts = terms[keep], ids[keep], counts[keep]
+            mapping = np.array([vocabulary.setdefault(word, len(vocabulary)) for word in words], dtype=np.int64)
+            if ids.size:
+                term_ids.append(mapping[terms])
+                doc_ids.append(ids)
+                tfs.append(counts)
+
+        merged = cls()
+        if doc_ids:
+            # 只保留還有倒排項的詞，詞編號按詞排序
+            term_ids = np.concatenate(term_ids)
+            names = list(vocabulary)
+            words = sorted(names[term] for term in np.unique(term_ids).tolist())
+            ranks = np.empty(len(names), dtype=np.int64)
+            ranks[[vocabulary[word] for word in words]] = np.arange(len(words))
+            merged.postings = PostingDictionary.build(words, ranks[term_ids], np.concatenate(doc_ids),
+                                                      np.concatenate(tfs))
+        for index in indexes:
+            lengths = index.doc_lengths.copy()
+            lengths[deleted[deleted < lengths.size]] = 0
+            live = np.flatnonzero(lengths)
+            if live.size:
+                merged._reserve(int(live[-1]))
+                merged.doc_lengths[live] = lengths[live]
+            merged.doc_count += index.doc_count
+            merged.total_length += int(lengths.sum())
+        merged.doc_count -= deleted.size
+        return merged
+
+    @staticmethod
+    def tokenize(doc_text):
+        return analyzer(doc_text)
+
+    @property
+    def average_length(self):
+        return self.total_length / self.doc_count if self.doc_count else 0
+
+    def _build(self, documents_dict, tokens=None):
+        """批量建立索引：先收集所有倒排項，再一次編碼所有詞的倒排列表"""
+        vocabulary = {}
+        term_ids, doc_ids, tfs = [], [], []
+        lengths = {}
+        for doc_id, doc_text in documents_dict.items():
+            words = tokens[doc_id] if tokens is not None else self.tokenize(doc_text)
+            for word, tf in Counter(words).items():
+                term_ids.append(vocabulary.setdefault(word, len(vocabulary)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+            lengths[doc_id] = len(words)
+        # 詞編號按詞排序，索引段可以直接寫出共用資料並以二分搜尋查詞
+        words = sorted(vocabulary)
+        ranks = np.empty(len(words), dtype=np.int64)
+        ranks[[vocabulary[word] for word in words]] = np.arange(len(words))
+        self.postings = PostingDictionary.build(words, ranks[term_ids], doc_ids, tfs)
+        if lengths:
+            self._reserve(max(lengths))
+            self.doc_lengths[list(lengths)] = list(lengths.values())
+        self.doc_count += len(lengths)
+        self.total_length += sum(lengths.values())
+
+    def _reserve(self, doc_id):
+        """確保文檔長度陣列可以寫入 doc_id；映射自索引段的唯讀陣列會先複製"""
+        if doc_id >= len(self.doc_lengths):
+            grown = np.zeros(max(doc_id + 1, 2 * len(self.doc_lengths)), dtype=np.int32)
+            grown[:len(self.doc_lengths)] = self.doc_lengths
+            self.doc_lengths = grown
+        elif not self.doc_lengths.flags.writeable:
+            self.doc_lengths = self.doc_lengths.copy()
+
+    def add_document(self, doc_id, doc_text, words=None):
+        """把一篇文檔加入索引"""
+        if words is None:
+            words = self.tokenize(doc_text)
+        for word, tf in Counter(words).items():
+            self.postings.for_update(word).add(doc_id, tf)
+        self._reserve(doc_id)
+        self.doc_lengths[doc_id] = len(words)
+        self.doc_count += 1
+        self.total_length += len(words)
+
+    def add_documents(self, documents_dict, tokens=None):
+        """批量加入多篇文檔：先收集所有倒排項並依詞分組，每個詞的倒排列表只更新一次"""
+        vocabulary = {}
+        term_ids, doc_ids, tfs = [], [], []
+        lengths = {}
+        for doc_id in sorted(documents_dict):
+            words = tokens[doc_id] if tokens is not None else self.tokenize(documents_dict[doc_id])
+            counts = Counter(words)
+            term_ids.extend(vocabulary.setdefault(word, len(vocabulary)) for word in counts)
+            doc_ids.extend([doc_id] * len(counts))
+            tfs.extend(counts.values())
+            lengths[doc_id] = len(words)
+        if not lengths:
+            return
+
+        # 文檔依序收集，穩定排序詞編號後每個詞內的文檔ID已經遞增
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind='stable')
+        term_ids = term_ids[order]
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)[order].tolist()
+        tfs = np.asarray(tfs, dtype=np.int64)[order].tolist()
+        bounds = np.searchsorted(term_ids, np.arange(len(vocabulary) + 1)).tolist()
+        for word, term in vocabulary.items():
+            start, end = bounds[term], bounds[term + 1]
+            self.postings.for_update(word).extend(doc_ids[start:end], tfs[start:end])
+
+        self._reserve(max(lengths))
+        self.doc_lengths[list(lengths)] = list(lengths.values())
+        self.doc_count += len(lengths)
+        self.total_length += sum(lengths.values())
+
+    def remove_document(self, doc_id, doc_text, words=None):
+        """從索引移除一篇文檔，只需更新該文檔出現過的詞"""
+        if words is None:
+            words = self.tokenize(doc_text)
+        for word in set(words):
+            if word not in self.postings:
+                continue
+            postings = self.postings.for_update(word)
+            postings.remove(doc_id)
+            if not len(postings):
+                del self.postings[word]
+        if doc_id < len(self.doc_lengths):
+            self._reserve(doc_id)
+            self.total_length -= int(self.doc_lengths[doc_id])
+            self.doc_lengths[doc_id] = 0
+        self.doc_count -= 1
+
+    def copy(self):
+        """可以獨立修改的副本，之後任一方的增刪都不影響另一方
+
+        倒排列表在第一次修改時才複製；文檔長度陣列改為唯讀後共用，由 _reserve() 在第一次寫入時複製。
+        """
+        index = InvertedIndex()
+        index.postings = self.postings.copy()
+        self.doc_lengths.flags.writeable = False
+        index.doc_lengths = self.doc_lengths
+        index.doc_count = self.doc_count
+        index.total_length = self.total_length
+        return index
+
+    def nbytes(self):
+        """倒排列表與文檔長度實際佔用的陣列位元組數"""
+        return self.postings.nbytes + self.doc_lengths.nbytes
+
+    # ==================== BM25 評分 ==================== #
+
+    def idf(self, word):
+        df = len(self.postings[word]) if word in self.postings else 0
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def _impacts(self, doc_ids, tfs, weight, k1, b, average_length):
+        """一次算出一組倒排項的 BM25 貢獻"""
+        norms = k1 * (1 - b + b * self.doc_lengths[doc_ids] / average_length)
+        return weight * tfs * (k1 + 1) / (tfs + norms)
+
+    def bm25_scores(self, words, k1=1.2, b=0.75, collection=None, exclude=None):
+        """以 BM25 計算包含任一查詢詞的文檔分數，返回 {文檔ID: 分數}
+
+        collection 提供 idf() 與 average_length 的語料統計，預設為本索引；
+        分段索引以整個語料的統計量在各段上評分。exclude 是要略過的文檔ID陣列。
+        """
+        if collection is None:
+            collection = self
+        doc_ids, impacts = [], []
+        for word, query_tf in Counter(words).items():
+            if word in self.postings:
+                ids, tfs = self.postings[word].decode()
+                doc_ids.append(ids)
+                impacts.append(self._impacts(ids, tfs, collection.idf(word) * query_tf, k1, b,
+                                             collection.average_length))
+        if not doc_ids:
+            return {}
+        totals = np.bincount(np.concatenate(doc_ids), weights=np.concatenate(impacts))
+        if exclude is not None:
+            totals[exclude[exclude < totals.size]] = 0
+        hits = np.flatnonzero(totals)
+        return dict(zip(hits.tolist(), totals[hits].tolist()))
+
+    # ==================== Block-Max Top-k 檢索 ==================== #
+
+    def bm25_top_k(self, words, k, k1=1.2, b=0.75, collection=None, exclude=None):
+        """以 Block-Max 剪枝取得 BM25 分數最高的 k 篇文檔，返回 [(分數, 文檔ID)]
+
+        所有查詢詞的塊邊界把文檔ID切成區間，每個區間在每個詞中都只落在一個塊內，
+        區間的分數上界是各詞該塊的上界之和，由跳表記錄的塊內最大詞頻與區間內
+        最短的文檔長度算出。先精確評分上界最高的幾個區間得到第 k 名分數的門檻，
+        上界低於門檻的區間整段略過，其中的塊都不必解碼。
+
+        這不是逐篇推進游標的 WAND / MaxScore，也沒有維護大小為 k 的堆積：需要的塊
+        整批解碼後以 np.bincount 累加每篇文檔的分數，再以 np.argpartition 選出前 k 名。
+        剪枝只發生在塊的層級，門檻在評分前由上界最高的區間一次決定，之後不再提高。
+        collection 與 exclude 的意義與 bm25_scores 相同。
+        """
+        if k <= 0:
+            return []
+        if collection is None:
+            collection = self
+        average_length = collection.average_length
+        lists = []
+        for word, query_tf in Counter(words).items():
+            postings = self.postings.get(word)
+            if postings is not None and len(postings):
+                lists.append((postings, collection.idf(word) * query_tf))
+        if not lists:
+            return []
+
+        doc_ids = None
+        if sum(postings.block_count for postings, _ in lists) > TOP_K_MIN_BLOCKS:
+            doc_ids, impacts = self._pruned_impacts(lists, k, k1, b, average_length, exclude)
+        if doc_ids is None:
+            # 倒排列表很短或無法剪枝時，整條解碼比逐塊收集快
+            decoded = [postings.decode() for postings, _ in lists]
+            doc_ids = np.concatenate([ids for ids, _ in decoded])
+            impacts = np.concatenate([self._impacts(ids, tfs, weight, k1, b, average_length)
+                                      for (ids, tfs), (_, weight) in zip(decoded, lists)])
+
+        totals = np.bincount(doc_ids, weights=impacts)
+        if exclude is not None:
+            totals[exclude[exclude < totals.size]] = 0
+        hits = np.flatnonzero(totals)
+        if hits.size > k:
+            hits = hits[np.argpartition(totals[hits], -k)[-k:]]
+        return sorted(zip(totals[hits].tolist(), hits.tolist()), reverse=True)
+
+    def _pruned_impacts(self, lists, k, k1, b, average_length, exclude):
+        """只解碼可能包含前 k 名的塊，返回其中倒排項的 (文檔ID陣列, BM25 貢獻陣列)；大部分的塊都需要時返回 (None, None)
+
+        略過的區間中，文檔的分數 (或只解碼部分塊得到的下界) 都低於門檻，不會進入前 k 名。
+        """
+        # 每塊的最後一個文檔ID與最大詞頻，尾端未壓縮的倒排項視為最後一塊
+        block_lasts, block_max_tfs = [], []
+        for postings, _ in lists:
+            lasts = postings.skips[:, SKIP_LAST].astype(np.int64)
+            max_tfs = postings.skips[:, SKIP_MAX_TF].astype(np.int64)
+            if postings.tail_ids:
+                lasts = np.append(lasts, postings.tail_ids[-1])
+                max_tfs = np.append(max_tfs, max(postings.tail_tfs))
+            block_lasts.append(lasts)
+            block_max_tfs.append(max_tfs)
+        # 區間 i 是文檔ID (edges[i-1], edges[i]]
+        edges = np.unique(np.concatenate(block_lasts))
+        starts = np.concatenate(([0], edges[:-1] + 1))
+        lengths = self.doc_lengths[:edges[-1] + 1]
+        shortest = np.minimum.reduceat(np.where(lengths > 0, lengths, np.iinfo(np.int32).max), starts)
+        norms = k1 * (1 - b + b * shortest / average_length)
+
+        bounds = np.zeros(edges.size)
+        interval_blocks = []  # 每個詞中涵蓋各區間的塊，-1 表示沒有
+        for (_, weight), lasts, max_tfs in zip(lists, block_lasts, block_max_tfs):
+            blocks = np.searchsorted(lasts, edges)
+            covered = blocks < lasts.size
+            max_tf = max_tfs[blocks[covered]]
+            bounds[covered] += weight * max_tf * (k1 + 1) / (max_tf + norms[covered])
+            interval_blocks.append(np.where(covered, blocks, -1))
+
+        # 先處理上界最高的 k 個區間 (通常各含一篇達到塊內最大詞頻的文檔)，得到第 k 名分數的下界作為門檻
+        chosen = np.zeros(edges.size, dtype=bool)
+        chosen[np.argsort(-bounds, kind='stable')[:k]] = True
+        seen = [np.zeros(lasts.size, dtype=bool) for lasts in block_lasts]
+        doc_ids, impacts = self._block_impacts(lists, interval_blocks, chosen, seen, k1, b, average_length)
+        candidates, inverse = np.unique(doc_ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=impacts, minlength=candidates.size)
+        if exclude is not None:
+            scores[np.isin(candidates, exclude)] = 0
+        threshold = np.partition(scores, -k)[-k] if scores.size >= k else 0
+
+        # 其餘區間只處理上界不低於門檻的
+        rest = ~chosen & (bounds >= threshold)
+        needed = sum(np.unique(blocks[rest & (blocks >= 0)]).size for blocks in interval_blocks)
+        if 2 * needed > sum(lasts.size for lasts in block_lasts):
+            return None, None
+        more_ids, more_impacts = self._block_impacts(lists, interval_blocks, rest, seen, k1, b, average_length)
+        return np.concatenate((doc_ids, more_ids)), np.concatenate((impacts, more_impacts))
+
+    def _block_impacts(self, lists, interval_blocks, chosen, seen, k1, b, average_length):
+        """解碼涵蓋 chosen 區間、尚未解碼過的塊，返回其中倒排項的 (文檔ID陣列, BM25 貢獻陣列)"""
+        doc_ids, impacts = [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+        for (postings, weight), blocks, decoded in zip(lists, interval_blocks, seen):
+            blocks = np.unique(blocks[chosen])
+            blocks = blocks[blocks >= 0]
+            blocks = blocks[~decoded[blocks]]
+            if blocks.size:
+                decoded[blocks] = True
+                ids, tfs = postings.decode_blocks(blocks)
+                doc_ids.append(ids)
+                impacts.append(self._impacts(ids, tfs, weight, k1, b, average_length))
+        return np.concatenate(doc_ids), np.concatenate(impacts)
+
+    # 讓索引可以像原本的 dict 一樣以詞查詢，取得的是 PostingList
+    def __contains__(self, word):
+        return word in self.postings
+
+    def __getitem__(self, word):
+        return self.postings[word]
+
+    def get(self, word, default=None):
+        return self.postings.get(word, default)
+
+    def __iter__(self):
+        return iter(self.postings)
+
+    def __len__(self):
+        return len(self.postings)
@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# ==================== 行程內 LRU 快取 ==================== #
+
+class LRUCache:
+    """以位元組數與筆數限制大小、帶 TTL 的 LRU 快取
+
+    每筆資料由呼叫者提供大小 (通常是序列化後的位元組數)，總大小或筆數
+    超過上限時從最久沒被使用的一端淘汰；過期的資料在讀取時才移除。
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entries=10000, ttl=300, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # 鍵 -> (值, 大小, 過期時間)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] <= self.clock():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (value, size, self.clock() + self.ttl)
+            self.bytes += size
+            while self.bytes > self.max_bytes or len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+        }
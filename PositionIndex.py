@@ -0,0 +1,197 @@
+import numpy as np
+
+
+# ==================== 位置索引 ==================== #
+#
+# 記錄每個詞在每篇文檔中出現的位置 (第幾個詞)，供片語與 NEAR/k 查詢使用。
+# 倒排項依 (詞, 文檔ID) 分組，每組的位置遞增，所有位置連續存放在一個 int32 陣列中；
+# 這些陣列可以直接寫入索引段，開啟時以 mmap 映射，不必重新分詞。
+#
+# 查詢時一次取出一個詞在所有候選文檔中的位置，編成 (文檔ID << 32) | 位置 的鍵，
+# 鍵依文檔ID與位置遞增。片語的第 i 個詞的鍵減去 i 後與第一個詞的鍵以 searchsorted
+# 求交集；NEAR 同樣以 searchsorted 找出每個左邊區間附近的右邊區間，不必逐篇文檔迴圈。
+
+_SHIFT = 32
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+
+def _ranges(starts, ends):
+    """把多個 [start, end) 區間展開成一個索引陣列"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return _EMPTY
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(total, dtype=np.int64) + offsets
+
+
+def _member(keys, sorted_keys):
+    """keys 中每個元素是否出現在遞增的 sorted_keys 中"""
+    if not sorted_keys.size:
+        return np.zeros(keys.size, dtype=bool)
+    i = np.minimum(np.searchsorted(sorted_keys, keys), sorted_keys.size - 1)
+    return sorted_keys[i] == keys
+
+
+class PositionIndex:
+    """一組文檔的位置索引
+
+    terms 是詞 -> 詞編號 (依詞排序)；詞編號 t 的分組是 [term_starts[t], term_starts[t + 1])，
+    分組 g 屬於文檔 group_docs[g]，位置是 positions[group_starts[g]:group_starts[g + 1]]。
+    """
+
+    def __init__(self, terms, term_starts, group_docs, group_starts, positions):
+        self.terms = terms
+        self.term_starts = term_starts
+        self.group_docs = group_docs
+        self.group_starts = group_starts
+        self.positions = positions
+
+    @classmethod
+    def build(cls, documents):
+        """documents 依文檔ID遞增產生 (文檔ID, 詞列表)"""
+        vocabulary = {}
+        term_ids, doc_ids, lengths = [], [], []
+        for doc_id, words in documents:
+            term_ids.extend(vocabulary.setdefault(word, len(vocabulary)) for word in words)
+            doc_ids.append(doc_id)
+            lengths.append(len(words))
+        words = sorted(vocabulary)
+        ranks = np.empty(len(words), dtype=np.int64)
+        ranks[[vocabulary[word] for word in words]] = np.arange(len(words))
+        lengths = np.asarray(lengths, dtype=np.int64)
+        term_ids = ranks[np.asarray(term_ids, dtype=np.int64)] if term_ids else _EMPTY
+        doc_ids = np.repeat(np.asarray(doc_ids, dtype=np.int64), lengths)
+        positions = np.arange(term_ids.size, dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        # 文檔依序收集，穩定排序詞編號後同一個詞內文檔ID與位置都已經遞增
+        order = np.argsort(term_ids, kind='stable')
+        return cls._from_sorted(words, term_ids[order], doc_ids[order], positions[order])
+
+    @classmethod
+    def merged(cls, indexes, deleted_ids=()):
+        """把多個文檔互不重疊的位置索引合併成一個，同時丟棄 deleted_ids 中的文檔"""
+        deleted = np.asarray(sorted(deleted_ids), dtype=np.int64)
+        vocabulary = {}
+        term_ids, doc_ids, positions = [], [], []
+        for index in indexes:
+            mapping = np.array([vocabulary.setdefault(word, len(vocabulary)) for word in index.terms], dtype=np.int64)
+            group_terms = np.repeat(np.arange(len(mapping)), np.diff(index.term_starts))
+            sizes = np.diff(index.group_starts)
+            ids = np.repeat(index.group_docs, sizes)
+            terms = np.repeat(mapping[group_terms] if mapping.size else _EMPTY, sizes)
+            values = np.asarray(index.positions, dtype=np.int64)
+            if deleted.size:
+                keep = ~np.isin(ids, deleted)
+                terms, ids, values = terms[keep], ids[keep], values[keep]
+            term_ids.append(terms)
+            doc_ids.append(ids)
+            positions.append(values)
+        names = list(vocabulary)
+        term_ids = np.concatenate(term_ids) if term_ids else _EMPTY
+        words = sorted(names[term] for term in np.unique(term_ids).tolist())
+        ranks = np.empty(len(names), dtype=np.int64)
+        ranks[[vocabulary[word] for word in words]] = np.arange(len(words))
+        term_ids = ranks[term_ids] if term_ids.size else _EMPTY
+        doc_ids = np.concatenate(doc_ids) if doc_ids else _EMPTY
+        positions = np.concatenate(positions) if positions else _EMPTY
+        order = np.lexsort((positions, doc_ids, term_ids))
+        return cls._from_sorted(words, term_ids[order], doc_ids[order], positions[order])
+
+    @classmethod
+    def _from_sorted(cls, words, term_ids, doc_ids, positions):
+        """由依 (詞編號, 文檔ID, 位置) 排序的出現位置建立索引"""
+        first = np.ones(term_ids.size, dtype=bool)
+        first[1:] = (term_ids[1:] != term_ids[:-1]) | (doc_ids[1:] != doc_ids[:-1])
+        groups = np.flatnonzero(first)
+        return cls({word: term for term, word in enumerate(words)},
+                   np.searchsorted(term_ids[groups], np.arange(len(words) + 1)).astype(np.int64),
+                   doc_ids[groups],
+                   np.append(groups, term_ids.size).astype(np.int64),
+                   positions.astype(np.int32))
+
+    def words(self):
+        """依詞編號排序的詞列表"""
+        return list(self.terms)
+
+    def keys(self, word, doc_ids):
+        """詞在 doc_ids (遞增) 這些文檔中出現的位置，返回遞增的 (文檔ID << 32) | 位置 陣列"""
+        term = self.terms.get(word)
+        if term is None or not doc_ids.size:
+            return _EMPTY
+        start, end = int(self.term_starts[term]), int(self.term_starts[term + 1])
+        docs = self.group_docs[start:end]
+        groups = np.flatnonzero(_member(docs, doc_ids)) + start
+        if not groups.size:
+            return _EMPTY
+        sizes = self.group_starts[groups + 1] - self.group_starts[groups]
+        values = self.positions[_ranges(self.group_starts[groups], self.group_starts[groups + 1])]
+        return (np.repeat(self.group_docs[groups], sizes) << _SHIFT) | values.astype(np.int64)
+
+    @property
+    def nbytes(self):
+        return self.term_starts.nbytes + self.group_docs.nbytes + self.group_starts.nbytes + self.positions.nbytes
+
+
+# ==================== 位置運算元 ==================== #
+
+class Spans:
+    """片語或 NEAR 的結果：符合的 (起點, 終點) 位置區間，終點包含在內
+
+    starts 是 (文檔ID << 32) | 起點 的鍵，依文檔ID與起點遞增；ends 是同一篇文檔中的終點位置。
+    """
+
+    def __init__(self, starts=_EMPTY, ends=_EMPTY):
+        self.starts = starts
+        self.ends = ends
+
+    def doc_ids(self):
+        return np.unique(self.starts >> _SHIFT)
+
+    def longest(self):
+        return int((self.ends - (self.starts & 0xFFFFFFFF)).max()) + 1 if self.starts.size else 0
+
+
+def term_spans(position_index, word, doc_ids):
+    """詞在候選文檔中的每個出現位置，各自是長度 1 的區間"""
+    keys = position_index.keys(word, doc_ids)
+    return Spans(keys, keys & 0xFFFFFFFF)
+
+
+def phrase_spans(position_index, words, doc_ids):
+    """在候選文檔 (遞增的文檔ID陣列) 中找出 words 依序相鄰出現的位置"""
+    starts = position_index.keys(words[0], doc_ids)
+    for offset, word in enumerate(words[1:], 1):
+        if not starts.size:
+            break
+        # 第 offset 個詞的位置減去 offset 就是片語的起點
+        following = position_index.keys(word, np.unique(starts >> _SHIFT)) - offset
+        starts = starts[_member(starts, following)]
+    return Spans(starts, (starts & 0xFFFFFFFF) + len(words) - 1)
+
+
+def near_spans(left, right, distance):
+    """兩邊的區間相隔不超過 distance 個位置 (不論先後) 的文檔，結果區間涵蓋兩邊
+
+    右邊區間 r 與左邊區間 l 的距離是 max(r 起點 - l 終點, l 起點 - r 終點)。右邊依起點排序，
+    起點落在 [l 起點 - distance - (右邊最長區間 - 1), l 終點 + distance] 的才可能符合。
+    """
+    if not left.starts.size or not right.starts.size:
+        return Spans()
+    docs = left.starts >> _SHIFT
+    left_starts = left.starts & 0xFFFFFFFF
+    reach = distance + right.longest() - 1
+    low = np.searchsorted(right.starts, (docs << _SHIFT) | np.maximum(left_starts - reach, 0))
+    high = np.searchsorted(right.starts, (docs << _SHIFT) | (left.ends + distance), side='right')
+    i = np.repeat(np.arange(docs.size), high - low)
+    j = _ranges(low, high)
+    right_starts = right.starts[j] & 0xFFFFFFFF
+    close = right.ends[j] >= left_starts[i] - distance
+    i, j, right_starts = i[close], j[close], right_starts[close]
+
+    starts = (docs[i] << _SHIFT) | np.minimum(left_starts[i], right_starts)
+    ends = np.maximum(left.ends[i], right.ends[j])
+    order = np.lexsort((ends, starts))
+    starts, ends = starts[order], ends[order]
+    unique = np.ones(starts.size, dtype=bool)
+    unique[1:] = (starts[1:] != starts[:-1]) | (ends[1:] != ends[:-1])
+    return Spans(starts[unique], ends[unique])
@@ -0,0 +1,517 @@
+import numpy as np
+from collections.abc import MutableMapping
+
+
+# ==================== 壓縮倒排列表 ==================== #
+#
+# 倒排列表按文檔ID排序後切成每塊 BLOCK_SIZE 個倒排項，每塊獨立編碼：
+# 先寫入各文檔ID相對前一個ID的差值，再寫入各自的詞頻，兩者都用
+# variable-byte 編碼 (每位元組 7 位元資料，最高位元標記數值結束)。
+# 每塊的起始基準、最後一個文檔ID、結束位置與最大詞頻另外存成跳表，
+# 查詢時可以只解碼需要的塊，刪除時也只需重新編碼一塊。
+
+BLOCK_SIZE = 128
+
+# 跳表欄位：塊的差值基準、塊內最後一個文檔ID、資料結束位移、累計倒排項數、塊內最大詞頻
+SKIP_BASE, SKIP_LAST, SKIP_OFFSET, SKIP_COUNT, SKIP_MAX_TF = range(5)
+SKIP_COLUMNS = 5
+SKIP_DTYPE = np.int32
+
+_EMPTY_DATA = np.zeros(0, dtype=np.uint8)
+_EMPTY_SKIPS = np.zeros((0, SKIP_COLUMNS), dtype=SKIP_DTYPE)
+_EMPTY_IDS = np.zeros(0, dtype=np.int64)
+
+
+def varbyte_encode(values):
+    """把非負整數陣列編碼為 variable-byte 位元組陣列"""
+    values = np.asarray(values, dtype=np.uint64)
+    if values.size == 0:
+        return _EMPTY_DATA
+    # 大部分的差值與詞頻都只需要一個位元組，多位元組的部分只處理需要的值
+    nbytes = np.ones(values.size, dtype=np.int64)
+    top = int(values.max())
+    bits = 7
+    while bits < 64 and top >> bits:
+        nbytes += values >= np.uint64(1 << bits)
+        bits += 7
+    ends = np.cumsum(nbytes)
+    starts = ends - nbytes
+    data = np.empty(int(ends[-1]), dtype=np.uint8)
+    data[starts] = values & np.uint64(0x7F)
+    for k in range(1, bits // 7):
+        wide = np.flatnonzero(nbytes > k)
+        data[starts[wide] + k] = (values[wide] >> np.uint64(7 * k)) & np.uint64(0x7F)
+    data[ends - 1] |= 0x80
+    return data
+
+
+def varbyte_decode(data):
+    """解碼 variable-byte 位元組陣列，返回 uint64 陣列"""
+    data = np.asarray(data, dtype=np.uint8)
+    if data.size == 0:
+        return np.zeros(0, dtype=np.uint64)
+    stops = np.flatnonzero(data & 0x80)
+    starts = np.concatenate(([0], stops[:-1] + 1))
+    lengths = stops - starts + 1
+    values = (data[starts] & 0x7F).astype(np.uint64)
+    for k in range(1, int(lengths.max())):
+        wide = np.flatnonzero(lengths > k)
+        values[wide] |= (data[starts[wide] + k] & 0x7F).astype(np.uint64) << np.uint64(7 * k)
+    return values
+
+
+def _encode_block(doc_ids, tfs, base):
+    deltas = np.diff(np.asarray(doc_ids, dtype=np.int64), prepend=base)
+    return varbyte_encode(np.concatenate((deltas, np.asarray(tfs, dtype=np.int64))))
+
+
+def _decode_run(data, counts, bases):
+    """解碼依序相接的多個塊，counts 與 bases 是各塊的倒排項數與差值基準；返回 (文檔ID, 詞頻)"""
+    values = varbyte_decode(data).astype(np.int64)
+    # 每塊依序是 count 個差值再接 count 個詞頻
+    is_tf = np.repeat(np.tile([False, True], len(counts)), np.repeat(counts, 2))
+    deltas, tfs = values[~is_tf], values[is_tf]
+    sums = np.cumsum(deltas)
+    before = np.concatenate(([0], sums[np.cumsum(counts)[:-1] - 1]))
+    return sums - np.repeat(before - bases, counts), tfs
+
+
+def _decode_blocks(data, skips, block_terms):
+    """一次解碼連續存放的多個塊，block_terms 是每個塊所屬的詞序號；返回 (詞序號, 文檔ID, 詞頻)"""
+    cumulative = skips[:, SKIP_COUNT].astype(np.int64)
+    first = np.ones(len(skips), dtype=bool)
+    first[1:] = block_terms[1:] != block_terms[:-1]
+    counts = cumulative - np.where(first, 0, np.roll(cumulative, 1))
+    nonempty = np.flatnonzero(counts)
+    counts, bases, block_terms = counts[nonempty], skips[nonempty, SKIP_BASE].astype(np.int64), block_terms[nonempty]
+    if not counts.size:
+        return _EMPTY_IDS, _EMPTY_IDS, _EMPTY_IDS
+
+    values = varbyte_decode(data).astype(np.int64)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    block_of = np.repeat(np.arange(counts.size), counts)
+    inner = np.arange(block_of.size) - starts[block_of]
+    deltas = values[2 * starts[block_of] + inner]
+    tfs = values[2 * starts[block_of] + counts[block_of] + inner]
+    sums = np.cumsum(deltas)
+    doc_ids = sums - (sums[starts] - deltas[starts])[block_of] + bases[block_of]
+    return block_terms[block_of], doc_ids, tfs
+
+
+class PostingList:
+    """以 NumPy 陣列保存、分塊壓縮並帶跳表的倒排列表
+
+    新文檔的ID總是遞增，新增時先放進未壓縮的尾端緩衝區，
+    滿一塊才壓縮寫入，所以逐篇新增時不需要重新編碼既有資料。
+    """
+    __slots__ = ('data', 'skips', 'tail_ids', 'tail_tfs')
+
+    def __init__(self, data=_EMPTY_DATA, skips=_EMPTY_SKIPS):
+        self.data = data      # 所有塊的壓縮資料
+        self.skips = skips    # 每塊一列的跳表，欄位見 SKIP_*
+        self.tail_ids = None  # 尚未壓縮的新倒排項
+        self.tail_tfs = None
+
+    @classmethod
+    def from_arrays(cls, doc_ids, tfs):
+        """由文檔ID與詞頻陣列一次編碼出完整的倒排列表"""
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        tfs = np.asarray(tfs, dtype=np.int64)
+        if doc_ids.size > 1 and np.any(doc_ids[1:] < doc_ids[:-1]):
+            order = np.argsort(doc_ids, kind='stable')
+            doc_ids, tfs = doc_ids[order], tfs[order]
+
+        blocks = []
+        skips = np.zeros(((doc_ids.size + BLOCK_SIZE - 1) // BLOCK_SIZE, SKIP_COLUMNS), dtype=SKIP_DTYPE)
+        offset = 0
+        for i, start in enumerate(range(0, doc_ids.size, BLOCK_SIZE)):
+            end = min(start + BLOCK_SIZE, doc_ids.size)
+            base = doc_ids[start - 1] if start else 0
+            block = _encode_block(doc_ids[start:end], tfs[start:end], base)
+            blocks.append(block)
+            offset += block.size
+            skips[i] = (base, doc_ids[end - 1], offset, end, tfs[start:end].max())
+        data = np.concatenate(blocks) if blocks else _EMPTY_DATA
+        return cls(data, skips)
+
+    # ==================== 讀取 ==================== #
+
+    @property
+    def block_count(self):
+        return len(self.skips)
+
+    def __len__(self):
+        encoded = int(self.skips[-1, SKIP_COUNT]) if len(self.skips) else 0
+        return encoded + (len(self.tail_ids) if self.tail_ids else 0)
+
+    def last_doc_id(self):
+        if self.tail_ids:
+            return self.tail_ids[-1]
+        return int(self.skips[-1, SKIP_LAST]) if len(self.skips) else -1
+
+    def _block_bounds(self, block):
+        start = int(self.skips[block - 1, SKIP_OFFSET]) if block else 0
+        first = int(self.skips[block - 1, SKIP_COUNT]) if block else 0
+        return start, int(self.skips[block, SKIP_OFFSET]), int(self.skips[block, SKIP_COUNT]) - first
+
+    def decode_block(self, block):
+        """只解碼一個塊，返回 (文檔ID陣列, 詞頻陣列)"""
+        start, end, count = self._block_bounds(block)
+        values = varbyte_decode(self.data[start:end]).astype(np.int64)
+        doc_ids = np.cumsum(values[:count]) + self.skips[block, SKIP_BASE]
+        return doc_ids, values[count:]
+
+    def decode_blocks(self, blocks):
+        """一次解碼排序的塊編號 blocks，返回 (文檔ID陣列, 詞頻陣列)；編號 block_count 代表尾端未壓縮的倒排項"""
+        blocks = np.asarray(blocks, dtype=np.int64)
+        encoded = blocks[blocks < len(self.skips)]
+        if encoded.size == len(self.skips):
+            doc_ids, tfs = self._decode_encoded()
+        elif encoded.size:
+            previous = self.skips[encoded - 1].astype(np.int64)
+            previous[encoded == 0] = 0
+            # 把各塊的位元組範圍接成一段再一起解碼
+            starts = previous[:, SKIP_OFFSET]
+            lengths = self.skips[encoded, SKIP_OFFSET] - starts
+            positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(int(lengths.sum()))
+            doc_ids, tfs = _decode_run(self.data[positions], self.skips[encoded, SKIP_COUNT] - previous[:, SKIP_COUNT],
+                                       self.skips[encoded, SKIP_BASE])
+        else:
+            doc_ids, tfs = _EMPTY_IDS, _EMPTY_IDS
+        if self.tail_ids and encoded.size < blocks.size:
+            doc_ids = np.concatenate((doc_ids, np.array(self.tail_ids, dtype=np.int64)))
+            tfs = np.concatenate((tfs, np.array(self.tail_tfs, dtype=np.int64)))
+        return doc_ids, tfs
+
+    def _decode_encoded(self):
+        if not len(self.skips):
+            return _EMPTY_IDS, _EMPTY_IDS
+        return _decode_run(self.data, np.diff(self.skips[:, SKIP_COUNT], prepend=0), self.skips[:, SKIP_BASE])
+
+    def decode(self):
+        """解碼整個倒排列表，返回 (文檔ID陣列, 詞頻陣列)"""
+        doc_ids, tfs = self._decode_encoded()
+        if self.tail_ids:
+            doc_ids = np.concatenate((doc_ids, np.array(self.tail_ids, dtype=np.int64)))
+            tfs = np.concatenate((tfs, np.array(self.tail_tfs, dtype=np.int64)))
+        return doc_ids, tfs
+
+    def doc_ids(self):
+        return self.decode()[0]
+
+    def max_tf(self):
+        """列表中的最大詞頻，用來估算分數上界"""
+        encoded = int(self.skips[:, SKIP_MAX_TF].max()) if len(self.skips) else 0
+        return max(encoded, max(self.tail_tfs)) if self.tail_tfs else encoded
+
+    def lookup(self, doc_ids):
+        """在此列表中查找排序陣列 doc_ids，返回命中的 (文檔ID陣列, 詞頻陣列)
+
+        透過跳表只解碼可能包含這些文檔的塊；需要的塊太多時直接整條解碼。
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        if doc_ids.size == 0 or len(self) == 0:
+            return _EMPTY_IDS, _EMPTY_IDS
+        blocks = np.unique(np.searchsorted(self.skips[:, SKIP_LAST], doc_ids))
+        blocks = blocks[blocks < len(self.skips)]
+        if len(blocks) * 4 > len(self.skips):
+            found_ids, found_tfs = self.decode()
+        else:
+            parts = [self.decode_block(int(block)) for block in blocks]
+            if self.tail_ids:
+                parts.append((np.array(self.tail_ids, dtype=np.int64), np.array(self.tail_tfs, dtype=np.int64)))
+            if not parts:
+                return _EMPTY_IDS, _EMPTY_IDS
+            found_ids = np.concatenate([ids for ids, _ in parts])
+            found_tfs = np.concatenate([tfs for _, tfs in parts])
+        hit = np.isin(found_ids, doc_ids, assume_unique=True)
+        return found_ids[hit], found_tfs[hit]
+
+    def intersect(self, doc_ids):
+        """返回排序陣列 doc_ids 中同時出現在此列表的文檔"""
+        return self.lookup(doc_ids)[0]
+
+    # ==================== 更新 ==================== #
+
+    def add(self, doc_id, tf):
+        if len(self) and doc_id <= self.last_doc_id():
+            # 亂序插入很少見，直接重新編碼整個列表
+            doc_ids, tfs = self.decode()
+            keep = doc_ids != doc_id
+            rebuilt = PostingList.from_arrays(np.append(doc_ids[keep], doc_id), np.append(tfs[keep], tf))
+            self.data, self.skips, self.tail_ids, self.tail_tfs = rebuilt.data, rebuilt.skips, None, None
+            return
+        if self.tail_ids is None:
+            self.tail_ids, self.tail_tfs = [], []
+        self.tail_ids.append(doc_id)
+        self.tail_tfs.append(tf)
+        if len(self.tail_ids) >= BLOCK_SIZE:
+            self._flush_tail()
+
+    def extend(self, doc_ids, tfs):
+        """追加一批遞增的倒排項，滿一塊的部分一次編碼完成"""
+        if len(doc_ids) and len(self) and doc_ids[0] <= self.last_doc_id():
+            for doc_id, tf in zip(doc_ids, tfs):
+                self.add(doc_id, tf)
+            return
+        if self.tail_ids is None:
+            self.tail_ids, self.tail_tfs = [], []
+        self.tail_ids.extend(doc_ids)
+        self.tail_tfs.extend(tfs)
+        full = len(self.tail_ids) - len(self.tail_ids) % BLOCK_SIZE
+        if not full:
+            return
+        base = int(self.skips[-1, SKIP_LAST]) if len(self.skips) else 0
+        offset = int(self.skips[-1, SKIP_OFFSET]) if len(self.skips) else 0
+        count = int(self.skips[-1, SKIP_COUNT]) if len(self.skips) else 0
+        blocks = []
+        rows = np.empty((full // BLOCK_SIZE, SKIP_COLUMNS), dtype=SKIP_DTYPE)
+        for i, start in enumerate(range(0, full, BLOCK_SIZE)):
+            ids = self.tail_ids[start:start + BLOCK_SIZE]
+            counts = self.tail_tfs[start:start + BLOCK_SIZE]
+            blocks.append(_encode_block(ids, counts, base))
+            offset += blocks[-1].size
+            count += BLOCK_SIZE
+            rows[i] = (base, ids[-1], offset, count, max(counts))
+            base = ids[-1]
+        self.data = np.concatenate((self.data, *blocks))
+        self.skips = np.concatenate((self.skips, rows))
+        self.tail_ids, self.tail_tfs = self.tail_ids[full:] or None, self.tail_tfs[full:] or None
+
+    def _flush_tail(self):
+        base = int(self.skips[-1, SKIP_LAST]) if len(self.skips) else 0
+        block = _encode_block(self.tail_ids, self.tail_tfs, base)
+        offset = int(self.skips[-1, SKIP_OFFSET]) if len(self.skips) else 0
+        count = int(self.skips[-1, SKIP_COUNT]) if len(self.skips) else 0
+        row = np.array([[base, self.tail_ids[-1], offset + block.size, count + len(self.tail_ids),
+                         max(self.tail_tfs)]], dtype=SKIP_DTYPE)
+        self.data = np.concatenate((self.data, block))
+        self.skips = np.concatenate((self.skips, row))
+        self.tail_ids = self.tail_tfs = None
+
+    def remove(self, doc_id):
+        """移除一個倒排項，只重新編碼它所在的塊；返回是否真的有移除"""
+        if self.tail_ids and doc_id in self.tail_ids:
+            i = self.tail_ids.index(doc_id)
+            del self.tail_ids[i]
+            del self.tail_tfs[i]
+            return True
+        if not len(self.skips):
+            return False
+        block = int(np.searchsorted(self.skips[:, SKIP_LAST], doc_id))
+        if block >= len(self.skips):
+            return False
+        doc_ids, tfs = self.decode_block(block)
+        keep = doc_ids != doc_id
+        if keep.all():
+            return False
+
+        start, end, _ = self._block_bounds(block)
+        base = int(self.skips[block, SKIP_BASE])
+        encoded = _encode_block(doc_ids[keep], tfs[keep], base) if keep.any() else _EMPTY_DATA
+        skips = self.skips.copy()
+        skips[block:, SKIP_OFFSET] += encoded.size - (end - start)
+        skips[block:, SKIP_COUNT] -= 1
+        if keep.any():
+            skips[block, SKIP_LAST] = doc_ids[keep][-1]
+            skips[block, SKIP_MAX_TF] = tfs[keep].max()
+        else:
+            skips = np.delete(skips, block, axis=0)
+        self.data = np.concatenate((self.data[:start], encoded, self.data[end:]))
+        self.skips = skips
+        return True
+
+    def copy(self):
+        """可以獨立修改的副本：壓縮資料與跳表只會被整個換掉，直接共用，只複製尾端緩衝區"""
+        postings = PostingList(self.data, self.skips)
+        if self.tail_ids:
+            postings.tail_ids, postings.tail_tfs = list(self.tail_ids), list(self.tail_tfs)
+        return postings
+
+    @property
+    def nbytes(self):
+        tail = 16 * len(self.tail_ids) if self.tail_ids else 0
+        return self.data.nbytes + self.skips.nbytes + tail
+
+
+# ==================== 詞 -> 倒排列表 ==================== #
+
+class PostingDictionary(MutableMapping):
+    """詞到 PostingList 的對照表
+
+    批量建立的倒排列表全部共用同一塊壓縮資料與跳表，只記錄每個詞的起點，
+    查詢時才建立指向共用資料的輕量 PostingList，不必為每個詞常駐一個物件。
+    被增刪修改過的詞會另外保存自己的 PostingList，共用資料本身永遠不會被改寫，
+    因此也可以直接指向以 mmap 開啟的索引段。
+    """
+
+    def __init__(self, data=_EMPTY_DATA, skips=_EMPTY_SKIPS, terms=None, term_blocks=None, term_bytes=None):
+        self.data = data
+        self.skips = skips
+        self.terms = terms if terms is not None else {}  # 詞 -> 共用資料中的詞編號，唯讀
+        self.term_blocks = term_blocks  # 詞編號 -> 第一個塊，最後多一個結尾
+        self.term_bytes = term_bytes    # 詞編號 -> 資料起點，最後多一個結尾
+        self.updated = {}               # 修改過或新增的詞 -> 自己的 PostingList
+        self.shadowed = set()           # 共用資料中已被修改或刪除的詞
+        self.borrowed = set()           # updated 中與副本共用、修改前要先複製的詞
+
+    @classmethod
+    def build(cls, words, term_ids, doc_ids, tfs):
+        """一次為所有詞建立倒排列表，words 依詞編號排列
+
+        所有倒排項一起做一次 variable-byte 編碼，避免逐詞呼叫 NumPy 的額外成本。
+        """
+        term_count = len(words)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        tfs = np.asarray(tfs, dtype=np.int64)
+        span = int(doc_ids.max()) + 1 if doc_ids.size else 1
+        if term_count * span < 2 ** 63:
+            # 詞編號與文檔ID合成一個排序鍵，比 lexsort 快得多
+            order = np.argsort(term_ids * span + doc_ids)
+        else:
+            order = np.lexsort((doc_ids, term_ids))
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+        total = doc_ids.size
+        if total == 0:
+            return cls()
+
+        # 每個詞的起點與各倒排項在詞內的位置
+        term_starts = np.searchsorted(term_ids, np.arange(term_count + 1))
+        first_of_term = term_starts[term_ids]
+        rank = np.arange(total) - first_of_term
+
+        # 差值基準是同一詞的前一個文檔ID，每個詞第一塊的基準為0
+        deltas = np.diff(doc_ids, prepend=0)
+        deltas[rank == 0] = doc_ids[rank == 0]
+
+        # 分塊：塊內先放 count 個差值再放 count 個詞頻
+        is_block_start = rank % BLOCK_SIZE == 0
+        block_starts = np.flatnonzero(is_block_start)
+        block_of = np.cumsum(is_block_start) - 1
+        block_ends = np.append(block_starts[1:], total)
+        counts = block_ends - block_starts
+        inner = np.arange(total) - block_starts[block_of]
+        values = np.empty(2 * total, dtype=np.int64)
+        values[2 * block_starts[block_of] + inner] = deltas
+        values[2 * block_starts[block_of] + counts[block_of] + inner] = tfs
+
+        data = varbyte_encode(values)
+        value_ends = np.flatnonzero(data & 0x80) + 1
+        block_byte_ends = value_ends[2 * block_ends - 1]
+
+        skips = np.empty((block_starts.size, SKIP_COLUMNS), dtype=SKIP_DTYPE)
+        skips[:, SKIP_BASE] = doc_ids[block_starts] - deltas[block_starts]
+        skips[:, SKIP_LAST] = doc_ids[block_ends - 1]
+        skips[:, SKIP_MAX_TF] = np.maximum.reduceat(tfs, block_starts)
+        block_terms = term_ids[block_starts]
+        term_blocks = np.searchsorted(block_terms, np.arange(term_count + 1))
+        term_byte_starts = np.concatenate(([0], block_byte_ends))[term_blocks]
+        # 跳表中的位移與累計數都改為相對於各詞自己的起點
+        skips[:, SKIP_OFFSET] = block_byte_ends - term_byte_starts[block_terms]
+        skips[:, SKIP_COUNT] = block_ends - term_starts[block_terms]
+        return cls(data, skips, {word: term for term, word in enumerate(words)}, term_blocks, term_byte_starts)
+
+    def _view(self, term):
+        first_block, last_block = self.term_blocks[term], self.term_blocks[term + 1]
+        return PostingList(self.data[self.term_bytes[term]:self.term_bytes[term + 1]],
+                           self.skips[first_block:last_block])
+
+    def _shared_term(self, word):
+        if word in self.shadowed:
+            return None
+        return self.terms.get(word)
+
+    def copy(self):
+        """可以獨立修改的副本 (copy-on-write)：修改過的詞在任一方第一次再修改它時才複製"""
+        other = PostingDictionary(self.data, self.skips, self.terms, self.term_blocks, self.term_bytes)
+        other.updated = dict(self.updated)
+        other.shadowed = set(self.shadowed)
+        self.borrowed = set(self.updated)
+        other.borrowed = set(self.updated)
+        return other
+
+    def for_update(self, word):
+        """取得可以原地修改的 PostingList，新詞會建立空列表"""
+        postings = self.updated.get(word)
+        if postings is not None and word in self.borrowed:
+            postings = self.updated[word] = postings.copy()
+            self.borrowed.discard(word)
+        if postings is None:
+            term = self._shared_term(word)
+            if term is None:
+                postings = PostingList()
+            else:
+                postings = self._view(term)
+                self.shadowed.add(word)
+            self.updated[word] = postings
+        return postings
+
+    def decode_all(self):
+        """一次解碼所有詞的倒排項，返回 (詞列表, 詞序號, 文檔ID, 詞頻)，詞序號是詞在詞列表中的位置"""
+        words, parts = [], []
+        if self.term_blocks is not None and len(self.skips):
+            words = list(self.terms)
+            block_terms = np.repeat(np.arange(len(words)), np.diff(self.term_blocks))
+            term_ids, doc_ids, tfs = _decode_blocks(self.data, self.skips, block_terms)
+            if self.shadowed:
+                keep = ~np.isin(term_ids, [self.terms[word] for word in self.shadowed if word in self.terms])
+                term_ids, doc_ids, tfs = term_ids[keep], doc_ids[keep], tfs[keep]
+            parts.append((term_ids, doc_ids, tfs))
+        if self.updated:
+            # 修改過的詞各自保存，把它們的塊接起來同樣一次解碼
+            offset = len(words)
+            lists = list(self.updated.values())
+            words += list(self.updated)
+            block_terms = np.repeat(np.arange(offset, offset + len(lists)), [len(postings.skips) for postings in lists])
+            parts.append(_decode_blocks(np.concatenate([postings.data for postings in lists]),
+                                        np.concatenate([postings.skips for postings in lists]), block_terms))
+            for i, postings in enumerate(lists):
+                if postings.tail_ids:
+                    parts.append((np.full(len(postings.tail_ids), offset + i),
+                                  np.array(postings.tail_ids, dtype=np.int64),
+                                  np.array(postings.tail_tfs, dtype=np.int64)))
+        if not parts:
+            return words, _EMPTY_IDS, _EMPTY_IDS, _EMPTY_IDS
+        return (words,) + tuple(np.concatenate(columns) for columns in zip(*parts))
+
+    def __getitem__(self, word):
+        postings = self.updated.get(word)
+        if postings is not None:
+            return postings
+        term = self._shared_term(word)
+        if term is None:
+            raise KeyError(word)
+        return self._view(term)
+
+    def __setitem__(self, word, postings):
+        if word in self.terms:
+            self.shadowed.add(word)
+        self.updated[word] = postings
+        self.borrowed.discard(word)
+
+    def __delitem__(self, word):
+        self.borrowed.discard(word)
+        if self.updated.pop(word, None) is None:
+            if self._shared_term(word) is None:
+                raise KeyError(word)
+            self.shadowed.add(word)
+
+    def __contains__(self, word):
+        return word in self.updated or self._shared_term(word) is not None
+
+    def __iter__(self):
+        for word in self.terms:
+            if word not in self.shadowed:
+                yield word
+        yield from self.updated
+
+    def __len__(self):
+        return len(self.terms) - len(self.shadowed) + len(self.updated)
+
+    @property
+    def nbytes(self):
+        shared = self.data.nbytes + self.skips.nbytes
+        if self.term_blocks is not None:
+            shared += self.term_blocks.nbytes + self.term_bytes.nbytes
+        return shared + sum(postings.nbytes for postings in self.updated.values())
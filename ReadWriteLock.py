@@ -0,0 +1,47 @@
+import threading
+from contextlib import contextmanager
+
+
+# ==================== 讀寫鎖 ==================== #
+
+class ReadWriteLock:
+    """多個讀者可以同時持有、寫者獨佔的鎖
+
+    有寫者在等待時，新的讀者會先等寫者完成，持續的查詢不會讓寫入一直等下去。
+    不可重入：持有讀鎖時不能再取得寫鎖，反之亦然。
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writing_now = False
+        self.waiting_writers = 0
+
+    @contextmanager
+    def reading(self):
+        with self.condition:
+            while self.writing_now or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writing_now or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writing_now = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writing_now = False
+                self.condition.notify_all()
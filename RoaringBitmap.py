@@ -0,0 +1,132 @@
+import numpy as np
+
+
+# ==================== Roaring 點陣圖 ==================== #
+#
+# 文檔ID依高16位分成多個容器，每個容器只保存低16位：
+#   - 元素不超過 ARRAY_LIMIT 個時是排序好的 uint16 陣列；
+#   - 超過時是 65536 位元的點陣 (1024 個 uint64)，固定 8KB。
+# 兩種容器之間的 AND/OR/ANDNOT 都以 NumPy 向量化完成。陣列容器超過 ARRAY_LIMIT
+# 時轉成點陣；點陣結果即使變小也保持點陣，查詢的中間結果很快就會被丟棄，
+# 轉回陣列 (展開 65536 個位元) 反而比點陣運算本身慢。
+
+ARRAY_LIMIT = 4096
+
+
+def _is_bitset(container):
+    return container.dtype == np.uint64
+
+
+def _to_bitset(values):
+    present = np.zeros(1 << 16, dtype=bool)
+    present[values] = True
+    return np.packbits(present, bitorder='little').view(np.uint64)
+
+
+def _to_array(bits):
+    # 以 bool 檢視展開的位元，flatnonzero 比直接處理 uint8 快得多
+    return np.flatnonzero(np.unpackbits(bits.view(np.uint8), bitorder='little').view(bool)).astype(np.uint16)
+
+
+def _cardinality(container):
+    return int(np.bitwise_count(container).sum()) if _is_bitset(container) else container.size
+
+
+def _normalize(container):
+    """過大的陣列容器轉成點陣，空容器返回 None"""
+    if _is_bitset(container):
+        return container if container.any() else None
+    if not container.size:
+        return None
+    return _to_bitset(container) if container.size > ARRAY_LIMIT else container
+
+
+def _contains(bits, values):
+    """values (uint16 陣列) 中哪些在點陣中"""
+    return (bits.view(np.uint8)[values >> 3] >> (values & 7).astype(np.uint8) & 1).view(bool)
+
+
+def _and(left, right):
+    if _is_bitset(left) and _is_bitset(right):
+        return left & right
+    if _is_bitset(left):
+        left, right = right, left
+    if _is_bitset(right):
+        return left[_contains(right, left)]
+    return np.intersect1d(left, right, assume_unique=True)
+
+
+def _or(left, right):
+    if not _is_bitset(left) and not _is_bitset(right):
+        return np.union1d(left, right)
+    if not _is_bitset(left):
+        left = _to_bitset(left)
+    if not _is_bitset(right):
+        right = _to_bitset(right)
+    return left | right
+
+
+def _andnot(left, right):
+    if _is_bitset(left):
+        return left & ~(right if _is_bitset(right) else _to_bitset(right))
+    if _is_bitset(right):
+        return left[~_contains(right, left)]
+    return np.setdiff1d(left, right, assume_unique=True)
+
+
+class RoaringBitmap:
+    """以 Roaring 容器壓縮的文檔ID集合，支援 & (AND)、| (OR) 與 - (ANDNOT)"""
+
+    def __init__(self, containers=None):
+        self.containers = containers if containers is not None else {}  # 高16位 -> 容器
+
+    @classmethod
+    def from_sorted(cls, values):
+        """由遞增且不重複的非負整數建立"""
+        values = np.asarray(values, dtype=np.int64)
+        containers = {}
+        if values.size:
+            highs = values >> 16
+            bounds = np.concatenate(([0], np.flatnonzero(np.diff(highs)) + 1, [values.size]))
+            for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+                lows = (values[start:end] & 0xFFFF).astype(np.uint16)
+                containers[int(highs[start])] = _to_bitset(lows) if lows.size > ARRAY_LIMIT else lows
+        return cls(containers)
+
+    def to_array(self):
+        """遞增排序的 int64 陣列"""
+        parts = [(high << 16) + (_to_array(container) if _is_bitset(container) else container).astype(np.int64)
+                 for high, container in sorted(self.containers.items())]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def _combine(self, other, kernel, keep_left, keep_right):
+        containers = {}
+        for high in self.containers.keys() | other.containers.keys():
+            left, right = self.containers.get(high), other.containers.get(high)
+            if left is None or right is None:
+                # 只有一邊有這個容器：AND 為空，OR 保留那一邊，ANDNOT 只保留左邊
+                result = left if left is not None and keep_left else right if right is not None and keep_right else None
+            else:
+                result = _normalize(kernel(left, right))
+            if result is not None:
+                containers[high] = result
+        return RoaringBitmap(containers)
+
+    def __and__(self, other):
+        return self._combine(other, _and, False, False)
+
+    def __or__(self, other):
+        return self._combine(other, _or, True, True)
+
+    def __sub__(self, other):
+        return self._combine(other, _andnot, True, False)
+
+    def __len__(self):
+        return sum(_cardinality(container) for container in self.containers.values())
+
+    def __bool__(self):
+        return bool(self.containers)
+
+    @property
+    def nbytes(self):
+        return sum(container.nbytes for container in self.containers.values())
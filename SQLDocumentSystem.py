@@ -1,5 +1,4 @@
 import math
-import documents
 import sqlite3
 from datetime import datetime
 
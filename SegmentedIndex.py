@@ -0,0 +1,688 @@
+import itertools
+import math
+import threading
+import numpy as np
+from collections import Counter
+from scipy import sparse
+from Analyzer import analyzer
+from FuzzyTermIndex import FuzzyTermIndex, auto_distance
+from InvertedIndex import InvertedIndex
+from PositionIndex import PositionIndex
+from RoaringBitmap import ARRAY_LIMIT, RoaringBitmap
+from SpellingCorrector import SpellingCorrector
+from TermDictionary import TermDictionary
+
+
+# ==================== 分段索引 ==================== #
+#
+# 索引由多個不可變的段加上一個可變的緩衝區組成 (LSM)：
+#   - 新文檔先寫入緩衝區，緩衝區滿 BUFFER_LIMIT 篇時封存成新的段；
+#   - 刪除已封存段中的文檔只設定該段的刪除標記，段本身不改寫；
+#   - 背景執行緒以分層策略把大小相近的 MERGE_FACTOR 個段合併成一個，
+#     被刪除超過 EXPUNGE_RATIO 的段則單獨重寫，合併時才真正丟棄被刪除的文檔。
+# 查詢在每個段上分別執行再合併結果；IDF、平均長度等統計量以整個語料計算，
+# 分數與單一索引相同。合併完成後才在鎖內替換段列表，查詢一開始就取得自己的
+# 段列表，不會被寫入或合併阻塞。
+#
+# 緩衝區同樣不會被原地修改：寫入時複製一份 (倒排列表在第一次修改時才各自複製)，
+# 在副本上完成分詞與更新後才在鎖內換上。查詢取得的緩衝區視圖指向換上時的版本，
+# 之後的寫入不會改動它，所以寫入與查詢不需要互斥。
+
+BUFFER_LIMIT = 1000
+MERGE_FACTOR = 4
+EXPUNGE_RATIO = 0.5
+FUZZY_EXPANSIONS = 3    # 模糊查詢時每個詞最多展開成幾個詞典中的詞
+MAX_WILDCARD_TERMS = 1024   # 萬用字元最多展開成幾個詞，符合的詞更多時查詢失敗
+
+_EMPTY_IDS = np.zeros(0, dtype=np.int64)
+_EMPTY_SCORES = np.zeros(0)
+_serials = itertools.count()
+
+
+def _top_k(doc_ids, scores, k):
+    """分數最高的 k 篇文檔 (None 表示全部)，返回依分數由高到低排序的 [(分數, 文檔ID)]"""
+    # 只需要前 k 名時先用 argpartition 選出候選，不必排序全部結果
+    if k is not None and k < doc_ids.size:
+        top = np.argpartition(scores, -k)[-k:] if k > 0 else np.arange(0)
+        doc_ids, scores = doc_ids[top], scores[top]
+    # 相同分數時文檔ID大的在前
+    order = np.lexsort((doc_ids, scores))[::-1]
+    return list(zip(scores[order].tolist(), doc_ids[order].tolist()))
+
+
+class Segment:
+    """不可變的索引段
+
+    index 只包含本段文檔的倒排項。刪除的文檔記錄在與 doc_ids 對齊的刪除標記中，
+    BM25 需要扣除的文檔頻率與長度另外累計。TF-IDF 的詞頻矩陣、片語查詢用的位置索引、
+    模糊查詢用的詞索引、拼寫更正用的刪除表與前綴補全用的排序詞典都在第一次用到時才建立。
+    """
+
+    def __init__(self, index, doc_ids, counts=None, positions=None, tokens=None):
+        self.serial = next(_serials)  # 不會重複使用的段編號，id() 在段被回收後可能被新的段沿用
+        self.index = index
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int64)  # 已排序
+        self.counts = counts        # CSC 詞頻矩陣：列對應 doc_ids，欄是全域詞編號
+        self.positions = positions  # PositionIndex
+        self.tokens = tokens        # 緩衝區視圖的 文檔ID -> 詞列表，建立位置索引時不必重新分詞
+        self.bitmaps = {}           # 詞 -> 文檔ID點陣圖，只保存長的倒排列表
+        self.fuzzy = None           # FuzzyTermIndex
+        self.spelling = None        # SpellingCorrector
+        self.terms = None           # TermDictionary
+        self.deleted = np.zeros(self.doc_ids.size, dtype=bool)
+        self.deleted_count = 0
+        self.deleted_df = Counter()
+        self.deleted_length = 0
+        self.deletions = []         # 依序記錄的 (文檔ID, 詞列表)，合併期間用來補上新的刪除
+        self._live_df = (None, None)
+        self._norms = (None, None)
+
+    @property
+    def live_count(self):
+        return self.doc_ids.size - self.deleted_count
+
+    def row_of(self, doc_id):
+        i = int(np.searchsorted(self.doc_ids, doc_id))
+        return i if i < self.doc_ids.size and self.doc_ids[i] == doc_id else None
+
+    def deleted_doc_ids(self):
+        return self.doc_ids[self.deleted] if self.deleted_count else None
+
+    def mark_deleted(self, doc_id, words):
+        row = self.row_of(doc_id)
+        # 查詢不持有鎖，可能正以刪除標記篩選文檔 (NumPy 先數出 True 的個數再複製)，
+        # 所以換上新的陣列而不原地修改
+        deleted = self.deleted.copy()
+        deleted[row] = True
+        self.deleted = deleted
+        self.deleted_count += 1
+        self.deleted_df.update(set(words))
+        self.deleted_length += len(words)
+        self.deletions.append((doc_id, words))
+
+    def live_df(self):
+        """本段未刪除文檔的 TF-IDF 文檔頻率，返回 (已刪除篇數, 文檔頻率)，刪除標記變動時才重新計算
+
+        篇數由同一份刪除標記數出：mark_deleted 先換上標記才遞增 deleted_count，
+        兩者分開讀取可能不一致。
+        """
+        deleted = self.deleted
+        count = int(np.count_nonzero(deleted))
+        live_df = self._live_df
+        if live_df[0] != count:
+            rows = self.counts.indices
+            columns = np.repeat(np.arange(self.counts.shape[1]), np.diff(self.counts.indptr))
+            if count:
+                columns = columns[~deleted[rows]]
+            live_df = (count, np.bincount(columns, minlength=self.counts.shape[1]))
+            self._live_df = live_df
+        return live_df
+
+    def norms(self, idf, version):
+        """以目前的 IDF 計算每篇文檔 TF-IDF 向量的長度，同一統計版本只算一次"""
+        cached_version, norms = self._norms
+        if cached_version != version:
+            columns = np.repeat(np.arange(self.counts.shape[1]), np.diff(self.counts.indptr))
+            weights = (self.counts.data * idf[columns]) ** 2
+            norms = np.sqrt(np.bincount(self.counts.indices, weights=weights, minlength=self.doc_ids.size))
+            self._norms = (version, norms)
+        return norms
+
+
+class SegmentedIndex:
+    """由不可變段與可變緩衝區組成的倒排索引，介面與 InvertedIndex 相同
+
+    text_of 以文檔ID取得內容，沒有位置索引的段第一次片語查詢時使用；已不存在的文檔返回 None。
+    寫入的方法與 InvertedIndex 相同，可以傳入呼叫者已經分好的詞。
+    """
+
+    def __init__(self, base=None, text_of=None):
+        self.segments = (base,) if base is not None else ()
+        self.text_of = text_of
+        self.buffer = InvertedIndex()
+        self.buffer_tokens = {}     # 緩衝區文檔ID -> 詞列表，封存時建立位置索引
+        self.vocabulary = {}        # TF-IDF 詞 -> 全域詞編號，只增不減
+        self.version = 0            # 每次增刪文檔遞增，用來判斷緩衝區視圖是否過期
+        self.lock = threading.Lock()        # 保護段列表與緩衝區的替換，只在換上時短暫持有
+        self.write_lock = threading.Lock()  # 寫入依序進行
+        self.counts_lock = threading.Lock()
+        self.merge_thread = None
+        self._buffer_view = (None, None)
+        self._statistics = (None,)
+
+    @staticmethod
+    def tokenize(doc_text):
+        return InvertedIndex.tokenize(doc_text)
+
+    # ==================== 寫入 ==================== #
+
+    def add_document(self, doc_id, doc_text, words=None):
+        self.add_documents({doc_id: doc_text}, {doc_id: words} if words is not None else None)
+
+    def add_documents(self, documents_dict, tokens=None):
+        """把文檔加入緩衝區的副本後換上，緩衝區滿了就封存成新的段"""
+        if tokens is None:
+            tokens = {doc_id: self.tokenize(doc_text) for doc_id, doc_text in documents_dict.items()}
+        with self.write_lock:
+            buffer, buffer_tokens = self.buffer.copy(), dict(self.buffer_tokens)
+            buffer.add_documents(documents_dict, tokens)
+            buffer_tokens.update((doc_id, tokens[doc_id]) for doc_id in documents_dict)
+            # 要封存的段在換上之前就建好位置索引，不佔用 self.lock
+            sealed = self._sealed(buffer, buffer_tokens) if len(buffer_tokens) >= BUFFER_LIMIT else None
+            with self.lock:
+                self.buffer, self.buffer_tokens = buffer, buffer_tokens
+                self.version += 1
+                if sealed is not None:
+                    self._seal(sealed)
+                    self._schedule_merge()
+
+    def remove_document(self, doc_id, doc_text, words=None):
+        """緩衝區中的文檔由副本移除後換上，已封存段中的文檔只設定刪除標記"""
+        if words is None:
+            words = self.tokenize(doc_text)
+        with self.write_lock:
+            if doc_id in self.buffer_tokens:
+                buffer, buffer_tokens = self.buffer.copy(), dict(self.buffer_tokens)
+                buffer.remove_document(doc_id, doc_text, words)
+                del buffer_tokens[doc_id]
+                with self.lock:
+                    self.buffer, self.buffer_tokens = buffer, buffer_tokens
+                    self.version += 1
+                return
+            with self.lock:
+                segment = next((segment for segment in self.segments if segment.row_of(doc_id) is not None), None)
+                if segment is None or segment.deleted[segment.row_of(doc_id)]:
+                    return
+                segment.mark_deleted(doc_id, words)
+                if segment.deleted_count > EXPUNGE_RATIO * segment.doc_ids.size:
+                    self._schedule_merge()
+                self.version += 1
+
+    def reset(self, base=None):
+        """捨棄所有段與緩衝區，改以 base 為唯一的段；重新載入索引時使用，進行中的查詢仍使用原本的段"""
+        with self.write_lock, self.lock:
+            self.segments = (base,) if base is not None else ()
+            self.buffer = InvertedIndex()
+            self.buffer_tokens = {}
+            self.version += 1
+
+    @staticmethod
+    def _sealed(buffer, buffer_tokens):
+        """由緩衝區建立封存的段，位置索引直接由寫入時分好的詞建立"""
+        doc_ids = sorted(buffer_tokens)
+        return Segment(buffer, doc_ids, positions=PositionIndex.build(
+            (doc_id, buffer_tokens[doc_id]) for doc_id in doc_ids))
+
+    def _seal(self, segment):
+        # 呼叫者持有 self.lock
+        self.segments += (segment,)
+        self.buffer = InvertedIndex()
+        self.buffer_tokens = {}
+
+    # ==================== 背景合併 ==================== #
+
+    @staticmethod
+    def _tier(segment):
+        return int(math.log(max(segment.live_count, 1) / BUFFER_LIMIT, MERGE_FACTOR)) \
+            if segment.live_count > BUFFER_LIMIT else 0
+
+    def _merge_candidates(self):
+        """分層策略：同一層累積 MERGE_FACTOR 個段就合併；刪除過多的段單獨重寫"""
+        tiers = {}
+        for segment in self.segments:
+            if segment.deleted_count > EXPUNGE_RATIO * segment.doc_ids.size:
+                return [segment]
+            tiers.setdefault(self._tier(segment), []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= MERGE_FACTOR:
+                return tiers[tier][:MERGE_FACTOR]
+        return None
+
+    def _schedule_merge(self):
+        # 呼叫者持有 self.lock
+        if self.merge_thread is None:
+            self.merge_thread = threading.Thread(target=self._merge_loop, daemon=True)
+            self.merge_thread.start()
+
+    def _merge_loop(self):
+        while True:
+            with self.lock:
+                sources = self._merge_candidates()
+                if sources is None:
+                    self.merge_thread = None
+                    return
+                snapshot = self._snapshot(sources)
+            try:
+                self._replace(snapshot, self._merge(sources, snapshot[2]))
+            except Exception as e:
+                print(f"Error merging segments: {str(e)}")
+                with self.lock:
+                    self.merge_thread = None
+                return
+
+    @staticmethod
+    def _snapshot(sources):
+        # 呼叫者持有 self.lock；記下合併開始時的刪除標記
+        return (sources, [len(segment.deletions) for segment in sources],
+                [segment.deleted_doc_ids() for segment in sources])
+
+    def _replace(self, snapshot, merged):
+        """以合併後的段替換來源段；來源已被其他合併替換時放棄這次結果"""
+        sources, positions, _ = snapshot
+        with self.lock:
+            if any(segment not in self.segments for segment in sources):
+                return False
+            # 合併期間新增的刪除補到合併後的段上
+            for segment, position in zip(sources, positions):
+                for doc_id, words in segment.deletions[position:]:
+                    merged.mark_deleted(doc_id, words)
+            remaining = tuple(segment for segment in self.segments if segment not in sources)
+            self.segments = remaining + (merged,) if merged.doc_ids.size else remaining
+            return True
+
+    def wait_for_merges(self):
+        """等待背景合併完成"""
+        thread = self.merge_thread
+        while thread is not None:
+            thread.join()
+            thread = self.merge_thread
+
+    def _merge(self, sources, deleted):
+        """把多個段合併成一個新的段，丟棄 deleted 中的文檔"""
+        deleted_ids = np.concatenate([ids for ids in deleted if ids is not None] or [_EMPTY_IDS])
+        index = InvertedIndex.merged([segment.index for segment in sources], deleted_ids.tolist())
+
+        doc_ids = []
+        for segment, dead in zip(sources, deleted):
+            live = ~np.isin(segment.doc_ids, dead) if dead is not None else slice(None)
+            doc_ids.append((segment, live, segment.doc_ids[live]))
+        merged_ids = np.concatenate([ids for _, _, ids in doc_ids])
+        order = np.argsort(merged_ids)
+
+        # 來源都有位置索引時直接合併，否則合併後的段同樣等到查詢時才建立
+        positions = None
+        if all(segment.positions is not None for segment in sources):
+            positions = PositionIndex.merged([segment.positions for segment in sources], deleted_ids.tolist())
+        if any(segment.counts is None for segment in sources):
+            # 還沒有建立詞頻矩陣的段不在背景建立，合併後的段同樣等到查詢時才建立
+            return Segment(index, merged_ids[order], positions=positions)
+        columns = max(segment.counts.shape[1] for segment in sources)
+        matrices = []
+        for segment, live, _ in doc_ids:
+            counts = segment.counts.tocsr()[live]
+            matrices.append(sparse.csr_matrix((counts.data, counts.indices, counts.indptr),
+                                              shape=(counts.shape[0], columns)))
+        counts = sparse.vstack(matrices, format='csr')[order].tocsc()
+        return Segment(index, merged_ids[order], counts=counts, positions=positions)
+
+    def merge_all(self):
+        """把緩衝區與所有段合併成一個段並返回它，日誌壓縮時連同位置索引寫成索引段"""
+        while True:
+            with self.write_lock:
+                sealed = self._sealed(self.buffer, self.buffer_tokens) if self.buffer_tokens else None
+                with self.lock:
+                    if sealed is not None:
+                        self._seal(sealed)
+                    if not self.segments:
+                        return Segment(InvertedIndex(), _EMPTY_IDS, positions=PositionIndex.build([]))
+                    snapshot = self._snapshot(self.segments)
+            for segment in snapshot[0]:
+                self.positions_of(segment)
+            merged = self._merge(snapshot[0], snapshot[2])
+            if self._replace(snapshot, merged):
+                return merged
+
+    # ==================== 查詢時的段列表 ==================== #
+
+    def parts(self):
+        """查詢使用的段列表：所有已封存的段，加上緩衝區目前版本的視圖"""
+        with self.lock:
+            segments = self.segments
+            if not self.buffer_tokens:
+                return segments
+            if self._buffer_view[0] != self.version:
+                self._buffer_view = (self.version, Segment(self.buffer, sorted(self.buffer_tokens),
+                                                           tokens=self.buffer_tokens))
+            return segments + (self._buffer_view[1],)
+
+    def _counts(self, segment):
+        """取得段的 TF-IDF 詞頻矩陣，第一次使用時才建立
+
+        索引與 TF-IDF 使用同一個分析器，倒排項的詞頻就是詞頻矩陣的內容，
+        直接由倒排列表解碼，不必重新讀取與分詞文檔。
+        """
+        with self.counts_lock:
+            if segment.counts is None:
+                words, terms, doc_ids, tfs = segment.index.postings.decode_all()
+                columns = np.array([self.vocabulary.setdefault(word, len(self.vocabulary)) for word in words],
+                                   dtype=np.int64)
+                # 緩衝區的視圖與緩衝區共用倒排列表，只取視圖建立時已有的文檔
+                rows = np.minimum(np.searchsorted(segment.doc_ids, doc_ids), max(segment.doc_ids.size - 1, 0))
+                keep = segment.doc_ids[rows] == doc_ids if segment.doc_ids.size else np.zeros(doc_ids.size, dtype=bool)
+                rows, terms, tfs = rows[keep], terms[keep], tfs[keep]
+                matrix = sparse.csc_matrix((tfs.astype(np.float64), (rows, columns[terms])),
+                                           shape=(segment.doc_ids.size, len(self.vocabulary)))
+                matrix.sort_indices()
+                segment.counts = matrix
+            return segment.counts
+
+    def bitmap_of(self, segment, word):
+        """詞在段中的文檔點陣圖 (包含已刪除的文檔)；長的倒排列表轉換一次後留在段上重複使用"""
+        bitmap = segment.bitmaps.get(word)
+        if bitmap is None:
+            postings = segment.index.postings.get(word)
+            bitmap = RoaringBitmap.from_sorted(postings.doc_ids() if postings is not None else ())
+            if postings is not None and len(postings) > ARRAY_LIMIT:
+                segment.bitmaps[word] = bitmap
+        return bitmap
+
+    def positions_of(self, segment):
+        """取得段的位置索引
+
+        從索引段載入的段、封存與合併出的段已經帶有位置索引；緩衝區視圖由寫入時分好的詞建立，
+        其他段第一次使用時才讀取文檔內容分詞。建立時不持有 counts_lock，不會擋住其他段的查詢；
+        同時建立的只保留先完成的一份。
+        """
+        positions = segment.positions
+        if positions is None:
+            doc_ids = segment.doc_ids.tolist()
+            if segment.tokens is not None:
+                documents = ((doc_id, segment.tokens[doc_id]) for doc_id in doc_ids)
+            else:
+                documents = ((doc_id, self.tokenize(self.text_of(doc_id) or '')) for doc_id in doc_ids)
+            positions = PositionIndex.build(documents)
+            with self.counts_lock:
+                if segment.positions is None:
+                    segment.positions = positions
+                positions = segment.positions
+        return positions
+
+    # ==================== 模糊查詢 ==================== #
+
+    def fuzzy_index_of(self, segment):
+        """取得段的模糊詞索引，第一次使用時才由段的詞典建立"""
+        with self.counts_lock:
+            if segment.fuzzy is None:
+                segment.fuzzy = FuzzyTermIndex(segment.index.postings)
+            return segment.fuzzy
+
+    def fuzzy_terms(self, word, distance=None, limit=FUZZY_EXPANSIONS):
+        """詞典中與 word 編輯距離不超過 distance (None 依詞長決定) 的詞
+
+        依距離由近到遠、文檔頻率由高到低排序，最多 limit 個；word 本身在詞典中時排在最前面。
+        """
+        if distance is None:
+            distance = auto_distance(word)
+        found = {}
+        for part in self.parts():
+            for term, term_distance in self.fuzzy_index_of(part).search(word, distance):
+                found[term] = min(term_distance, found.get(term, distance))
+        ranked = sorted(((term_distance, -self.df(term), term) for term, term_distance in found.items()))
+        return [term for _, df, term in ranked if df < 0][:limit]
+
+    def expand_fuzzy(self, query, distance=None, limit=FUZZY_EXPANSIONS):
+        """把查詢的每個詞換成詞典中最接近的詞，返回展開後的詞列表；找不到相近的詞時保留原詞"""
+        return [term for word in self.tokenize(query)
+                for term in (self.fuzzy_terms(word, distance, limit) or [word])]
+
+    # ==================== 拼寫更正 ==================== #
+    # 查詢詞不在詞典中時，以各段的對稱刪除表找出最接近的詞；先找編輯距離 1 的詞，
+    # 沒有時才放寬，同樣距離時取文檔頻率最高的。
+
+    def spelling_of(self, segment):
+        """取得段的拼寫更正刪除表，第一次使用時才由段的詞典建立"""
+        with self.counts_lock:
+            if segment.spelling is None:
+                segment.spelling = SpellingCorrector(segment.index.postings)
+            return segment.spelling
+
+    def correct(self, word, distance=None):
+        """詞典中最接近 word 的詞，編輯距離最多 distance (None 依詞長決定)；找不到時返回 None"""
+        if distance is None:
+            distance = auto_distance(word)
+        parts = self.parts()
+        for allowed in range(1, distance + 1):
+            found = {term for part in parts for term, _ in self.spelling_of(part).lookup(word, allowed)}
+            ranked = sorted((-self.df(term), term) for term in found)
+            if ranked and ranked[0][0] < 0:
+                return ranked[0][1]
+        return None
+
+    def did_you_mean(self, query):
+        """把查詢中不在詞典裡的詞換成最接近的詞；沒有可更正的詞時返回 None"""
+        words = self.tokenize(query)
+        corrected = [word if self.df(word) > 0 else self.correct(word) or word for word in words]
+        return ' '.join(corrected) if corrected != words else None
+
+    # ==================== 前綴補全與萬用字元 ==================== #
+    # 每個段的詞典以排序、前綴壓縮的 TermDictionary 保存，權重是段內的文檔頻率；
+    # 各段先取出自己的前幾名，再以整個語料的文檔頻率排序合併，不必逐一檢查所有詞。
+    # 不在任何一段前幾名中的詞，文檔頻率不超過各段最後一名的權重之和；第 limit 名
+    # 還低於這個上限時加倍各段取出的數量重來 (threshold algorithm)。
+
+    def term_dictionary_of(self, segment):
+        """取得段的排序詞典，第一次使用時才由段的倒排列表建立"""
+        with self.counts_lock:
+            if segment.terms is None:
+                postings = segment.index.postings
+                words = list(postings)
+                segment.terms = TermDictionary(words, [len(postings[word]) for word in words])
+            return segment.terms
+
+    def _top_terms(self, search, limit):
+        """search(詞典, n) 返回一段中權重最高的 n 個 [(詞, 權重)]；合併成整個語料的前 limit 名"""
+        dictionaries = [self.term_dictionary_of(part) for part in self.parts()]
+        fetch = limit
+        while True:
+            lists = [search(dictionary, fetch) for dictionary in dictionaries]
+            found = {term for entries in lists for term, _ in entries}
+            ranked = sorted((-self.df(term), term) for term in found)
+            ranked = [(term, -df) for df, term in ranked if df < 0][:limit]
+            # 還有沒取完的段時，未出現的詞最多可能有的文檔頻率
+            bound = sum(entries[-1][1] for entries in lists if entries and len(entries) == fetch)
+            if not bound or (limit is not None and len(ranked) == limit and ranked[-1][1] >= bound):
+                return ranked
+            fetch *= 2
+
+    def complete(self, prefix, limit=10):
+        """以 prefix 開頭、文檔頻率最高的 limit 個詞，返回 [(詞, 文檔頻率)]"""
+        return self._top_terms(lambda dictionary, n: dictionary.complete(prefix, n), limit)
+
+    def wildcard_terms(self, pattern, limit=MAX_WILDCARD_TERMS):
+        """符合萬用字元 pattern (* 任意長度、? 一個字元) 的詞，文檔頻率高的在前
+
+        符合的詞超過 limit 個時引發 ValueError，不會只以其中一部分求值而漏掉文檔。
+        """
+        terms = self._top_terms(lambda dictionary, n: dictionary.match(pattern, n),
+                                limit + 1 if limit is not None else None)
+        if limit is not None and len(terms) > limit:
+            raise ValueError(f'pattern too broad: {pattern} matches more than {limit} terms')
+        return [term for term, _ in terms]
+
+    # ==================== 語料統計 ==================== #
+
+    # 以 parts() 取得的同一份段列表計算，不會在緩衝區封存的前後各算到一半
+
+    @property
+    def doc_count(self):
+        return sum(part.index.doc_count - part.deleted_count for part in self.parts())
+
+    @property
+    def total_length(self):
+        return sum(part.index.total_length - part.deleted_length for part in self.parts())
+
+    @property
+    def average_length(self):
+        return self.total_length / self.doc_count if self.doc_count else 0
+
+    def df(self, word):
+        return sum(len(part.index.postings[word]) - part.deleted_df[word]
+                   for part in self.parts() if word in part.index.postings)
+
+    def idf(self, word):
+        df = self.df(word)
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def _tfidf_statistics(self, parts, collection=None):
+        """整個語料的 TF-IDF 文檔頻率與平滑 IDF，與 TfidfVectorizer 的定義相同
+
+        collection 提供本索引之外的語料統計 (df 與 doc_count)，例如分片搜索中
+        整個語料的統計；預設以本索引的段計算。返回 (key, df, idf, documents)，
+        key 與統計量來自同一份快照，用來快取文檔長度；其他執行緒可能隨時換上
+        新的統計量，所以不能事後再讀 self._statistics。
+        """
+        live = [part.live_df() for part in parts]
+        key = (tuple((part.serial, count) for part, (count, _) in zip(parts, live)),
+               None if collection is None else collection.version)
+        statistics = self._statistics
+        if statistics[0] != key:
+            if collection is None:
+                df = np.zeros(len(self.vocabulary), dtype=np.int64)
+                for _, live_df in live:
+                    df[:live_df.size] += live_df
+                documents = sum(part.doc_ids.size - count for part, (count, _) in zip(parts, live))
+            else:
+                df = np.array([collection.df.get(word, 0) for word in self.vocabulary], dtype=np.int64)
+                documents = collection.doc_count
+            idf = np.log((1 + documents) / (1 + df)) + 1
+            statistics = (key, df, idf, documents)
+            self._statistics = statistics
+        return statistics
+
+    # ==================== BM25 ==================== #
+
+    def bm25_scores(self, words, k1=1.2, b=0.75, collection=None):
+        if collection is None:
+            collection = self
+        scores = {}
+        for part in self.parts():
+            scores.update(part.index.bm25_scores(words, k1, b, collection=collection,
+                                                 exclude=part.deleted_doc_ids()))
+        return scores
+
+    def bm25_top_k(self, words, k, k1=1.2, b=0.75, collection=None):
+        if collection is None:
+            collection = self
+        ranked = []
+        for part in self.parts():
+            ranked.extend(part.index.bm25_top_k(words, k, k1, b, collection=collection,
+                                                exclude=part.deleted_doc_ids()))
+        return sorted(ranked, reverse=True)[:k]
+
+    # ==================== TF-IDF ==================== #
+
+    def tfidf_scores(self, query, collection=None):
+        """與查詢的餘弦相似度大於0的文檔，返回 (文檔ID陣列, 分數陣列)"""
+        parts = self.parts()
+        for part in parts:
+            self._counts(part)
+        key, df, idf, documents = self._tfidf_statistics(parts, collection)
+        columns, weights = self._query_vector(query, df, documents, collection)
+        if columns.size == 0:
+            return _EMPTY_IDS, _EMPTY_SCORES
+
+        doc_ids, scores = [], []
+        for part in parts:
+            inside = columns < part.counts.shape[1]
+            if not inside.any():
+                continue
+            dots = part.counts[:, columns[inside]] @ (weights[inside] * idf[columns[inside]])
+            norms = part.norms(idf, key)
+            similarity = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+            if part.deleted_count:
+                similarity[part.deleted] = 0
+            hits = np.flatnonzero(similarity > 0)
+            doc_ids.append(part.doc_ids[hits])
+            scores.append(similarity[hits])
+        if not doc_ids:
+            return _EMPTY_IDS, _EMPTY_SCORES
+        return np.concatenate(doc_ids), np.concatenate(scores)
+
+    def tfidf_top_k(self, query, k=None, collection=None):
+        """相似度最高的 k 篇文檔 (None 表示全部)，返回依分數由高到低排序的 [(分數, 文檔ID)]
+
+        與 bm25_top_k 不同，這裡沒有提前終止：先算出所有文檔的相似度再選出前 k 名。
+        """
+        return _top_k(*self.tfidf_scores(query, collection), k)
+
+    def tfidf_top_k_batch(self, queries, k=None, collection=None):
+        """一次為多個查詢評分，返回與 queries 對齊的 tfidf_top_k 結果
+
+        所有查詢組成一個稀疏矩陣，與每個段的詞頻矩陣只做一次稀疏矩陣乘法。
+        """
+        parts = self.parts()
+        for part in parts:
+            self._counts(part)
+        key, df, idf, documents = self._tfidf_statistics(parts, collection)
+
+        # 每列是正規化後的查詢向量再乘上 IDF，與詞頻矩陣相乘即得未除以文檔長度的點積
+        indptr, indices, data = [0], [], []
+        for query in queries:
+            columns, weights = self._query_vector(query, df, documents, collection)
+            indices.extend(columns.tolist())
+            data.extend((weights * idf[columns]).tolist())
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), indptr),
+                                   shape=(len(queries), df.size))
+
+        doc_ids, similarities = [], []
+        for part in parts:
+            dots = (matrix[:, :part.counts.shape[1]] @ part.counts.T).tocsr()  # 查詢 x 文檔
+            norms = part.norms(idf, key)
+            # 與查詢有共同詞的文檔長度一定大於0
+            dots.data /= norms[dots.indices]
+            if part.deleted_count:
+                dots.data[part.deleted[dots.indices]] = 0
+                dots.eliminate_zeros()
+            doc_ids.append(part.doc_ids)
+            similarities.append(dots)
+        if not doc_ids:
+            return [[] for _ in queries]
+        doc_ids = np.concatenate(doc_ids)
+        similarities = sparse.hstack(similarities, format='csr')
+
+        results = []
+        for i in range(len(queries)):
+            row = slice(similarities.indptr[i], similarities.indptr[i + 1])
+            results.append(_top_k(doc_ids[similarities.indices[row]], similarities.data[row], k))
+        return results
+
+    def _query_vector(self, query, df, documents, collection):
+        """查詢的 TF-IDF 向量，返回本索引中的 (全域詞編號陣列, 正規化後的權重陣列)"""
+        query_counts = Counter(analyzer(query))
+        columns = np.array([self.vocabulary.get(word, -1) for word in query_counts], dtype=np.int64)
+        if collection is None:
+            term_df = [df[column] if 0 <= column < df.size else 0 for column in columns]
+        else:
+            # 只出現在其他分片的詞不會命中本索引的文檔，但仍然計入查詢向量的長度
+            term_df = [collection.df.get(word, 0) for word in query_counts]
+        term_df = np.array(term_df, dtype=np.float64)
+        known = term_df > 0
+        if not known.any():
+            return columns[:0], _EMPTY_SCORES
+        weights = np.array(list(query_counts.values()), dtype=np.float64) * (np.log((1 + documents) / (1 + term_df)) + 1)
+        weights[~known] = 0
+        weights /= np.linalg.norm(weights)
+        local = known & (columns >= 0)
+        return columns[local], weights[local]
+
+    def tfidf_scores_for(self, query, doc_ids):
+        """只取出指定文檔的相似度，順序與 doc_ids 相同"""
+        hits, scores = self.tfidf_scores(query)
+        found = dict(zip(hits.tolist(), scores.tolist()))
+        return np.array([found.get(doc_id, 0.0) for doc_id in doc_ids])
+
+    # 讓索引可以像原本的 dict 一樣判斷詞是否存在、列出所有詞
+    def __contains__(self, word):
+        return self.df(word) > 0
+
+    def __iter__(self):
+        seen = set()
+        for part in self.parts():
+            for word in part.index:
+                if word not in seen and self.df(word) > 0:
+                    seen.add(word)
+                    yield word
+
+    def __len__(self):
+        return sum(1 for _ in self)
@@ -0,0 +1,245 @@
+import math
+import multiprocessing
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from InvertedIndex import InvertedIndex
+from SegmentedIndex import Segment, SegmentedIndex
+
+
+# ==================== 分片搜索 ==================== #
+#
+# 語料依文檔ID分成多個分片 (doc_id % 分片數)，每個分片由一個獨立的行程持有
+# 自己的分段索引，評分不受單一行程 GIL 的限制。協調者把查詢送到所有分片，
+# 收集各分片的前 k 名後合併。
+#
+# 各分片以整個語料的統計量評分，分數與單一索引完全相同：啟動時各分片回報
+# 自己的統計量，協調者加總後發給所有分片；之後每次增刪文檔，協調者把這批
+# 文檔造成的統計量變化連同文檔一起廣播，各分片依序套用。同一個分片的請求
+# 依送出順序處理，寫入完成之後送出的查詢一定看得到這次寫入。
+
+
+class CollectionStatistics:
+    """整個語料的統計量，介面與 SegmentedIndex 的 idf()/average_length 相同
+
+    BM25 與 TF-IDF 使用同一個分析器，兩者共用 df。
+    """
+
+    def __init__(self):
+        self.doc_count = 0
+        self.total_length = 0
+        self.df = Counter()         # 詞 -> 文檔頻率
+        self.version = 0            # 每次更新遞增，分片以此判斷 TF-IDF 統計是否過期
+
+    @classmethod
+    def of(cls, token_lists):
+        """一批文檔的統計量，token_lists 是每篇文檔分好的詞列表"""
+        statistics = cls()
+        for words in token_lists:
+            statistics.doc_count += 1
+            statistics.total_length += len(words)
+            statistics.df.update(set(words))
+        return statistics
+
+    def update(self, other, sign=1):
+        """加上 (sign=1) 或扣除 (sign=-1) 另一批文檔的統計量"""
+        self.doc_count += sign * other.doc_count
+        self.total_length += sign * other.total_length
+        if sign > 0:
+            self.df.update(other.df)
+        else:
+            self.df.subtract(other.df)
+        self.version += 1
+
+    @property
+    def average_length(self):
+        return self.total_length / self.doc_count if self.doc_count else 0
+
+    def idf(self, word):
+        df = self.df.get(word, 0)
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+
+# ==================== 分片行程 ==================== #
+
+def _serve(connection, documents_dict):
+    """分片行程的主迴圈：建立本分片的索引，依序處理 (請求ID, 方法, 參數)"""
+    texts = dict(documents_dict)
+    tokens = {doc_id: InvertedIndex.tokenize(text) for doc_id, text in texts.items()}
+    base = Segment(InvertedIndex(texts, tokens), sorted(texts)) if texts else None
+    index = SegmentedIndex(base, texts.get)
+    connection.send(CollectionStatistics.of(tokens.values()))
+    del tokens  # 分好的詞只在建立索引時使用
+    collection = CollectionStatistics()
+
+    def set_statistics(statistics):
+        nonlocal collection
+        collection = statistics
+
+    def add(documents, tokens, delta):
+        if documents:
+            texts.update(documents)
+            index.add_documents(documents, tokens)
+        collection.update(delta)
+
+    def remove(doc_id, text, words, delta):
+        if doc_id is not None:
+            del texts[doc_id]
+            index.remove_document(doc_id, text, words)
+        collection.update(delta, -1)
+
+    methods = {
+        'statistics': set_statistics,
+        'add': add,
+        'remove': remove,
+        'bm25_scores': lambda words, k1, b: index.bm25_scores(words, k1, b, collection),
+        'bm25_top_k': lambda words, k, k1, b: index.bm25_top_k(words, k, k1, b, collection),
+        'tfidf_top_k': lambda query, k: index.tfidf_top_k(query, k, collection),
+        'tfidf_top_k_batch': lambda queries, k: index.tfidf_top_k_batch(queries, k, collection),
+    }
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        request_id, method, args = request
+        try:
+            connection.send((request_id, True, methods[method](*args)))
+        except Exception as e:
+            connection.send((request_id, False, e))
+    connection.close()
+
+
+class _Shard:
+    """協調者這一端的分片：送出請求並由背景執行緒把回應交給對應的 Future"""
+
+    def __init__(self, context, documents_dict):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child, documents_dict), daemon=True)
+        self.process.start()
+        child.close()
+        self.pending = {}       # 請求ID -> Future
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        """等待分片建立索引，返回它的統計量，之後開始接收回應"""
+        statistics = self.connection.recv()
+        threading.Thread(target=self._receive, daemon=True).start()
+        return statistics
+
+    def call(self, method, *args):
+        future = Future()
+        with self.lock:
+            request_id = self.next_id
+            self.next_id += 1
+            self.pending[request_id] = future
+            self.connection.send((request_id, method, args))
+        return future
+
+    def _receive(self):
+        while True:
+            try:
+                request_id, ok, result = self.connection.recv()
+            except (EOFError, OSError):
+                with self.lock:
+                    pending, self.pending = self.pending, {}
+                for future in pending.values():
+                    future.set_exception(RuntimeError('search shard exited'))
+                return
+            with self.lock:
+                future = self.pending.pop(request_id)
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def close(self):
+        with self.lock:
+            self.connection.send(None)
+        self.process.join()
+
+
+class ShardedSearch:
+    """分片搜索的協調者，查詢介面與 SegmentedIndex 相同
+
+    寫入之間由呼叫者依序進行；寫入可以與查詢同時進行，這時查詢可能只在部分分片
+    看到這次寫入，該次查詢的統計量與分數會與寫入前或寫入後略有差異。
+    """
+
+    def __init__(self, documents_dict, shard_count):
+        # 分片行程以 spawn 啟動，不會複製呼叫者的執行緒與已開啟的檔案
+        context = multiprocessing.get_context('spawn')
+        partitions = [{} for _ in range(shard_count)]
+        for doc_id, text in documents_dict.items():
+            partitions[doc_id % shard_count][doc_id] = text
+        self.shards = [_Shard(context, partition) for partition in partitions]
+        self.collection = CollectionStatistics()
+        for shard in self.shards:
+            self.collection.update(shard.start())
+        self._gather('statistics', self.collection)
+
+    tokenize = staticmethod(InvertedIndex.tokenize)
+
+    def _gather(self, method, *args):
+        futures = [shard.call(method, *args) for shard in self.shards]
+        return [future.result() for future in futures]
+
+    # ==================== 寫入 ==================== #
+
+    def add_documents(self, documents_dict, tokens=None):
+        """把文檔連同分好的詞送到各自的分片，並把統計量的變化廣播給所有分片"""
+        if tokens is None:
+            tokens = {doc_id: self.tokenize(text) for doc_id, text in documents_dict.items()}
+        delta = CollectionStatistics.of(tokens[doc_id] for doc_id in documents_dict)
+        partitions = [({}, {}) for _ in self.shards]
+        for doc_id, text in documents_dict.items():
+            texts, words = partitions[doc_id % len(self.shards)]
+            texts[doc_id] = text
+            words[doc_id] = tokens[doc_id]
+        futures = [shard.call('add', texts, words, delta) for shard, (texts, words) in zip(self.shards, partitions)]
+        for future in futures:
+            future.result()
+        self.collection.update(delta)
+
+    def add_document(self, doc_id, doc_text, words=None):
+        self.add_documents({doc_id: doc_text}, {doc_id: words} if words is not None else None)
+
+    def remove_document(self, doc_id, doc_text, words=None):
+        if words is None:
+            words = self.tokenize(doc_text)
+        delta = CollectionStatistics.of([words])
+        owner = doc_id % len(self.shards)
+        # 其他分片只需要統計量的變化
+        futures = [shard.call('remove', *((doc_id, doc_text, words) if i == owner else (None, None, None)), delta)
+                   for i, shard in enumerate(self.shards)]
+        for future in futures:
+            future.result()
+        self.collection.update(delta, -1)
+
+    # ==================== 查詢 ==================== #
+
+    def bm25_scores(self, words, k1=1.2, b=0.75):
+        scores = {}
+        for shard_scores in self._gather('bm25_scores', words, k1, b):
+            scores.update(shard_scores)
+        return scores
+
+    def bm25_top_k(self, words, k, k1=1.2, b=0.75):
+        ranked = [hit for hits in self._gather('bm25_top_k', words, k, k1, b) for hit in hits]
+        return sorted(ranked, reverse=True)[:k]
+
+    def tfidf_top_k(self, query, k=None):
+        ranked = [hit for hits in self._gather('tfidf_top_k', query, k) for hit in hits]
+        ranked.sort(reverse=True)
+        return ranked if k is None else ranked[:max(k, 0)]
+
+    def tfidf_top_k_batch(self, queries, k=None):
+        results = []
+        for shard_hits in zip(*self._gather('tfidf_top_k_batch', queries, k)):
+            ranked = sorted((hit for hits in shard_hits for hit in hits), reverse=True)
+            results.append(ranked if k is None else ranked[:max(k, 0)])
+        return results
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
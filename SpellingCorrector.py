@@ -0,0 +1,66 @@
+import numpy as np
+from rapidfuzz import process
+from rapidfuzz.distance import OSA
+
+
+# ==================== 拼寫更正 ==================== #
+#
+# 對稱刪除 (SymSpell)：建立時為詞典中每個詞的前 PREFIX_LENGTH 個字元產生刪去最多
+# MAX_DISTANCE 個字元的所有變形；查詢時同樣產生查詢詞的刪除變形，兩邊有共同變形的詞
+# 就是候選，再以 RapidFuzz 確認真正的編輯距離 (相鄰字元對調算一次編輯)。
+# 查詢只需要查表，不必計算詞典中每個詞的編輯距離。
+#
+# 只取前綴可以大幅減少變形的數量，長詞的候選仍然一定會被找到 (前綴的編輯距離不會
+# 大於整個詞的)。變形以雜湊值保存在排序的陣列中，雜湊碰撞只會多出候選，不影響結果。
+
+MAX_DISTANCE = 2
+PREFIX_LENGTH = 7
+
+
+def _deletes(word, distance):
+    """刪去最多 distance 個字元得到的所有字串 (含原字串)"""
+    found = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {text[:i] + text[i + 1:] for text in frontier for i in range(len(text))}
+        found |= frontier
+    return found
+
+
+class SpellingCorrector:
+    """詞典的對稱刪除表，找出與查詢詞編輯距離不超過 k (k <= MAX_DISTANCE) 的詞"""
+
+    def __init__(self, words):
+        self.words = list(words)
+        hashes, terms = [], []
+        for term, word in enumerate(self.words):
+            variants = _deletes(word[:PREFIX_LENGTH], MAX_DISTANCE)
+            hashes.extend(hash(variant) for variant in variants)
+            terms.extend([term] * len(variants))
+        hashes = np.array(hashes, dtype=np.int64)
+        order = np.argsort(hashes, kind='stable')
+        self.hashes = hashes[order]
+        self.terms = np.array(terms, dtype=np.int32)[order]
+
+    def candidates(self, word, distance):
+        """與 word 有共同刪除變形的詞編號陣列"""
+        keys = np.array([hash(variant) for variant in _deletes(word[:PREFIX_LENGTH], distance)], dtype=np.int64)
+        starts = np.searchsorted(self.hashes, keys, side='left')
+        counts = np.searchsorted(self.hashes, keys, side='right') - starts
+        total = int(counts.sum())
+        if not total:
+            return np.zeros(0, dtype=np.int32)
+        # 把各段 [start, start + count) 的位置接成一個陣列，一次取出
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+        return np.unique(self.terms[offsets])
+
+    def lookup(self, word, distance):
+        """編輯距離不超過 distance 的詞，返回 [(詞, 距離)]"""
+        distance = min(distance, MAX_DISTANCE)
+        choices = [self.words[term] for term in self.candidates(word, distance).tolist()]
+        matches = process.extract(word, choices, scorer=OSA.distance, score_cutoff=distance, limit=None)
+        return [(choice, score) for choice, score, _ in matches]
+
+    @property
+    def nbytes(self):
+        return self.hashes.nbytes + self.terms.nbytes
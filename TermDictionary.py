@@ -0,0 +1,141 @@
+import bisect
+import os
+import re
+import numpy as np
+
+
+# ==================== 排序詞典 ==================== #
+#
+# 詞依序每 BLOCK_SIZE 個一塊，每塊的第一個詞完整保存，其餘的詞只保存與前一個詞的
+# 共同前綴長度與剩下的後綴 (front coding)，整塊編碼成一個字串。查詞時先以二分搜尋
+# 找到塊，再依序解碼塊內最多 BLOCK_SIZE 個詞。
+#
+# 前綴查詢得到一段連續的詞編號；另外保存一份反轉後的詞典，後綴查詢 (*base) 同樣
+# 是一段連續範圍。兩者都有時取交集，中間還有萬用字元時才逐一比對。
+
+BLOCK_SIZE = 16
+
+
+def _successor(prefix):
+    """所有以 prefix 開頭的詞之後的第一個字串；沒有這樣的字串 (prefix 全是 U+10FFFF) 時返回 None"""
+    # 最後的 U+10FFFF 無法再遞增，去掉後遞增前一個字元
+    prefix = prefix.rstrip(chr(0x10FFFF))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class _FrontCoded:
+    """前綴壓縮的排序字串列表"""
+
+    def __init__(self, words):
+        self.count = len(words)
+        self.heads = words[::BLOCK_SIZE]
+        self.blocks = []
+        for start in range(0, self.count, BLOCK_SIZE):
+            block = words[start:start + BLOCK_SIZE]
+            entries = []
+            for previous, word in zip(block, block[1:]):
+                shared = len(os.path.commonprefix((previous, word)))
+                entries.append(f'{chr(shared)}{chr(len(word) - shared)}{word[shared:]}')
+            self.blocks.append(''.join(entries))
+
+    def __len__(self):
+        return self.count
+
+    def block(self, b):
+        """解碼第 b 塊的所有詞"""
+        words = [self.heads[b]]
+        data = self.blocks[b]
+        i = 0
+        while i < len(data):
+            shared, length = ord(data[i]), ord(data[i + 1])
+            words.append(words[-1][:shared] + data[i + 2:i + 2 + length])
+            i += 2 + length
+        return words
+
+    def __getitem__(self, i):
+        b, offset = divmod(i, BLOCK_SIZE)
+        return self.heads[b] if not offset else self.block(b)[offset]
+
+    def lower_bound(self, key):
+        """第一個不小於 key 的詞的編號"""
+        b = bisect.bisect_right(self.heads, key) - 1
+        if b < 0:
+            return 0
+        return b * BLOCK_SIZE + bisect.bisect_left(self.block(b), key)
+
+    def prefix_range(self, prefix):
+        """以 prefix 開頭的詞的編號範圍 [lo, hi)"""
+        if not prefix:
+            return 0, self.count
+        successor = _successor(prefix)
+        return self.lower_bound(prefix), self.lower_bound(successor) if successor is not None else self.count
+
+
+class TermDictionary:
+    """一個段的詞典：前綴壓縮的排序詞與每個詞的權重 (文檔頻率)，支援前綴補全與萬用字元"""
+
+    def __init__(self, words, weights):
+        order = sorted(range(len(words)), key=words.__getitem__)
+        words = [words[i] for i in order]
+        self.terms = _FrontCoded(words)
+        self.weights = np.asarray(weights, dtype=np.int64)[np.array(order, dtype=np.int64)]
+        reversed_words = [word[::-1] for word in words]
+        reverse_order = sorted(range(len(words)), key=reversed_words.__getitem__)
+        self.reversed_terms = _FrontCoded([reversed_words[i] for i in reverse_order])
+        self.reversed_ids = np.array(reverse_order, dtype=np.int32)  # 反轉詞典的編號 -> 詞編號
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _top(self, ids, limit):
+        """ids 中權重最高的 limit 個 (None 表示全部)，返回 [(詞, 權重)]"""
+        weights = self.weights[ids]
+        if limit is not None and limit < ids.size:
+            if limit <= 0:
+                return []
+            # 保留所有不低於第 limit 名權重的詞，權重相同時依字典順序取前幾個
+            kth = -np.partition(-weights, limit - 1)[limit - 1]
+            keep = weights >= kth
+            ids, weights = ids[keep], weights[keep]
+        order = np.lexsort((ids, -weights))[:limit]
+        return [(self.terms[i], w) for i, w in zip(ids[order].tolist(), weights[order].tolist())]
+
+    def complete(self, prefix, limit=10):
+        """以 prefix 開頭、權重最高的 limit 個詞"""
+        lo, hi = self.terms.prefix_range(prefix)
+        return self._top(np.arange(lo, hi), limit)
+
+    def match(self, pattern, limit=None):
+        """符合萬用字元 pattern (* 任意長度、? 一個字元) 的詞，權重高的在前"""
+        wildcards = [i for i, char in enumerate(pattern) if char in '*?']
+        if not wildcards:
+            lo = self.terms.lower_bound(pattern)
+            found = lo < len(self.terms) and self.terms[lo] == pattern
+            return self._top(np.arange(lo, lo + 1) if found else np.zeros(0, dtype=np.int64), limit)
+        prefix, suffix = pattern[:wildcards[0]], pattern[wildcards[-1] + 1:]
+        lo, hi = self.terms.prefix_range(prefix)
+        if suffix:
+            start, end = self.reversed_terms.prefix_range(suffix[::-1])
+            ids = np.sort(self.reversed_ids[start:end]).astype(np.int64)
+            ids = ids[(ids >= lo) & (ids < hi)]
+        else:
+            ids = np.arange(lo, hi)
+        if pattern[wildcards[0]:wildcards[-1] + 1] != '*':
+            # 中間還有其他萬用字元，或前後綴可能重疊，逐一比對
+            regex = re.compile(''.join('.*' if char == '*' else '.' if char == '?' else re.escape(char)
+                                       for char in pattern), re.DOTALL)
+            ids = np.array([i for i in ids.tolist() if regex.fullmatch(self.terms[i])], dtype=np.int64)
+        elif prefix and suffix:
+            # 只有一個 *：詞至少要容得下前綴與後綴
+            lengths = np.array([len(self.terms[i]) for i in ids.tolist()], dtype=np.int64)
+            ids = ids[lengths >= len(prefix) + len(suffix)]
+        return self._top(ids, limit)
+
+    @property
+    def nbytes(self):
+        """前綴壓縮後的字串與陣列大約佔用的位元組數"""
+        strings = sum(len(text.encode('utf-8')) for coded in (self.terms, self.reversed_terms)
+                      for text in coded.heads + coded.blocks)
+        return strings + self.weights.nbytes + self.reversed_ids.nbytes
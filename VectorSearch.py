@@ -1,11 +1,21 @@
 import math
-import documents
 import redis
 import json
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import time
 import re
-from rapidfuzz import fuzz, process
+import threading
+import numpy as np
+from contextlib import contextmanager
+from InvertedIndex import InvertedIndex
+from PositionIndex import PositionIndex
+from IndexSegment import IndexSegment, StoredDocuments, open_segment, write_segment
+from DocumentLog import DocumentLog, OP_PUT
+from Analyzer import analyzer
+from SegmentedIndex import Segment, SegmentedIndex
+from LRUCache import LRUCache
+from ReadWriteLock import ReadWriteLock
+from ShardedSearch import ShardedSearch
+import BooleanQuery
 
 
 #syntax highlight
@@ -50,102 +60,461 @@ class VectorCompare:
         if type(document) != str:
             raise ValueError('Supplied Argument should be of type string')
         con = {}
-        for word in re.findall(r'(?u)\b\w+\b', document):
+        for word in analyzer(document):
             con[word] = con.get(word, 0) + 1
         return con
 
 # ==================== 建立倒排索引 ==================== #
 
-def create_inverted_index(documents_dict):
-    inverted_index = {}
-    for doc_id, doc_text in documents_dict.items():
-        for word in set(doc_text.split()):
-            if word not in inverted_index:
-                inverted_index[word] = set()
-            inverted_index[word].add(doc_id)
-    return inverted_index
+def create_inverted_index(documents_dict, tokens=None):
+    return InvertedIndex(documents_dict, tokens)
+
+
+# ==================== 文檔日誌與磁碟索引段 ==================== #
+DOCUMENT_LOG_FILE = 'documents.log'
+INDEX_SEGMENT_FILE = 'index.seg'
+
+
+def load_seed_documents():
+    """第一次啟動、還沒有文檔日誌時的初始文檔，來自 documents.py"""
+    import documents
+    return documents.documents
+
+
+def apply_log_record(op, doc_id, content, documents_dict, *indexes):
+    """把一筆日誌記錄套用到文檔集合與索引 (分片搜索啟動時也套用到分片)，每篇文檔只分詞一次"""
+    previous = documents_dict.get(doc_id)
+    if previous is not None:
+        words = analyzer(previous)
+        for index in indexes:
+            index.remove_document(doc_id, previous, words)
+        del documents_dict[doc_id]
+    if op == OP_PUT:
+        documents_dict[doc_id] = content
+        words = analyzer(content)
+        for index in indexes:
+            index.add_document(doc_id, content, words)
+
+
+def load_document_store(log, documents_dict, index):
+    """由文檔日誌重新載入文檔集合與倒排索引，兩者原地換成日誌目前的內容
+
+    文檔日誌是唯一的持久化來源。索引段記錄自己涵蓋到日誌的哪個位置，
+    與日誌同一世代時以 mmap 開啟它，只重放之後追加的記錄；否則重放整個
+    日誌、重建索引並寫出新的索引段。多個 worker 開啟同一個索引段時共用
+    頁面快取，倒排資料與文檔內容都不會隨 worker 數量複製。
+    呼叫者持有 log.locked()。
+    """
+    segment = open_segment(INDEX_SEGMENT_FILE, log.generation, log.size)
+    if segment is None:
+        texts = {}
+        for op, doc_id, content in log.replay():
+            if op == OP_PUT:
+                texts[doc_id] = content
+            else:
+                texts.pop(doc_id, None)
+        # 倒排索引與位置索引共用同一次分詞的結果
+        tokens = {doc_id: analyzer(content) for doc_id, content in texts.items()}
+        built = create_inverted_index(texts, tokens)
+        positions = PositionIndex.build((doc_id, tokens[doc_id]) for doc_id in sorted(tokens))
+        try:
+            write_segment(INDEX_SEGMENT_FILE, built, texts, (log.generation, log.size), positions)
+            segment = IndexSegment(INDEX_SEGMENT_FILE)
+        except OSError as e:
+            print(f"{RED}無法寫入索引段，改用記憶體索引：{str(e)}{RESET}")
+            documents_dict.reset(None, texts)
+            index.reset(Segment(built, sorted(texts), positions=positions))
+            return
+        log.records_since_snapshot = 0
+    # 文檔內容由映射的索引段提供，重放時建立的字典隨即釋放
+    documents_dict.reset(segment)
+    index.reset(Segment(InvertedIndex.from_segment(segment), segment.stored_ids, positions=segment.position_index()))
+    # 索引段涵蓋的記錄不會重放，新文檔ID也要接在索引段保存的文檔之後
+    if segment.stored_ids.size:
+        log.next_doc_id = max(log.next_doc_id, int(segment.stored_ids[-1]) + 1)
+    for op, doc_id, content in log.replay(segment.log_offset):
+        apply_log_record(op, doc_id, content, documents_dict, index)
 
 
+def open_document_store():
+    """開啟文檔日誌並載入文檔集合與倒排索引，返回 (日誌, 文檔集合, 索引)"""
+    log = DocumentLog(DOCUMENT_LOG_FILE, load_seed_documents)
+    documents_dict = StoredDocuments()
+    index = SegmentedIndex(text_of=documents_dict.get)
+    with log.locked():
+        load_document_store(log, documents_dict, index)
+    return log, documents_dict, index
 
-# ==================== 計算TF-IDF並根據倒排索引檢索文檔 ==================== #
-def perform_tfidf_search(searchterm, documents_dict, inverted_index):
-    doc_ids = list(documents_dict.keys())
-    doc_texts = list(documents_dict.values())
-
-    # 先根據倒排索引過濾出可能包含搜索詞的文檔
-    relevant_doc_ids = set()
-    for word in searchterm.split():
-        if word in inverted_index:
-            relevant_doc_ids.update(inverted_index[word])
-
-    # 如果沒有相關文檔，返回空
-    if not relevant_doc_ids:
-        return []
 
-    relevant_doc_texts = [documents_dict[doc_id] for doc_id in relevant_doc_ids]
-    relevant_doc_ids = list(relevant_doc_ids)
+# 啟動時載入一次，之後新增的文檔寫入索引的緩衝區、刪除只設定刪除標記，並追加到日誌
+document_log, document_store, inverted_index = open_document_store()
 
-    # 計算TF-IDF矩陣，將搜索詞和文檔文本合併
-    all_texts = [searchterm] + relevant_doc_texts
-    vectorizer = TfidfVectorizer(token_pattern=r'(?u)\b\w+\b')
-    tfidf_matrix = vectorizer.fit_transform(all_texts)
+# 增刪文檔依序進行 (同一行程內以 write_lock，多個 worker 之間以日誌的 locked())，但不與查詢互斥：索引的緩衝區寫入時複製 (見 SegmentedIndex)，
+# 查詢看到的是寫入前或寫入後的索引。新增時先放入文檔集合再加入索引，刪除時先移出
+# 索引再移出文檔集合，查詢找到的文檔仍以 get() 讀取內容，略過查詢期間剛被刪除的文檔。
+write_lock = threading.RLock()
 
-    # 計算搜索詞和所有相關文檔的餘弦相似度
-    cosine_similarities = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:]).flatten()
+# API 在執行緒池中查詢時持有讀鎖，只有啟動與停止分片時持有寫鎖
+index_lock = ReadWriteLock()
 
-    # 選出相似度大於0的文檔
-    matches = []
-    for i, score in enumerate(cosine_similarities):
-        if score > 0:
-            matches.append((score, relevant_doc_ids[i], relevant_doc_texts[i][:100], relevant_doc_texts[i]))
+# 由 start_search_shards() 啟動的分片搜索；未啟動時查詢直接使用本行程的索引
+search_shards = None
+
+
+def start_search_shards(shard_count):
+    """把目前的語料分到 shard_count 個行程，之後的增刪文檔也會同步到分片"""
+    global search_shards
+    with write_lock, index_lock.writing():
+        search_shards = ShardedSearch(dict(document_store.items()), shard_count)
+
+
+def stop_search_shards():
+    global search_shards
+    with write_lock, index_lock.writing():
+        if search_shards is not None:
+            search_shards.close()
+            search_shards = None
 
-    matches.sort(reverse=True)
+
+def search_index():
+    """TF-IDF 與 BM25 查詢使用的索引：分片搜索已啟動時是它的協調者"""
+    return search_shards if search_shards is not None else inverted_index
+
+
+# ==================== 計算TF-IDF並根據倒排索引檢索文檔 ==================== #
+def hydrate_ranked(ranked, documents_dict, limit=None):
+    """為依分數排序的 (分數, 文檔ID) 補上摘要與全文，略過已刪除的文檔，最多返回 limit 筆 (None 表示全部)"""
+    matches = []
+    for score, doc_id in ranked:
+        if limit is not None and len(matches) >= limit:
+            break
+        doc_text = documents_dict.get(doc_id)
+        if doc_text is not None:
+            matches.append((score, doc_id, doc_text[:100], doc_text))
     return matches
 
+def rank_tfidf_search(searchterm, inverted_index, limit=None):
+    # 每個段各自計算相似度再合併，IDF 以整個語料計算；只返回相似度大於0的文檔，
+    # 依相似度由高到低排序
+    return inverted_index.tfidf_top_k(searchterm, limit)
+
+def perform_tfidf_search(searchterm, documents_dict, inverted_index, limit=None):
+    return hydrate_ranked(rank_tfidf_search(searchterm, inverted_index, limit), documents_dict)
+
+def perform_tfidf_batch_search(searchterms, documents_dict, inverted_index, limit=None):
+    # 所有查詢組成一個稀疏矩陣一起評分，返回與 searchterms 對齊的結果列表
+    return [hydrate_ranked(ranked, documents_dict) for ranked in inverted_index.tfidf_top_k_batch(searchterms, limit)]
+
+# ==================== 模糊搜索 ==================== #
+def fuzzy_query(searchterm, inverted_index):
+    """把查詢中拼錯的詞換成詞典中相近的詞，返回可以直接交給 TF-IDF 或 BM25 搜索的查詢"""
+    return ' '.join(inverted_index.expand_fuzzy(searchterm))
+
+def spelling_suggestion(searchterm, inverted_index):
+    """「你是不是要找」：把不在詞典中的詞換成最接近、最常見的一個詞；沒有可更正的詞時返回 None"""
+    return inverted_index.did_you_mean(searchterm)
+
+# ==================== 查詢補全 ==================== #
+def suggest_terms(prefix, inverted_index, limit=10):
+    """補全輸入中的最後一個詞，返回以它開頭、文檔頻率最高的詞 [(詞, 文檔頻率)]"""
+    words = prefix.split()
+    if not words or prefix[-1].isspace():
+        return []
+    return inverted_index.complete(words[-1].lower() if analyzer.lowercase else words[-1], limit)
+
+# ==================== BM25 排序 ==================== #
+def rank_bm25_search(searchterm, inverted_index, limit=None):
+    # 分數只由倒排項中的詞頻與文檔長度算出，不需要讀取文檔內容
+    words = inverted_index.tokenize(searchterm)
+    if limit is not None:
+        # 只要前 limit 名時改用 Block-Max 剪枝，上界低於門檻的塊不必解碼
+        return inverted_index.bm25_top_k(words, limit)
+    return sorted(((score, doc_id) for doc_id, score in inverted_index.bm25_scores(words).items()), reverse=True)
+
+def perform_bm25_search(searchterm, documents_dict, inverted_index, limit=None):
+    return hydrate_ranked(rank_bm25_search(searchterm, inverted_index, limit), documents_dict)
+
 # ==================== 快取實現 ==================== #
+#
+# 快取鍵都放在 CACHE_PREFIX 命名空間下，並帶有索引世代編號：每次文檔變動都遞增
+# Redis 中的世代編號，舊世代的結果不再被讀到，之後由 TTL 自動過期。
+# CACHE_TERM_TRACKING 開啟時改為每個詞各自一個版本號，文檔變動只遞增它包含的詞，
+# 查詢鍵帶有查詢詞的版本號，沒有受影響詞的查詢仍然命中快取
+# (IDF 會隨文檔數些微變化，這些結果的分數可能與重新計算略有差異)。
+# 含 NOT 或萬用字元的布林查詢會被任何文檔變動影響 (NOT the 包含所有新文檔，
+# perf* 會展開成新加入詞典的詞)，這些查詢仍然使用世代編號。
+#
+# Redis 前面還有一層行程內的 LRU 快取，熱門查詢不需要網路往返與 JSON 解析。
+# 世代與版本號在本行程內快照 COUNTER_REFRESH 秒，其他 worker 造成的失效
+# 最多延遲這麼久才會被看到；本行程自己的寫入則立即生效。
+#
+# 快取只保存前 CACHE_TOP_N 名的 (分數, 文檔ID)，以 float32 + int32 緊湊編碼，
+# 不同 limit 的請求共用同一筆快取；讀取時只為前 limit 名從文檔庫補上摘要與全文，
+# 之後被刪除的文檔會直接略過，由後面的名次遞補。
+
+CACHE_PREFIX = 'pyseek'
+CACHE_TTL = 3600
+CACHE_TERM_TRACKING = False
+GENERATION_KEY = f'{CACHE_PREFIX}:generation'
+COUNTER_REFRESH = 1.0
+CACHE_TOP_N = 1000
+CACHE_ENTRY = np.dtype([('score', '<f4'), ('doc_id', '<i4')])
+
+local_cache = LRUCache(max_bytes=64 * 1024 * 1024, max_entries=10000, ttl=300)
+redis_cache_stats = {"hits": 0, "misses": 0}
+redis_cache_stats_lock = threading.Lock()   # 查詢在多個執行緒中進行，+= 不是原子操作
+
+# 等待 commit_documents() 使快取失效的詞
+changed_terms = set()
+
+counter_snapshot = {}
+counter_snapshot_time = 0.0
+
+
+def read_counters(keys):
+    """讀取 Redis 中的世代/版本計數器，COUNTER_REFRESH 秒內重用本行程的快照
+
+    多個執行緒同時查詢：過期時換上新的空快照而不是清空舊的，
+    結果由本次讀到的值組成，不會因為其他執行緒換掉快照而缺少鍵。
+    """
+    global counter_snapshot, counter_snapshot_time
+    now = time.monotonic()
+    if now - counter_snapshot_time > COUNTER_REFRESH:
+        counter_snapshot = {}
+        counter_snapshot_time = now
+    snapshot = counter_snapshot
+    values = {key: snapshot.get(key) for key in keys}
+    missing = [key for key, value in values.items() if value is None]
+    if missing:
+        for key, value in zip(missing, r.mget(missing)):
+            values[key] = snapshot[key] = value.decode() if value else '0'
+    return [values[key] for key in keys]
+
+
+def normalize_query(searchterm, kind):
+    """結果相同的查詢對應到同一個快取鍵
+
+    TF-IDF 與 BM25 只看分析後的詞；布林查詢的運算子不分大小寫，其餘部分保持原樣。
+    """
+    if kind != 'boolean':
+        return ' '.join(analyzer(searchterm))
+    return searchterm.lower() if analyzer.lowercase else searchterm
+
+
+def depends_on_whole_index(query, kind):
+    """布林查詢含 NOT 或萬用字元時，結果取決於全部文檔或整個詞典，而不只是查詢中的詞"""
+    return kind == 'boolean' and any(token == 'NOT' or BooleanQuery.is_wildcard(token)
+                                     for token in BooleanQuery.tokenize(query))
+
+
+def cache_key(searchterm, kind='tfidf'):
+    query = normalize_query(searchterm, kind)
+    if CACHE_TERM_TRACKING and not depends_on_whole_index(query, kind):
+        terms = sorted(set(analyzer(query)))
+        stamp = '.'.join(read_counters([f'{CACHE_PREFIX}:term:{term}' for term in terms]))
+    else:
+        stamp = read_counters([GENERATION_KEY])[0]
+    return f'{CACHE_PREFIX}:search:{stamp}:{kind}:{query}'
 
-def get_from_cache(searchterm):
-    data = r.get(searchterm.lower())
-    if data:
-        return json.loads(data)
-    return None
 
-def add_to_cache(searchterm, matches):
-    r.set(searchterm.lower(), json.dumps(matches))
+def pack_matches(matches, top_n=CACHE_TOP_N):
+    """把依分數排序的 (分數, 文檔ID, ...) 編碼成緊湊的二進位，只保留前 top_n 名 (None 表示全部)"""
+    ranked = [(score, doc_id) for score, doc_id, *_ in (matches if top_n is None else matches[:top_n])]
+    return np.array(ranked, dtype=CACHE_ENTRY).tobytes()
+
+def hydrate_matches(data, limit=None):
+    """由 (分數, 文檔ID) 編碼還原前 limit 筆結果 (None 表示全部)，摘要與全文從文檔庫讀取"""
+    entries = np.frombuffer(data, dtype=CACHE_ENTRY)
+    matches = []
+    start = 0
+    # 只解碼需要的名次；有文檔已被刪除時再往後取補足
+    while start < entries.size and (limit is None or len(matches) < limit):
+        stop = entries.size if limit is None else start + limit - len(matches)
+        chunk = entries[start:stop]
+        matches.extend(hydrate_ranked(zip(chunk['score'].tolist(), chunk['doc_id'].tolist()), document_store))
+        start = stop
+    return matches
+
+def get_from_cache(searchterm, kind='tfidf', limit=None):
+    key = cache_key(searchterm, kind)
+    data = local_cache.get(key)
+    if data is None:
+        data = r.get(key)
+        with redis_cache_stats_lock:
+            redis_cache_stats["misses" if data is None else "hits"] += 1
+        if data is None:
+            return None
+        local_cache.put(key, data, len(data))
+    return hydrate_matches(data, limit)
+
+def add_to_cache(searchterm, matches, kind='tfidf', top_n=CACHE_TOP_N):
+    put_in_cache(searchterm, pack_matches(matches, top_n), kind)
+
+def put_in_cache(searchterm, data, kind='tfidf'):
+    key = cache_key(searchterm, kind)
+    r.set(key, data, ex=CACHE_TTL)
+    local_cache.put(key, data, len(data))
+
+def cached_search(searchterm, kind, rank, limit=None, top_n=CACHE_TOP_N):
+    """先查快取，未命中時呼叫 rank() 取得依分數排序的 (分數, 文檔ID) 並寫入快取；
+    Redis 無法使用時直接計算。只返回前 limit 筆補上內容的結果 (None 表示全部)。
+    """
+    try:
+        matches = get_from_cache(searchterm, kind, limit)
+    except redis.RedisError as e:
+        print(f"{RED}無法讀取快取：{e}{RESET}")
+        return hydrate_ranked(rank(), document_store, limit)
+    if matches is None:
+        # 與命中快取時一樣由編碼還原，分數同為 float32
+        data = pack_matches(rank(), top_n)
+        try:
+            put_in_cache(searchterm, data, kind)
+        except redis.RedisError as e:
+            print(f"{RED}無法寫入快取：{e}{RESET}")
+        matches = hydrate_matches(data, limit)
+    return matches
+
+def cache_statistics():
+    """每一層快取的命中與未命中次數"""
+    with redis_cache_stats_lock:
+        stats = dict(redis_cache_stats)
+    return {"local": local_cache.stats(), "redis": stats}
+
+def invalidate_cache(terms):
+    """文檔變動後讓快取失效：遞增世代編號，開啟詞追蹤時遞增受影響詞的版本號"""
+    global counter_snapshot
+    pipeline = r.pipeline(transaction=False)
+    pipeline.incr(GENERATION_KEY)
+    if CACHE_TERM_TRACKING:
+        for term in terms:
+            pipeline.incr(f'{CACHE_PREFIX}:term:{term}')
+    pipeline.execute()
+    # 本行程的寫入立即生效，不等快照過期
+    counter_snapshot = {}
 
 def clear_all_cache():
-    r.flushdb()  # 清空當前資料庫的所有快取
+    # 只刪除本系統的查詢結果，不清空整個 Redis 資料庫
+    keys = list(r.scan_iter(match=f'{CACHE_PREFIX}:search:*', count=1000))
+    for i in range(0, len(keys), 1000):
+        r.unlink(*keys[i:i + 1000])
+    local_cache.clear()
     print("快取清除完畢！")
 
 # ==================== 快取實現結束 ================== #
-# def save_documents_to_file():
-#     with open('documents.py', 'w', encoding='utf-8') as f:
-#         f.write('documents = {\n')
-#         for key, value in documents.documents.items():
-#             cleaned_value = value.replace("'", "\\'").replace("\n", "\\n")
-#             f.write(f"    {key}: '{cleaned_value}',\n")
-#         f.write('}\n')
-def save_documents_to_file():
-    """優化批量保存性能"""
-    try:
-        with open('documents.py', 'w', encoding='utf-8') as f:
-            f.write('documents = {\n')
-            for key, value in documents.documents.items():
-                # 使用 repr() 自動處理轉義字符
-                f.write(f"    {key}: {repr(value)},\n")
-            f.write('}\n')
-    except Exception as e:
-        print(f"Error saving documents: {str(e)}")
-        raise
-    
-    
+# ==================== 文檔持久化 ==================== #
+#
+# 多個 worker 共用同一個文檔日誌。寫入前先取得日誌的跨行程鎖並追上其他 worker
+# 追加的記錄；其他 worker 壓縮了日誌時，改為開啟新世代的日誌與索引段並重新載入。
+# 沒有寫入的 worker 由 refresh_documents() 定期追上 (見 api 的 LOG_REFRESH)。
+
+def reload_document_store():
+    """依日誌重新載入文檔集合與索引 (原地替換內容)，分片搜索也以新的語料重新啟動"""
+    global search_shards
+    load_document_store(document_log, document_store, inverted_index)
+    if search_shards is not None:
+        # 新分片建立期間查詢仍使用舊分片
+        shards = ShardedSearch(dict(document_store.items()), len(search_shards.shards))
+        with index_lock.writing():
+            search_shards, shards = shards, search_shards
+        shards.close()
+
+
+def follow_document_log():
+    """追上其他 worker 對文檔日誌的寫入，呼叫者持有 write_lock 與 document_log.locked()"""
+    if document_log.replaced():
+        document_log.reopen()
+        reload_document_store()
+    elif document_log.changed():
+        indexes = (inverted_index,) if search_shards is None else (inverted_index, search_shards)
+        for op, doc_id, content in document_log.replay(document_log.size):
+            apply_log_record(op, doc_id, content, document_store, *indexes)
+
+
+@contextmanager
+def exclusive_writes():
+    """取得本行程與跨行程的寫入鎖，並先追上其他 worker 的寫入"""
+    with write_lock, document_log.locked():
+        follow_document_log()
+        yield
+
+
+def refresh_documents():
+    """套用其他 worker 寫入的文檔；日誌沒有變動時只需要一次 stat"""
+    if document_log.changed():
+        with write_lock, document_log.locked():
+            follow_document_log()
+
+
+def store_new_documents(contents):
+    """為一批新文檔分配連續ID、追加到日誌並一次更新索引，呼叫者負責 commit_documents()"""
+    with exclusive_writes():
+        doc_ids = allocate_doc_ids(len(contents))
+        batch = dict(zip(doc_ids, contents))
+        tokens = {doc_id: analyzer(content) for doc_id, content in batch.items()}
+        for doc_id, content in batch.items():
+            document_log.put(doc_id, content)
+            document_store[doc_id] = content
+            if CACHE_TERM_TRACKING:
+                changed_terms.update(tokens[doc_id])
+        inverted_index.add_documents(batch, tokens)
+        if search_shards is not None:
+            search_shards.add_documents(batch, tokens)
+    return doc_ids
+
+
+def remove_stored_document(doc_id):
+    """刪除一篇文檔並追加到日誌，呼叫者負責 commit_documents()"""
+    with exclusive_writes():
+        content = document_store.get(doc_id)
+        if content is None:
+            return
+        document_log.delete(doc_id)
+        words = analyzer(content)
+        if CACHE_TERM_TRACKING:
+            changed_terms.update(words)
+        inverted_index.remove_document(doc_id, content, words)
+        if search_shards is not None:
+            search_shards.remove_document(doc_id, content, words)
+        del document_store[doc_id]
+
+
+def commit_documents():
+    """把日誌寫入磁碟並使快取失效，必要時壓縮日誌並寫出新的索引段
+
+    壓縮後改為開啟新的索引段：文檔內容與倒排資料回到映射的頁面，
+    記憶體中累積的新增文檔與合併出的索引隨即釋放。
+    """
+    with exclusive_writes():
+        document_log.commit()
+        try:
+            invalidate_cache(changed_terms)
+        except redis.RedisError as e:
+            print(f"{RED}無法使快取失效：{str(e)}{RESET}")
+        changed_terms.clear()
+        if document_log.needs_compaction(len(document_store)):
+            try:
+                document_log.compact(document_store)
+                merged = inverted_index.merge_all()
+                write_segment(INDEX_SEGMENT_FILE, merged.index, document_store,
+                              (document_log.generation, document_log.size), merged.positions)
+            except OSError as e:
+                print(f"{RED}日誌壓縮失敗：{str(e)}{RESET}")
+                return
+            # 內容與壓縮前相同，分片搜索不需要重新啟動
+            load_document_store(document_log, document_store, inverted_index)
+
+
+def allocate_doc_ids(count):
+    """一次分配 count 個連續的新文檔ID，接續所有 worker 寫入日誌的最大ID"""
+    return document_log.allocate_ids(count)
+
+
 def add_new_document(content):
     if not isinstance(content, str):
         print("Error: Content must be a string")
         return
-    new_index = max(documents.documents.keys()) + 1 if documents.documents else 0
-    documents.documents[new_index] = content
-    save_documents_to_file()
+    new_index, = store_new_documents([content])
+    commit_documents()
     print(f"New document added with index: {new_index}")
     return new_index
 
@@ -155,14 +524,19 @@ def add_new_documents_batch(contents: list):
         print("Error: Input must be a list of strings")
         return []
     
-    new_ids = []
+    valid_contents = []
     for content in contents:
         if not isinstance(content, str):
             print(f"Warning: Skipping non-string content: {content}")
             continue
-        new_id = add_new_document(content)
-        new_ids.append(new_id)
-        
+        valid_contents.append(content)
+    if not valid_contents:
+        return []
+
+    # 整批只分配一次ID、更新一次索引、寫一次日誌並 fsync 一次
+    new_ids = store_new_documents(valid_contents)
+    commit_documents()
+    print(f"{len(new_ids)} new documents added with indexes: {new_ids[0]}-{new_ids[-1]}")
     return new_ids
 
 
@@ -173,12 +547,13 @@ def delete_document(doc_id):
     except ValueError:
         print(f"{RED}錯誤：文檔ID必須是整數{RESET}")
         return
-    if doc_id not in documents.documents:
+    if doc_id not in document_store:
         print(f"{RED}錯誤：找不到ID為 {doc_id} 的文檔{RESET}")
         return
-    del documents.documents[doc_id]
-    save_documents_to_file()
+    remove_stored_document(doc_id)
+    commit_documents()
     print(f"{GREEN}文檔 ID {doc_id} 已成功刪除{RESET}")
+    return True
         
         
 def delete_document_batch(doc_ids):
@@ -192,15 +567,15 @@ def delete_document_batch(doc_ids):
             not_found_ids.append(doc_id)
             continue  # 如果文檔ID無法轉換為整數，跳過當前的ID
             
-        if doc_id not in documents.documents:
+        if doc_id not in document_store:
             print(f"{RED}錯誤：找不到ID為 {doc_id} 的文檔{RESET}")
             not_found_ids.append(doc_id)
             continue  # 如果找不到該ID的文檔，跳過當前的ID
 
-        del documents.documents[doc_id]
+        remove_stored_document(doc_id)
         print(f"{GREEN}文檔 ID {doc_id} 已成功刪除{RESET}")
 
-    save_documents_to_file()
+    commit_documents()
 
     if not_found_ids:
         return f"未找到文檔ID：{', '.join(map(str, not_found_ids))}"
@@ -208,16 +583,28 @@ def delete_document_batch(doc_ids):
 
 
 def boolean_search_interface():
-    inverted_index = create_inverted_index(documents.documents)
-
     while True:
         print("\n=== 布林查詢模式 ===")
         print("提示：你可以使用 AND / OR / NOT，例如：apple AND banana NOT cherry")
+        print('      片語用雙引號，例如 "mysql backups"；NEAR/k 找相隔不超過 k 個詞的兩邊，例如：mysql NEAR/3 backups')
+        print("      萬用字元：* 代表任意個字元、? 代表一個字元，例如：perf* OR *base")
+        print("      在查詢前加上 explain 顯示執行計畫，例如：explain mysql AND backups")
         searchterm = input("輸入布林查詢語句 (或輸入 'back' 返回): ")
         if searchterm.lower() == 'back':
             break
 
-        matches = perform_boolean_search(searchterm, documents.documents, inverted_index)
+        if searchterm.lower().startswith('explain '):
+            try:
+                print(json.dumps(explain_boolean_search(searchterm[8:], inverted_index), ensure_ascii=False, indent=2))
+            except ValueError as e:
+                print(f"{RED}查詢語法錯誤：{str(e)}{RESET}")
+            continue
+
+        try:
+            matches = perform_boolean_search(searchterm, document_store, inverted_index)
+        except ValueError as e:
+            print(f"{RED}查詢語法錯誤：{str(e)}{RESET}")
+            continue
 
         if matches:
             print("\n找到以下匹配文檔:")
@@ -248,121 +635,55 @@ def boolean_search_interface():
         else:
             print("沒有找到匹配的文檔")
 
-def perform_boolean_search(query, documents_dict, inverted_index):
-    def tokenize(query):
-        return re.findall(r'\b(?:AND|OR|NOT)\b|[\w\d]+|[()]', query.upper())
-
-    def to_postfix(tokens):
-        precedence = {'NOT': 3, 'AND': 2, 'OR': 1}
-        output = []
-        stack = []
-
-        for token in tokens:
-            if token not in precedence and token not in {'(', ')'}:
-                output.append(token)
-            elif token == '(':
-                stack.append(token)
-            elif token == ')':
-                while stack and stack[-1] != '(':
-                    output.append(stack.pop())
-                stack.pop()  # remove '('
-            else:
-                while stack and stack[-1] != '(' and precedence.get(stack[-1], 0) >= precedence[token]:
-                    output.append(stack.pop())
-                stack.append(token)
+def plan_boolean_query(query, inverted_index):
+    """剖析布林查詢並依整個索引的文檔頻率規劃求值順序，萬用字元以詞典展開，返回運算樹"""
+    tokens = BooleanQuery.tokenize(query)
+    return BooleanQuery.plan(BooleanQuery.parse(tokens), inverted_index.df, inverted_index.doc_count,
+                             inverted_index.wildcard_terms)
 
-        while stack:
-            output.append(stack.pop())
 
-        return output
+def match_boolean_query(root, inverted_index):
+    # 在每個段上分別求值，段之間的文檔互不重疊，直接合併即可
+    return [doc_id for segment in inverted_index.parts()
+            for doc_id in BooleanQuery.matching_doc_ids(root, inverted_index, segment).tolist()]
 
-    def eval_postfix(postfix_tokens):
-        stack = []
 
-        for token in postfix_tokens:
-            if token not in {'AND', 'OR', 'NOT'}:
-                stack.append(inverted_index.get(token.lower(), set()))
-            elif token == 'NOT':
-                operand = stack.pop()
-                result = set(documents_dict.keys()) - operand
-                stack.append(result)
-            else:
-                right = stack.pop()
-                left = stack.pop()
-                if token == 'AND':
-                    stack.append(left & right)
-                elif token == 'OR':
-                    stack.append(left | right)
+def explain_boolean_search(query, inverted_index):
+    """執行布林查詢並返回查詢計畫：每個節點估計與實際的文檔數及耗時"""
+    root = plan_boolean_query(query, inverted_index)
+    started = time.perf_counter()
+    matched_doc_ids = match_boolean_query(root, inverted_index)
+    return {
+        "query": query,
+        "matches": len(matched_doc_ids),
+        "segments": len(inverted_index.parts()),
+        "time_ms": round((time.perf_counter() - started) * 1000, 3),
+        "plan": BooleanQuery.explain(root),
+    }
 
-        return stack[0] if stack else set()
 
-    tokens = tokenize(query)
-    postfix = to_postfix(tokens)
-    matched_doc_ids = eval_postfix(postfix)
+def rank_boolean_search(query, inverted_index):
+    # NOT 在索引中以 ANDNOT 排除，結果不需要再掃描文檔內容
+    root = plan_boolean_query(query, inverted_index)
+    matched_doc_ids = match_boolean_query(root, inverted_index)
 
     if not matched_doc_ids:
         return []
-    
-    excluded_terms = set()
-    i = 0
-    while i < len(tokens):
-        if tokens[i] == 'NOT':
-            excluded_terms.add(tokens[i+1].lower())
-            i += 2
-        else:
-            i += 1
-            
-    # 過濾結果：確保最終結果中不包含被排除的詞
-    filtered_docs = []
-    for doc_id in matched_doc_ids:
-        doc_text = documents_dict[doc_id]
-        # 檢查文檔是否包含任何被排除的詞
-        if not any(excluded_term in doc_text.lower() for excluded_term in excluded_terms):
-            filtered_docs.append(doc_id)
-
-    if not filtered_docs:
-        return []
-    
-    
-    # 提取用於相似度計算的詞（非NOT詞）
-    query_terms = [token.lower() for token in tokens 
-                  if token not in {'AND', 'OR', 'NOT', '(', ')'} 
-                  and token.lower() not in excluded_terms]
 
-    relevant_doc_texts = [documents_dict[doc_id] for doc_id in filtered_docs]
-    
-    # 計算相似度（僅使用非NOT詞）
+    # 相似度只使用不在 NOT 之下的詞，直接取用預先計算的文檔矩陣
+    query_terms = BooleanQuery.positive_words(root)
     if query_terms:
-        query_for_similarity = ' '.join(query_terms)
-        all_texts = [query_for_similarity] + relevant_doc_texts
-        vectorizer = TfidfVectorizer()
-        tfidf_matrix = vectorizer.fit_transform(all_texts)
-        cosine_similarities = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:]).flatten()
+        cosine_similarities = inverted_index.tfidf_scores_for(' '.join(query_terms), matched_doc_ids).tolist()
     else:
-        cosine_similarities = [0.5] * len(filtered_docs)
+        cosine_similarities = [0.5] * len(matched_doc_ids)
+    return sorted(zip(cosine_similarities, matched_doc_ids), reverse=True)
 
-    matches = []
-    for i, doc_id in enumerate(filtered_docs):
-        # 確保摘要不顯示被排除的詞
-        snippet = relevant_doc_texts[i][:100]
-        # 可以選擇性地過濾摘要中的排除詞
-        for term in excluded_terms:
-            snippet = snippet.replace(term, '[FILTERED]')
-        matches.append((
-            cosine_similarities[i],
-            doc_id,
-            snippet,
-            relevant_doc_texts[i]
-        ))
-
-    matches.sort(reverse=True)
-    return matches
+def perform_boolean_search(query, documents_dict, inverted_index):
+    return hydrate_ranked(rank_boolean_search(query, inverted_index), documents_dict)
 
 
 
 def vector_search_interface():
-    inverted_index = create_inverted_index(documents.documents)
-
     while True:
         print(f"\n{BOLD}{CYAN}=== 向量搜索模式 ==={RESET}")
         print(f"{YELLOW}1.{RESET} 進行向量搜索")
@@ -384,9 +705,16 @@ def vector_search_interface():
             matches = get_from_cache(searchterm)
 
             if matches is None:
-                matches = perform_tfidf_search(searchterm, documents.documents, inverted_index)
+                matches = perform_tfidf_search(searchterm, document_store, inverted_index)
                 add_to_cache(searchterm, matches)
 
+            if not matches:
+                # 沒有結果時把拼錯的詞換成詞典中最接近的詞再搜索一次
+                suggestion = spelling_suggestion(searchterm, inverted_index)
+                if suggestion:
+                    print(f"{YELLOW}你是不是要找：{suggestion}{RESET}")
+                    matches = perform_tfidf_search(suggestion, document_store, inverted_index)
+
             matches.sort(reverse=True)
 
             if matches:
@@ -1,11 +1,90 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Query
 from pydantic import BaseModel
 from VectorSearch import *
 from fastapi import HTTPException, status
-from typing import List  
+from typing import List, Literal
 
 
-app = FastAPI()
+# 大於1時把語料分到這麼多個行程評分 (見 ShardedSearch)，0 表示在本行程內查詢
+SEARCH_SHARDS = 0
+
+# 每隔這麼多秒檢查一次其他 worker 是否寫入了文檔日誌，有的話在寫入執行緒中追上
+LOG_REFRESH = 1.0
+
+
+async def follow_other_workers():
+    while True:
+        await asyncio.sleep(LOG_REFRESH)
+        try:
+            await run_write(refresh_documents)
+        except Exception as e:
+            print(f"{RED}無法載入其他 worker 的寫入：{str(e)}{RESET}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if SEARCH_SHARDS > 1:
+        start_search_shards(SEARCH_SHARDS)
+    follower = asyncio.create_task(follow_other_workers())
+    yield
+    follower.cancel()
+    stop_search_shards()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# ==================== 搜索執行緒池 ==================== #
+# 查詢在固定大小的執行緒池中執行，不會阻塞事件迴圈；等待加上執行超過
+# SEARCH_TIMEOUT 秒的請求返回 504。
+
+SEARCH_WORKERS = min(8, os.cpu_count() or 1)
+SEARCH_TIMEOUT = 10.0
+
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix='search')
+
+
+def run_search(compute):
+    with index_lock.reading():
+        return compute()
+
+
+# ==================== 寫入執行緒 ==================== #
+# 增刪文檔 (分詞、寫日誌與 fsync、日誌壓縮) 在單一的寫入執行緒中依序執行，不會阻塞
+# 事件迴圈；查詢不需要等待寫入完成 (見 VectorSearch 的 write_lock)。
+
+write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='write')
+
+
+async def run_write(write, *args):
+    return await asyncio.get_running_loop().run_in_executor(write_executor, write, *args)
+
+
+# ==================== 查詢合併 ==================== #
+# 同一個查詢同時有多個請求時只計算一次，其餘請求等待同一個結果
+
+in_flight = {}  # 查詢 -> [future, 等待中的請求數]
+
+async def single_flight(key, compute):
+    entry = in_flight.get(key)
+    if entry is None or entry[0].cancelled():
+        future = asyncio.get_running_loop().run_in_executor(search_executor, run_search, compute)
+        entry = in_flight[key] = [future, 0]
+        future.add_done_callback(lambda done: in_flight.pop(key) if in_flight.get(key, [None])[0] is done else None)
+    entry[1] += 1
+    try:
+        # 某個請求逾時或斷線時，不影響其他正在等待的請求
+        return await asyncio.wait_for(asyncio.shield(entry[0]), SEARCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Search timed out")
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            # 沒有請求在等待了：還在排隊的查詢直接取消，已經開始的查詢結果會被丟棄
+            entry[0].cancel()
 
 @app.get("/")
 def root():
@@ -13,23 +92,80 @@ def root():
 
 
 @app.get("/search")
-async def search(query: str, limit: int = 5):
-    """TF-IDF 向量搜索"""
-    inverted_index = create_inverted_index(documents.documents)
-    matches = perform_tfidf_search(query, documents.documents, inverted_index)
-    return {"results": matches[:limit]}
+async def search(query: str, limit: int = 5, ranking: Literal["tfidf", "bm25"] = "tfidf", fuzzy: bool = False):
+    """向量搜索，ranking 可選 TF-IDF 餘弦相似度或 BM25；fuzzy 時先把拼錯的詞換成詞典中相近的詞
+
+    沒有結果時另外返回 did_you_mean：把不在詞典中的詞更正後的查詢 (無法更正時為 null)。
+    """
+    rank = rank_bm25_search if ranking == "bm25" else rank_tfidf_search
+    # limit 為0時仍取一筆，才能判斷是否需要拼寫更正
+    hydrated = max(limit, 1)
+
+    def compute():
+        # 模糊展開需要讀取詞典，與查詢一起在持有讀鎖的執行緒池中進行；展開後的查詢作為快取鍵
+        searchterm = fuzzy_query(query, inverted_index) if fuzzy else query
+        if limit > CACHE_TOP_N:
+            # 超過快取保存的名次，直接計算
+            return hydrate_ranked(rank(searchterm, search_index(), limit), document_store)
+        # 快取保存前 CACHE_TOP_N 名，不同 limit 的請求共用同一筆快取，只補上前 limit 名的內容
+        return cached_search(searchterm, ranking, lambda: rank(searchterm, search_index(), CACHE_TOP_N), hydrated)
+
+    matches = await single_flight((ranking, normalize_query(query, ranking), fuzzy, hydrated), compute)
+    if not matches and not fuzzy:
+        # 沒有結果時附上拼寫更正後的查詢
+        suggestion = await single_flight(("spelling", normalize_query(query, ranking)),
+                                         lambda: spelling_suggestion(query, inverted_index))
+        return {"results": [], "did_you_mean": suggestion}
+    return {"results": matches[:max(limit, 0)]}
+
+MAX_BATCH_QUERIES = 1000
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    limit: int = 5
+
+@app.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    """一次以 TF-IDF 執行多個查詢，返回與 queries 對齊的結果"""
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_QUERIES} queries per batch"
+        )
+    limit = max(request.limit, 0)
+    results = await single_flight(("batch", tuple(request.queries), limit), lambda: perform_tfidf_batch_search(
+        request.queries, document_store, search_index(), limit))
+    return {"results": [{"query": query, "results": matches} for query, matches in zip(request.queries, results)]}
 
 @app.get("/search/boolean")
 async def boolean_search(query: str):
-    """支持 AND/OR/NOT 的布林搜索"""
-    inverted_index = create_inverted_index(documents.documents)
-    matches = perform_boolean_search(query, documents.documents, inverted_index)
+    """支持 AND/OR/NOT、"片語" 與 NEAR/k 的布林搜索"""
+    try:
+        matches = await single_flight(("boolean", normalize_query(query, "boolean")), lambda: cached_search(
+            query, "boolean", lambda: rank_boolean_search(query, inverted_index), top_n=None))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid query: {str(e)}")
     return {"results": matches}
 
+@app.get("/search/boolean/explain")
+async def explain_boolean(query: str):
+    """布林查詢的執行計畫，每個節點附估計與實際的文檔數及耗時 (不使用快取)"""
+    try:
+        return await single_flight(("explain", query), lambda: explain_boolean_search(query, inverted_index))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid query: {str(e)}")
+
+@app.get("/suggest")
+async def suggest(prefix: str, limit: int = 10):
+    """補全查詢的最後一個詞，返回文檔頻率最高的詞"""
+    limit = max(limit, 0)
+    terms = await single_flight(("suggest", prefix, limit), lambda: suggest_terms(prefix, inverted_index, limit))
+    return {"suggestions": [{"term": term, "df": df} for term, df in terms]}
+
 @app.post("/documents")
 async def add_document(content: str):
     """添加新文檔"""
-    new_id = add_new_document(content)
+    new_id = await run_write(add_new_document, content)
     return {"id": new_id, "message": "Document added"}
 
 
@@ -37,7 +173,7 @@ async def add_document(content: str):
 async def add_documents_batch(contents: List[str]):
     """批量添加多個文檔"""
     try:
-        new_ids = add_new_documents_batch(contents)
+        new_ids = await run_write(add_new_documents_batch, contents)
         if not new_ids:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -56,14 +192,15 @@ async def add_documents_batch(contents: List[str]):
 @app.get("/documents/{doc_id}")
 async def get_document(doc_id: int):
     """根據 ID 獲取文檔"""
-    if doc_id not in documents.documents:
+    content = document_store.get(doc_id)
+    if content is None:
         raise HTTPException(status_code=404, detail="Document not found")
-    return {"id": doc_id, "content": documents.documents[doc_id]}
+    return {"id": doc_id, "content": content}
 
 @app.delete("/documents/{doc_id}")
 async def delete_document_by_id(doc_id: int):
     """刪除特定 ID 的文檔"""
-    success = delete_document(doc_id)
+    success = await run_write(delete_document, doc_id)
     if not success:
         raise HTTPException(status_code=404, detail="Document not found")
     return {"message": f"Document {doc_id} deleted successfully"}
@@ -79,15 +216,19 @@ async def delete_documents_batch(request: DeleteBatchRequest):
     not_found_ids = []
     deleted_count = 0
 
-    for doc_id in doc_ids:
-        if doc_id not in documents.documents:
-            not_found_ids.append(doc_id)
-            continue
-        
-        del documents.documents[doc_id]
-        deleted_count += 1
+    def delete_all():
+        nonlocal deleted_count
+        for doc_id in doc_ids:
+            if doc_id not in document_store:
+                not_found_ids.append(doc_id)
+                continue
 
-    save_documents_to_file()
+            remove_stored_document(doc_id)
+            deleted_count += 1
+
+        commit_documents()
+
+    await run_write(delete_all)
 
     response = {
         "message": "刪除操作完成",
@@ -106,6 +247,12 @@ async def delete_documents_batch(request: DeleteBatchRequest):
 
 
 
+@app.get("/cache/stats")
+def cache_stats():
+    """各層快取的命中與未命中次數"""
+    return cache_statistics()
+
+
 @app.delete("/clear_cache") 
 def clear_cache():
     try:
@@ -0,0 +1,128 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import BooleanQuery
+import InvertedIndex
+import SegmentedIndex
+from Analyzer import Analyzer
+from documents import documents
+
+
+# ==================== 中日韓分詞效能測試 ==================== #
+#
+# 以英文種子文檔加上隨機組成的中文與中英混合文檔建立索引，比較不切分中文的
+# \w+ 分詞、只有二字詞與二字詞加單字三種分詞：分析速度、建索引時間、詞彙量，
+# 以及中文查詢 (包含單獨一個字的查詢) 的召回率與延遲。
+# 相關文檔定義為原文包含查詢字串的文檔。
+
+CHINESE_WORDS = (
+    '資料庫', '備份', '索引', '查詢', '效能', '伺服器', '快取', '搜尋', '引擎', '分散式', '系統', '叢集',
+    '記憶體', '硬碟', '網路', '延遲', '吞吐量', '交易', '一致性', '可用性', '分片', '複寫', '節點', '主機',
+    '使用者', '應用程式', '設定', '監控', '日誌', '錯誤', '版本', '升級', '部署', '容器', '雲端', '服務',
+    '演算法', '排序', '壓縮', '編碼', '文件', '內容', '關鍵字', '相似度', '向量', '模型', '訓練', '資料',
+    '我們', '可以', '如何', '為什麼', '因為', '所以', '但是', '如果', '已經', '需要', '透過', '提升',
+)
+ENGLISH_WORDS = ('MySQL', 'Redis', 'Python', 'Linux', 'API', 'SQL', 'Docker', 'PostgreSQL', 'cache', 'server')
+PUNCTUATION = '，。、；：！？'
+
+
+def chinese_sentence(rng, mixed):
+    parts = []
+    for _ in range(rng.randint(20, 80)):
+        if mixed and rng.random() < 0.15:
+            parts.append(f' {rng.choice(ENGLISH_WORDS)} ')
+        else:
+            parts.append(rng.choice(CHINESE_WORDS))
+        if rng.random() < 0.1:
+            parts.append(rng.choice(PUNCTUATION))
+    return ''.join(parts)
+
+
+def make_corpus(rng, chinese_count):
+    corpus = dict(enumerate(documents.values()))
+    for i in range(chinese_count):
+        corpus[len(corpus)] = chinese_sentence(rng, mixed=i % 2 == 1)
+    return corpus
+
+
+def use_analyzer(analyzer):
+    # 索引、TF-IDF 與布林查詢在各自的模組中引用共用的分析器，測試時一起替換
+    InvertedIndex.analyzer = SegmentedIndex.analyzer = BooleanQuery.analyzer = analyzer
+
+
+def boolean_matches(index, query):
+    root = BooleanQuery.plan(BooleanQuery.parse(BooleanQuery.tokenize(query)), index.df, index.doc_count)
+    return {doc_id for segment in index.parts()
+            for doc_id in BooleanQuery.matching_doc_ids(root, index, segment).tolist()}
+
+
+def measure(label, analyzer, corpus, queries):
+    use_analyzer(analyzer)
+    texts = list(corpus.values())
+    start = time.perf_counter()
+    for text in texts:
+        analyzer(text)
+    analysis = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = SegmentedIndex.SegmentedIndex(
+        SegmentedIndex.Segment(InvertedIndex.InvertedIndex(corpus), sorted(corpus)), corpus.get)
+    build = time.perf_counter() - start
+    # 位置索引在第一次片語查詢時才建立，計時前先建好
+    start = time.perf_counter()
+    for segment in index.parts():
+        index.positions_of(segment)
+    positions = time.perf_counter() - start
+
+    recall = {'bm25': 0.0, 'tfidf': 0.0, 'boolean': 0.0}
+    precision = {'bm25': 0.0, 'tfidf': 0.0, 'boolean': 0.0}
+    elapsed = {'bm25': 0.0, 'tfidf': 0.0, 'boolean': 0.0}
+    for query, relevant in queries:
+        searches = {
+            'bm25': lambda: {doc_id for _, doc_id in index.bm25_top_k(index.tokenize(query), len(corpus))},
+            'tfidf': lambda: {doc_id for _, doc_id in index.tfidf_top_k(query)},
+            'boolean': lambda: boolean_matches(index, query),
+        }
+        for kind, search in searches.items():
+            start = time.perf_counter()
+            found = search()
+            elapsed[kind] += time.perf_counter() - start
+            recall[kind] += len(found & relevant) / len(relevant)
+            precision[kind] += len(found & relevant) / len(found) if found else 0.0
+
+    print(f"\n{label}")
+    print(f"  analysis      {len(texts) / analysis:>10.0f} docs/sec")
+    print(f"  index build   {build:>10.2f} s")
+    print(f"  positions     {positions:>10.2f} s")
+    print(f"  vocabulary    {len(index.segments[0].index.postings):>10} terms")
+    for kind in recall:
+        print(f"  {kind:<8}  recall {recall[kind] / len(queries):>6.3f}  precision {precision[kind] / len(queries):>6.3f}"
+              f"  {elapsed[kind] / len(queries) * 1000:>8.2f} ms/query")
+
+
+def main():
+    rng = random.Random(0)
+    corpus = make_corpus(rng, 5000)
+    chinese = [text for text in corpus.values() if not text.isascii()]
+    characters = sorted({character for word in CHINESE_WORDS for character in word})
+    queries = []
+    for word in rng.sample(CHINESE_WORDS, 30) + [a + b for a, b in zip(rng.sample(CHINESE_WORDS, 20),
+                                                                        rng.sample(CHINESE_WORDS, 20))] + \
+            rng.sample(characters, 10):
+        relevant = {doc_id for doc_id, text in corpus.items() if word in text}
+        if relevant:
+            queries.append((word, relevant))
+    print(f"corpus: {len(corpus)} documents ({len(chinese)} non-ASCII), {len(queries)} Chinese queries "
+          f"(10 single characters)")
+
+    measure('word tokens (\\w+, CJK runs kept whole)', Analyzer(), corpus, queries)
+    measure('CJK bigrams', Analyzer(cjk=True, unigrams=False), corpus, queries)
+    measure('CJK bigrams + unigrams', Analyzer(cjk=True), corpus, queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# 在暫存目錄中執行，不會動到正式的文檔日誌與索引段
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix='pyseek-bench-')
+os.chdir(WORK_DIR)
+
+import VectorSearch
+
+
+# ==================== 批量寫入效能測試 ==================== #
+
+def make_documents(count, vocabulary, rng):
+    """用語料中的詞隨機組成 count 篇文檔"""
+    return [' '.join(rng.choices(vocabulary, k=rng.randint(20, 120))) for _ in range(count)]
+
+
+def run(label, function, contents):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        function(contents)
+        elapsed = time.perf_counter() - start
+    print(f"{label:<28}{len(contents):>8} docs{elapsed:>10.2f} s{len(contents) / elapsed:>12.0f} docs/sec")
+
+
+def add_one_by_one(contents):
+    for content in contents:
+        VectorSearch.add_new_document(content)
+
+
+def main():
+    rng = random.Random(0)
+    vocabulary = list(VectorSearch.inverted_index)
+    print(f"corpus: {len(VectorSearch.document_store)} documents, {len(vocabulary)} terms")
+    run('add_new_document loop', add_one_by_one, make_documents(1000, vocabulary, rng))
+    for count in (1000, 10000, 100000):
+        run('add_new_documents_batch', VectorSearch.add_new_documents_batch, make_documents(count, vocabulary, rng))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
@@ -0,0 +1,87 @@
+import fnmatch
+import os
+import sys
+
+import pytest
+
+# 模組都放在專案根目錄，測試直接匯入它們
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DocumentLog import DocumentLog
+
+DOCUMENTS = [
+    'the quick brown fox jumps over the lazy dog',
+    'a quick brown dog outpaces a quick fox',
+    'search engines rank documents with tf-idf and bm25',
+    'the inverted index maps every term to its postings',
+    'redis caches the ranked results of popular queries',
+    'positional indexes answer phrase and proximity queries',
+    'bitmap containers make boolean queries fast',
+    'performance engineering starts with measuring',
+    '搜索引擎使用倒排索引',
+    '中文分詞以二元組建立索引',
+]
+
+
+class MemoryRedis:
+    """只實作 VectorSearch 用到的指令，讓快取可以在沒有 Redis 伺服器時測試"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def incr(self, key):
+        value = int(self.data.get(key, b'0')) + 1
+        self.data[key] = str(value).encode()
+        return value
+
+    def pipeline(self, transaction=True):
+        redis = self
+
+        class Pipeline:
+            def __init__(self):
+                self.commands = []
+
+            def incr(self, key):
+                self.commands.append(key)
+
+            def execute(self):
+                return [redis.incr(key) for key in self.commands]
+
+        return Pipeline()
+
+    def scan_iter(self, match='*', count=None):
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+    def unlink(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+@pytest.fixture(scope='session')
+def search_engine(tmp_path_factory):
+    """在暫存目錄中以 DOCUMENTS 建立文檔日誌後載入 VectorSearch，快取改用 MemoryRedis"""
+    directory = tmp_path_factory.mktemp('engine')
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        log = DocumentLog('documents.log')
+        list(log.replay())
+        with log.locked():
+            for doc_id, content in enumerate(DOCUMENTS):
+                log.put(doc_id, content)
+            log.commit()
+        log.close()
+        import VectorSearch
+        VectorSearch.r = MemoryRedis()
+        yield VectorSearch
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,103 @@
+import re
+
+import pytest
+
+import InvertedIndex
+import SegmentedIndex
+from Analyzer import Analyzer, analyzer
+
+
+def test_default_tokens_match_the_tfidf_token_pattern():
+    text = 'Tf-IDF, BM25 and the Inverted-Index; café 42'
+    assert Analyzer()(text) == re.findall(r'(?u)\b\w+\b', text.lower())
+    assert Analyzer(lowercase=False)('Quick FOX') == ['Quick', 'FOX']
+
+
+def test_stopwords_and_stemming_are_cached_per_token():
+    stemmed = []
+
+    def stem(word):
+        stemmed.append(word)
+        return word.rstrip('s')
+
+    custom = Analyzer(stopwords=['The'], stemmer=stem)
+    assert custom('The cats chase the dogs and cats') == ['cat', 'chase', 'dog', 'and', 'cat']
+    assert sorted(stemmed) == ['and', 'cats', 'chase', 'dogs']
+
+
+def test_normalization_folds_compatibility_forms():
+    assert Analyzer(normalization='NFKC')('ＰＹＴＨＯＮ ﬁle') == ['python', 'file']
+    assert Analyzer()('ＰＹＴＨＯＮ') == ['ｐｙｔｈｏｎ']
+
+
+def test_fingerprint_changes_with_settings():
+    assert Analyzer().fingerprint == Analyzer().fingerprint
+    assert Analyzer().fingerprint != Analyzer(stopwords=['a']).fingerprint
+    assert Analyzer().fingerprint != Analyzer(cjk=True).fingerprint
+
+
+@pytest.fixture
+def tokenize_calls(monkeypatch):
+    """記錄索引模組呼叫分析器的次數"""
+    calls = []
+
+    def counting(text):
+        calls.append(text)
+        return analyzer(text)
+
+    monkeypatch.setattr(InvertedIndex, 'analyzer', counting)
+    return calls
+
+
+def test_indexes_reuse_tokens_passed_by_the_caller(monkeypatch, tokenize_calls):
+    monkeypatch.setattr(SegmentedIndex, 'BUFFER_LIMIT', 4)
+    texts = {doc_id: f'apple banana {doc_id}' for doc_id in range(6)}
+    tokens = {doc_id: analyzer(text) for doc_id, text in texts.items()}
+
+    index = SegmentedIndex.SegmentedIndex(text_of=texts.get)
+    index.add_documents({doc_id: texts[doc_id] for doc_id in range(3)}, tokens)
+    index.add_document(3, texts[3], tokens[3])      # 緩衝區滿了，封存時由詞列表建立位置索引
+    index.add_documents({4: texts[4], 5: texts[5]}, tokens)
+    index.remove_document(0, texts[0], tokens[0])   # 已封存的段
+    index.remove_document(5, texts[5], tokens[5])   # 緩衝區
+    for part in index.parts():
+        index.positions_of(part)
+    assert tokenize_calls == []
+
+    index.add_document(6, 'cherry')
+    index.remove_document(1, texts[1])
+    assert tokenize_calls == ['cherry', texts[1]]
+
+
+def test_each_new_document_is_tokenized_once(search_engine, tokenize_calls, monkeypatch):
+    monkeypatch.setattr(search_engine, 'analyzer', InvertedIndex.analyzer)
+    monkeypatch.setattr(search_engine, 'CACHE_TERM_TRACKING', True)
+    doc_ids = search_engine.add_new_documents_batch(['tokenized once', 'and only once'])
+    assert sorted(tokenize_calls) == ['and only once', 'tokenized once']
+
+    del tokenize_calls[:]
+    search_engine.delete_document(doc_ids[0])
+    assert tokenize_calls == ['tokenized once']
+
+
+def test_cjk_runs_become_interleaved_unigrams_and_bigrams():
+    cjk = Analyzer(cjk=True)
+    assert cjk('資料庫') == ['資', '資料', '料', '料庫', '庫']
+    assert cjk('MySQL資料庫 備份') == ['mysql', '資', '資料', '料', '料庫', '庫', '備', '備份', '份']
+    assert cjk('庫') == ['庫']
+    assert cjk('かな한국') == ['か', 'かな', 'な', 'な한', '한', '한국', '국']
+    assert Analyzer(cjk=True, unigrams=False)('資料庫') == ['資料', '料庫']
+    assert Analyzer(cjk=True, segmenter=lambda run: [run])('資料庫 備份') == ['資料庫', '備份']
+    assert Analyzer(cjk=True).fingerprint != Analyzer(cjk=True, unigrams=False).fingerprint
+
+
+def test_single_cjk_characters_match_inside_longer_runs(search_engine):
+    index = search_engine.inverted_index
+    assert sorted(doc_id for _, doc_id in index.bm25_top_k(index.tokenize('索'), 10)) == [8, 9]
+    assert [doc_id for _, doc_id in index.tfidf_top_k('擎')] == [8]
+    search = lambda query: sorted(match[1] for match in search_engine.rank_boolean_search(query, index))
+    assert search('索') == [8, 9]
+    # 多字的詞是片語：字必須連續出現
+    assert search('倒排索引') == [8]
+    assert search('排引') == []
+    assert search('"二元組" AND 索') == [9]
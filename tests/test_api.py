@@ -0,0 +1,108 @@
+import functools
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope='module')
+def client(search_engine):
+    import api
+    with TestClient(api.app) as client:
+        yield client
+
+
+def _ids(response):
+    assert response.status_code == 200, response.text
+    return [match[1] for match in response.json()['results']]
+
+
+def test_search_honours_limit(client):
+    top = _ids(client.get('/search', params={'query': 'quick fox', 'limit': 3}))
+    assert top[:2] == [1, 0]
+    assert _ids(client.get('/search', params={'query': 'quick fox', 'limit': 1})) == top[:1]
+    assert _ids(client.get('/search', params={'query': 'quick fox', 'limit': 3, 'ranking': 'bm25'}))[:2] == [1, 0]
+
+
+def test_cache_hit_returns_the_same_results(client, search_engine):
+    search_engine.clear_all_cache()
+    first = client.get('/search', params={'query': 'inverted index', 'limit': 2}).json()
+    hits = search_engine.local_cache.hits
+    # 不同 limit 共用同一筆快取
+    second = client.get('/search', params={'query': 'INVERTED   index', 'limit': 1}).json()
+    assert search_engine.local_cache.hits == hits + 1
+    assert second['results'] == first['results'][:1]
+
+
+def test_hydrate_matches_reads_only_the_requested_documents(search_engine, monkeypatch):
+    class CountingStore(dict):
+        reads = 0
+
+        def get(self, doc_id):
+            self.reads += 1
+            return super().get(doc_id)
+
+    store = CountingStore({doc_id: f'document {doc_id}' for doc_id in range(50) if doc_id != 1})
+    monkeypatch.setattr(search_engine, 'document_store', store)
+    data = search_engine.pack_matches([(1 - doc_id / 100, doc_id) for doc_id in range(50)])
+
+    # 已刪除的文檔 1 被略過，由下一名遞補
+    assert [match[1] for match in search_engine.hydrate_matches(data, 3)] == [0, 2, 3]
+    assert store.reads == 4
+    assert len(search_engine.hydrate_matches(data)) == 49
+
+
+def test_no_results_suggests_spelling(client):
+    response = client.get('/search', params={'query': 'quikc'}).json()
+    assert response == {'results': [], 'did_you_mean': 'quick'}
+
+
+def test_batch_search_is_aligned_with_queries(client):
+    queries = ['quick fox', 'bitmap', 'no such words here']
+    response = client.post('/search/batch', json={'queries': queries, 'limit': 2})
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert [result['query'] for result in results] == queries
+    assert [match[1] for match in results[1]['results']] == [6]
+    assert results[2]['results'] == []
+    assert client.post('/search/batch', json={'queries': ['a'] * 1001}).status_code == 400
+
+
+def test_boolean_search(client):
+    assert sorted(_ids(client.get('/search/boolean', params={'query': 'quick AND NOT lazy'}))) == [1]
+    assert sorted(_ids(client.get('/search/boolean', params={'query': '"brown fox"'}))) == [0]
+    assert client.get('/search/boolean', params={'query': '(quick'}).status_code == 400
+
+
+def test_suggest_completes_the_last_word(client):
+    suggestions = client.get('/suggest', params={'prefix': 'the qu'}).json()['suggestions']
+    assert suggestions == [{'term': 'queries', 'df': 3}, {'term': 'quick', 'df': 2}]
+    assert client.get('/suggest', params={'prefix': 'the qu '}).json()['suggestions'] == []
+    response = client.get('/suggest', params={'prefix': 'qu' + chr(0x10FFFF)})
+    assert response.status_code == 200 and response.json()['suggestions'] == []
+
+
+def test_too_broad_wildcard_is_a_bad_request(client, search_engine, monkeypatch):
+    index = search_engine.inverted_index
+    monkeypatch.setattr(index, 'wildcard_terms', functools.partial(type(index).wildcard_terms, index, limit=2))
+    assert sorted(_ids(client.get('/search/boolean', params={'query': 'quic*'}))) == [0, 1]
+    response = client.get('/search/boolean', params={'query': 'b*'})
+    assert response.status_code == 400 and 'pattern too broad' in response.json()['detail']
+
+
+def test_documents_are_searchable_until_deleted(client):
+    query = {'query': 'xylophone', 'limit': 5}
+    assert _ids(client.get('/search', params=query)) == []
+
+    new_id = client.post('/documents', params={'content': 'a xylophone solo'}).json()['id']
+    assert client.get(f'/documents/{new_id}').json() == {'id': new_id, 'content': 'a xylophone solo'}
+    assert _ids(client.get('/search', params=query)) == [new_id]
+
+    batch = client.post('/documents/batch', json=['xylophone duet', 'xylophone trio']).json()['ids']
+    assert sorted(_ids(client.get('/search', params=query))) == sorted([new_id] + batch)
+
+    assert client.delete(f'/documents/{new_id}').status_code == 200
+    assert client.get(f'/documents/{new_id}').status_code == 404
+    assert client.delete(f'/documents/{new_id}').status_code == 404
+    response = client.post('/documents/batch/delete', json={'doc_ids': batch + [new_id]}).json()
+    assert response['deleted_count'] == 2 and response['not_found_ids'] == [new_id]
+    assert _ids(client.get('/search', params=query)) == []
@@ -0,0 +1,73 @@
+import random
+
+import numpy as np
+import pytest
+
+import InvertedIndex as inverted_index_module
+import SegmentedIndex
+from InvertedIndex import InvertedIndex
+from SegmentedIndex import Segment
+
+# 詞頻差異很大的詞彙，常見詞的倒排列表有許多塊
+WORDS = [f'w{i}' for i in range(60)]
+WEIGHTS = [1 / (i + 1) for i in range(60)]
+QUERIES = [['w0'], ['w0', 'w1'], ['w0', 'w5', 'w30'], ['w2', 'w2', 'w9'], ['w59', 'w0'], ['w3', 'w4', 'w6', 'w7'],
+           ['missing'], ['w0', 'missing']]
+
+
+def _corpus(seed, count):
+    rng = random.Random(seed)
+    return {doc_id: ' '.join(rng.choices(WORDS, WEIGHTS, k=rng.randint(3, 40))) for doc_id in range(count)}
+
+
+def _exhaustive(index, words, k):
+    ranked = sorted(((score, doc_id) for doc_id, score in index.bm25_scores(words).items()), reverse=True)
+    return ranked[:k]
+
+
+def _assert_same_ranking(found, expected):
+    # 同分的文檔可能以不同順序入選，只比較分數並確認每篇的分數正確
+    assert [score for score, _ in found] == pytest.approx([score for score, _ in expected])
+    assert len({doc_id for _, doc_id in found}) == len(found)
+
+
+@pytest.mark.parametrize('min_blocks', [0, inverted_index_module.TOP_K_MIN_BLOCKS])
+@pytest.mark.parametrize('k', [1, 10, 100])
+def test_top_k_matches_exhaustive_scoring(monkeypatch, min_blocks, k):
+    monkeypatch.setattr(inverted_index_module, 'TOP_K_MIN_BLOCKS', min_blocks)
+    index = InvertedIndex(_corpus(1, 4000))
+    for words in QUERIES:
+        found = index.bm25_top_k(words, k)
+        expected = _exhaustive(index, words, k)
+        _assert_same_ranking(found, expected)
+        scores = index.bm25_scores(words)
+        assert all(scores[doc_id] == pytest.approx(score) for score, doc_id in found)
+
+
+def test_top_k_skips_excluded_documents(monkeypatch):
+    monkeypatch.setattr(inverted_index_module, 'TOP_K_MIN_BLOCKS', 0)
+    index = InvertedIndex(_corpus(2, 3000))
+    best = [doc_id for _, doc_id in index.bm25_top_k(['w0', 'w1'], 20)]
+    exclude = np.array(sorted(best[::2]), dtype=np.int64)
+    found = index.bm25_top_k(['w0', 'w1'], 10, exclude=exclude)
+    assert not set(exclude.tolist()) & {doc_id for _, doc_id in found}
+    expected = [(score, doc_id) for score, doc_id in _exhaustive(index, ['w0', 'w1'], 40)
+                if doc_id not in set(exclude.tolist())][:10]
+    _assert_same_ranking(found, expected)
+
+
+def test_segmented_top_k_uses_corpus_statistics(monkeypatch):
+    """每個段各自剪枝，合併後與把全部文檔放在一個索引中評分的結果相同"""
+    monkeypatch.setattr(SegmentedIndex, 'BUFFER_LIMIT', 500)
+    texts = _corpus(3, 3000)
+    base = {doc_id: text for doc_id, text in texts.items() if doc_id < 1000}
+    segmented = SegmentedIndex.SegmentedIndex(Segment(InvertedIndex(base), sorted(base)), texts.get)
+    for start in range(1000, 3000, 250):
+        segmented.add_documents({doc_id: texts[doc_id] for doc_id in range(start, start + 250)})
+    segmented.wait_for_merges()
+    for doc_id in random.Random(4).sample(sorted(texts), 300):
+        segmented.remove_document(doc_id, texts.pop(doc_id))
+
+    single = InvertedIndex(texts)
+    for words in QUERIES:
+        _assert_same_ranking(segmented.bm25_top_k(words, 10), _exhaustive(single, words, 10))
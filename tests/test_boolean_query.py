@@ -0,0 +1,163 @@
+import random
+
+import numpy as np
+import pytest
+
+import BooleanQuery
+import SegmentedIndex
+from Analyzer import analyzer
+from IndexSegment import IndexSegment, write_segment
+from InvertedIndex import InvertedIndex
+from PositionIndex import PositionIndex
+from SegmentedIndex import Segment
+
+WORDS = ['apple', 'banana', 'cherry', 'date', 'elder', 'fig', 'grape', 'honey']
+MISSING = 'zebra'
+
+
+class BruteForce:
+    """直接以每篇文檔的詞集合求值的布林查詢：NOT > AND > OR，相鄰的運算元視為 AND"""
+
+    def __init__(self, texts):
+        self.words = {doc_id: set(text.split()) for doc_id, text in texts.items()}
+
+    def __call__(self, query):
+        self.tokens = query.replace('(', ' ( ').replace(')', ' ) ').split()
+        self.position = 0
+        result = self.disjunction()
+        assert self.position == len(self.tokens)
+        return result
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def disjunction(self):
+        result = self.conjunction()
+        while self.peek() == 'OR':
+            self.take()
+            result |= self.conjunction()
+        return result
+
+    def conjunction(self):
+        result = self.negation()
+        while self.peek() not in (None, 'OR', ')'):
+            if self.peek() == 'AND':
+                self.take()
+            result &= self.negation()
+        return result
+
+    def negation(self):
+        if self.peek() == 'NOT':
+            self.take()
+            return set(self.words) - self.negation()
+        if self.peek() == '(':
+            self.take()
+            result = self.disjunction()
+            assert self.take() == ')'
+            return result
+        word = self.take()
+        return {doc_id for doc_id, words in self.words.items() if word in words}
+
+
+def _random_query(rng, depth=0):
+    if depth > 2 or rng.random() < 0.3:
+        word = rng.choice(WORDS + [MISSING])
+        return f'NOT {word}' if rng.random() < 0.2 else word
+    left, right = _random_query(rng, depth + 1), _random_query(rng, depth + 1)
+    query = f'{left} {rng.choice(["AND", "OR", "", "AND NOT"])} {right}'.replace('  ', ' ')
+    return f'({query})' if rng.random() < 0.5 else query
+
+
+@pytest.fixture
+def index(monkeypatch):
+    """由基礎段、數個封存段與緩衝區組成的索引，各部分都有已刪除的文檔"""
+    monkeypatch.setattr(SegmentedIndex, 'BUFFER_LIMIT', 40)
+    rng = random.Random(5)
+    texts = {doc_id: ' '.join(rng.choices(WORDS, k=rng.randint(1, 6))) for doc_id in range(300)}
+    base = {doc_id: text for doc_id, text in texts.items() if doc_id < 150}
+    segmented = SegmentedIndex.SegmentedIndex(Segment(InvertedIndex(base), sorted(base)), texts.get)
+    for start in range(150, 300, 30):
+        segmented.add_documents({doc_id: texts[doc_id] for doc_id in range(start, start + 30)})
+    segmented.wait_for_merges()
+    for doc_id in rng.sample(sorted(texts), 40):
+        segmented.remove_document(doc_id, texts.pop(doc_id))
+    segmented.wait_for_merges()
+    assert len(segmented.parts()) > 1
+    return segmented, texts
+
+
+def _match(query, index):
+    root = BooleanQuery.plan(BooleanQuery.parse(BooleanQuery.tokenize(query)), index.df, index.doc_count,
+                             index.wildcard_terms)
+    return sorted(doc_id for part in index.parts()
+                  for doc_id in BooleanQuery.matching_doc_ids(root, index, part).tolist())
+
+
+def test_matches_brute_force(index):
+    segmented, texts = index
+    brute_force = BruteForce(texts)
+    rng = random.Random(17)
+    for query in ['apple', 'NOT apple', 'apple banana', 'apple OR NOT banana', f'{MISSING} OR fig',
+                  'NOT (apple OR banana) cherry', 'NOT NOT date'] + [_random_query(rng) for _ in range(200)]:
+        assert _match(query, segmented) == sorted(brute_force(query)), query
+
+
+@pytest.mark.parametrize('query', ['(apple', 'apple)', '(apple OR (banana)', ')apple('])
+def test_unbalanced_parentheses(query):
+    with pytest.raises(ValueError):
+        BooleanQuery.parse(BooleanQuery.tokenize(query))
+
+
+def _phrase(texts, words):
+    return {doc_id for doc_id, text in texts.items()
+            if any(analyzer(text)[i:i + len(words)] == words for i in range(len(analyzer(text))))}
+
+
+def _near(texts, left, right, distance):
+    matches = set()
+    for doc_id, text in texts.items():
+        tokens = analyzer(text)
+        left_positions = [i for i, word in enumerate(tokens) if word == left]
+        right_positions = [i for i, word in enumerate(tokens) if word == right]
+        if any(abs(i - j) <= distance for i in left_positions for j in right_positions):
+            matches.add(doc_id)
+    return matches
+
+
+def test_phrase_and_near_match_brute_force(index):
+    segmented, texts = index
+    rng = random.Random(23)
+    for _ in range(60):
+        words = rng.sample(WORDS, rng.randint(2, 3))
+        assert _match('"%s"' % ' '.join(words), segmented) == sorted(_phrase(texts, words)), words
+        left, right, distance = rng.choice(WORDS), rng.choice(WORDS), rng.randint(0, 4)
+        assert _match(f'{left} NEAR/{distance} {right}', segmented) == sorted(_near(texts, left, right, distance))
+    # 巢狀的位置運算元：候選文檔中沒有片語的也不能出錯
+    both = _phrase(texts, ['apple', 'banana']) & _phrase(texts, ['cherry', 'date'])
+    assert set(_match('"apple banana" NEAR/9 "cherry date"', segmented)) <= both
+    assert _match('"apple banana" NEAR/9 "cherry date" OR fig', segmented) == \
+        sorted(set(_match('"apple banana" NEAR/9 "cherry date"', segmented)) | BruteForce(texts)('fig'))
+
+
+def test_positions_are_read_from_the_segment_file(tmp_path):
+    rng = random.Random(29)
+    texts = {doc_id: ' '.join(rng.choices(WORDS, k=rng.randint(1, 6))) for doc_id in range(0, 200, 2)}
+    positions = PositionIndex.build((doc_id, analyzer(texts[doc_id])) for doc_id in sorted(texts))
+    built = InvertedIndex(texts)
+    write_segment(str(tmp_path / 'index.seg'), built, texts, (0, 0), positions)
+    stored = IndexSegment(str(tmp_path / 'index.seg')).position_index()
+    assert stored.words() == positions.words()
+    doc_ids = np.array(sorted(texts), dtype=np.int64)
+    for word in WORDS:
+        assert (stored.keys(word, doc_ids) == positions.keys(word, doc_ids)).all()
+
+    def unavailable(doc_id):
+        raise AssertionError('位置索引應該來自索引段，不需要文檔內容')
+
+    segmented = SegmentedIndex.SegmentedIndex(Segment(built, sorted(texts), positions=stored), unavailable)
+    assert _match('"apple banana"', segmented) == sorted(_phrase(texts, ['apple', 'banana']))
+    assert _match('fig NEAR/2 grape', segmented) == sorted(_near(texts, 'fig', 'grape', 2))
@@ -0,0 +1,64 @@
+import sys
+import threading
+
+
+def test_redis_counters_are_exact_under_concurrent_lookups(search_engine):
+    search_engine.clear_all_cache()
+    before = search_engine.cache_statistics()['redis']
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+    def lookup():
+        # 從未寫入的查詢每次都會問到 Redis
+        for _ in range(2000):
+            search_engine.get_from_cache('never cached')
+
+    try:
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert search_engine.cache_statistics()['redis']['misses'] - before['misses'] == 8 * 2000
+
+    search_engine.add_to_cache('quick fox', [(1.0, 1)])
+    search_engine.local_cache.clear()
+    assert [match[1] for match in search_engine.get_from_cache('quick fox')] == [1]
+    assert search_engine.cache_statistics()['redis']['hits'] == before['hits'] + 1
+
+
+def test_equivalent_queries_share_a_key(search_engine):
+    assert search_engine.cache_key('Quick   FOX') == search_engine.cache_key('quick fox')
+    assert search_engine.cache_key('quick fox', 'bm25') != search_engine.cache_key('quick fox')
+    assert search_engine.cache_key('quick and fox', 'boolean') == search_engine.cache_key('quick AND fox', 'boolean')
+
+
+def test_writes_move_every_key_to_a_new_generation(search_engine):
+    key = search_engine.cache_key('quick fox')
+    search_engine.add_to_cache('quick fox', [(1.0, 1)])
+    search_engine.invalidate_cache({'unrelated'})
+    assert search_engine.cache_key('quick fox') != key
+    assert search_engine.get_from_cache('quick fox') is None
+
+
+def test_term_tracking_only_invalidates_affected_queries(search_engine, monkeypatch):
+    monkeypatch.setattr(search_engine, 'CACHE_TERM_TRACKING', True)
+    queries = [('quick fox', 'tfidf'), ('lazy dog', 'tfidf'), ('lazy AND NOT fox', 'boolean'), ('bit*', 'boolean')]
+    keys = [search_engine.cache_key(query, kind) for query, kind in queries]
+    search_engine.invalidate_cache({'dog'})
+    changed = {query for (query, kind), key in zip(queries, keys) if search_engine.cache_key(query, kind) != key}
+    # NOT 與萬用字元的結果取決於整個索引，仍然跟著世代編號失效
+    assert changed == {'lazy dog', 'lazy AND NOT fox', 'bit*'}
+
+
+def test_new_documents_are_not_hidden_by_cached_results(search_engine):
+    search = lambda: search_engine.cached_search('zyzzyva', 'tfidf', lambda: search_engine.rank_tfidf_search(
+        'zyzzyva', search_engine.inverted_index, search_engine.CACHE_TOP_N))
+    assert search() == []
+    assert search() == []
+    doc_id = search_engine.add_new_document('a zyzzyva is a weevil')
+    assert [match[1] for match in search()] == [doc_id]
+    search_engine.delete_document(doc_id)
+    assert search() == []
@@ -0,0 +1,75 @@
+import os
+
+from DocumentLog import OP_DELETE, OP_PUT, DocumentLog
+
+
+def _write(path, records):
+    log = DocumentLog(path)
+    list(log.replay())
+    with log.locked():
+        for op, doc_id, content in records:
+            if op == OP_PUT:
+                log.put(doc_id, content)
+            else:
+                log.delete(doc_id)
+        log.commit()
+    log.close()
+    return log
+
+
+RECORDS = [(OP_PUT, 0, 'first document'), (OP_PUT, 1, '第二篇文檔'), (OP_DELETE, 0, ''), (OP_PUT, 7, 'third')]
+
+
+def test_replay_returns_committed_records(tmp_path):
+    path = str(tmp_path / 'documents.log')
+    _write(path, RECORDS)
+    log = DocumentLog(path)
+    assert list(log.replay()) == RECORDS
+    assert log.next_doc_id == 8
+
+
+def test_torn_tail_is_truncated_on_restart(tmp_path):
+    path = str(tmp_path / 'documents.log')
+    complete = _write(path, RECORDS).size
+    # 模擬寫到一半就當機：最後一筆記錄只有一部分落在磁碟上
+    _write(path, [(OP_PUT, 9, 'a record that never finished')])
+    os.truncate(path, os.path.getsize(path) - 5)
+
+    log = DocumentLog(path)
+    assert list(log.replay()) == RECORDS
+    assert os.path.getsize(path) == complete
+
+    # 截斷之後追加的記錄在下次啟動時可以正常讀回
+    with log.locked():
+        log.put(10, 'after restart')
+        log.commit()
+    log.close()
+    assert list(DocumentLog(path).replay()) == RECORDS + [(OP_PUT, 10, 'after restart')]
+
+
+def test_corrupted_record_and_rest_are_dropped(tmp_path):
+    path = str(tmp_path / 'documents.log')
+    complete = _write(path, RECORDS).size
+    _write(path, [(OP_PUT, 9, 'checksum will not match'), (OP_PUT, 10, 'never reached')])
+    with open(path, 'r+b') as f:
+        f.seek(complete + 20)
+        f.write(b'X')
+
+    log = DocumentLog(path)
+    assert list(log.replay()) == RECORDS
+    assert os.path.getsize(path) == complete
+
+
+def test_compaction_keeps_live_documents(tmp_path):
+    path = str(tmp_path / 'documents.log')
+    _write(path, RECORDS)
+    log = DocumentLog(path)
+    list(log.replay())
+    generation = log.generation
+    with log.locked():
+        log.compact({1: '第二篇文檔', 7: 'third'})
+    log.close()
+
+    reopened = DocumentLog(path)
+    assert reopened.generation == generation + 1
+    assert list(reopened.replay()) == [(OP_PUT, 1, '第二篇文檔'), (OP_PUT, 7, 'third')]
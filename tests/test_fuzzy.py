@@ -0,0 +1,64 @@
+import random
+
+import pytest
+from rapidfuzz.distance import Levenshtein
+
+from FuzzyTermIndex import FuzzyTermIndex, auto_distance
+from InvertedIndex import InvertedIndex
+from SegmentedIndex import Segment, SegmentedIndex
+
+
+@pytest.fixture(scope='module')
+def vocabulary():
+    rng = random.Random(13)
+    return sorted({''.join(rng.choices('abcdef', k=rng.randint(1, 9))) for _ in range(3000)})
+
+
+def test_search_matches_brute_force(vocabulary):
+    index = FuzzyTermIndex(vocabulary)
+    rng = random.Random(31)
+    queries = rng.sample(vocabulary, 40) + [''.join(rng.choices('abcdefg', k=rng.randint(1, 10))) for _ in range(40)]
+    for word in queries:
+        for distance in range(3):
+            expected = {term: Levenshtein.distance(word, term) for term in vocabulary
+                        if Levenshtein.distance(word, term) <= distance}
+            assert dict(index.search(word, distance)) == expected, (word, distance)
+
+
+def test_auto_distance_grows_with_word_length():
+    assert [auto_distance('x' * length) for length in range(1, 9)] == [0, 0, 1, 1, 1, 2, 2, 2]
+
+
+@pytest.fixture
+def index():
+    texts = {0: 'quick brown fox', 1: 'quick brown dog', 2: 'quirk of fate', 3: 'brawn and brains',
+             4: 'quack quack', 5: 'the brown bear'}
+    return SegmentedIndex(Segment(InvertedIndex({doc_id: texts[doc_id] for doc_id in range(3)}), range(3)),
+                          texts.get), texts
+
+
+def test_fuzzy_terms_rank_by_distance_then_frequency(index):
+    segmented, texts = index
+    segmented.add_documents({doc_id: texts[doc_id] for doc_id in range(3, 6)})
+    # 詞本身排最前面，同距離的依整個語料的文檔頻率
+    assert segmented.fuzzy_terms('brown') == ['brown', 'brawn']
+    assert segmented.fuzzy_terms('quick', distance=1) == ['quick', 'quack', 'quirk']
+    assert segmented.fuzzy_terms('quick', distance=1, limit=2) == ['quick', 'quack']
+    assert segmented.fuzzy_terms('brewn') == ['brown', 'brawn']
+    assert segmented.fuzzy_terms('quicj') == ['quick']
+    assert segmented.fuzzy_terms('ox') == []
+
+
+def test_expand_fuzzy_keeps_words_without_close_terms(index):
+    segmented, _ = index
+    assert segmented.expand_fuzzy('Quikk brwn zebra', limit=1) == ['quick', 'brown', 'zebra']
+
+
+def test_fuzzy_search_through_the_api(search_engine):
+    from fastapi.testclient import TestClient
+    import api
+    with TestClient(api.app) as client:
+        exact = client.get('/search', params={'query': 'brwn fxo', 'limit': 3}).json()
+        fuzzy = client.get('/search', params={'query': 'brwn fxo', 'limit': 3, 'fuzzy': True}).json()
+    assert exact['results'] == []
+    assert {match[1] for match in fuzzy['results']} == {0, 1}
@@ -0,0 +1,123 @@
+import random
+
+import numpy as np
+import pytest
+
+from PostingList import (BLOCK_SIZE, SKIP_BASE, SKIP_COUNT, SKIP_LAST, SKIP_MAX_TF, PostingDictionary,
+                         PostingList, varbyte_decode, varbyte_encode)
+
+
+def _random_postings(rng, count, span):
+    doc_ids = np.array(sorted(rng.sample(range(span), count)), dtype=np.int64)
+    tfs = np.array([rng.randint(1, 300) for _ in range(count)], dtype=np.int64)
+    return doc_ids, tfs
+
+
+@pytest.mark.parametrize('values', [
+    [],
+    [0],
+    [127, 128, 16383, 16384, 2 ** 21, 2 ** 35, 2 ** 63 - 1],
+    list(range(1000)),
+])
+def test_varbyte_round_trip(values):
+    assert varbyte_decode(varbyte_encode(values)).tolist() == values
+
+
+def test_varbyte_round_trip_random():
+    rng = np.random.default_rng(7)
+    values = rng.integers(0, 2 ** 40, size=5000, dtype=np.uint64) >> rng.integers(0, 40, size=5000, dtype=np.uint64)
+    assert np.array_equal(varbyte_decode(varbyte_encode(values)), values)
+
+
+@pytest.mark.parametrize('count', [0, 1, BLOCK_SIZE - 1, BLOCK_SIZE, 5 * BLOCK_SIZE + 17])
+def test_blocks_and_skip_table(count):
+    doc_ids, tfs = _random_postings(random.Random(count), count, 100000)
+    postings = PostingList.from_arrays(doc_ids, tfs)
+
+    decoded_ids, decoded_tfs = postings.decode()
+    assert np.array_equal(decoded_ids, doc_ids)
+    assert np.array_equal(decoded_tfs, tfs)
+    assert len(postings) == count
+    assert postings.block_count == (count + BLOCK_SIZE - 1) // BLOCK_SIZE
+
+    # 跳表的每一列都要與該塊解碼出的內容一致
+    for block in range(postings.block_count):
+        block_ids, block_tfs = postings.decode_block(block)
+        start = block * BLOCK_SIZE
+        assert np.array_equal(block_ids, doc_ids[start:start + BLOCK_SIZE])
+        assert np.array_equal(block_tfs, tfs[start:start + BLOCK_SIZE])
+        row = postings.skips[block]
+        assert row[SKIP_BASE] == (doc_ids[start - 1] if start else 0)
+        assert row[SKIP_LAST] == block_ids[-1]
+        assert row[SKIP_COUNT] == start + block_ids.size
+        assert row[SKIP_MAX_TF] == block_tfs.max()
+
+    if postings.block_count > 2:
+        some = [0, postings.block_count - 1]
+        some_ids, _ = postings.decode_blocks(some)
+        expected = np.concatenate([postings.decode_block(block)[0] for block in some])
+        assert np.array_equal(some_ids, expected)
+
+
+def test_lookup_matches_set_intersection():
+    rng = random.Random(3)
+    doc_ids, tfs = _random_postings(rng, 3000, 50000)
+    postings = PostingList.from_arrays(doc_ids, tfs)
+    tf_of = dict(zip(doc_ids.tolist(), tfs.tolist()))
+    for size in (1, 10, 500):
+        probe = np.array(sorted(rng.sample(range(50000), size)), dtype=np.int64)
+        found_ids, found_tfs = postings.lookup(probe)
+        expected = sorted(set(probe.tolist()) & set(tf_of))
+        assert found_ids.tolist() == expected
+        assert found_tfs.tolist() == [tf_of[doc_id] for doc_id in expected]
+
+
+def test_updates_match_reference():
+    """逐篇新增、批量追加、亂序插入與刪除後，內容與 dict 模擬的結果相同"""
+    rng = random.Random(11)
+    postings = PostingList()
+    reference = {}
+    next_id = 0
+    for _ in range(400):
+        action = rng.random()
+        if action < 0.4:
+            next_id += rng.randint(1, 5)
+            tf = rng.randint(1, 9)
+            postings.add(next_id, tf)
+            reference[next_id] = tf
+        elif action < 0.6:
+            batch = list(range(next_id + 1, next_id + 1 + rng.randint(1, 300)))
+            batch_tfs = [rng.randint(1, 9) for _ in batch]
+            postings.extend(batch, batch_tfs)
+            reference.update(zip(batch, batch_tfs))
+            next_id = batch[-1]
+        elif action < 0.65 and reference:
+            doc_id = rng.choice(sorted(reference))
+            postings.add(doc_id, 42)
+            reference[doc_id] = 42
+        elif reference:
+            doc_id = rng.choice(sorted(reference))
+            assert postings.remove(doc_id)
+            del reference[doc_id]
+        ids, tfs = postings.decode()
+        assert ids.tolist() == sorted(reference)
+        assert tfs.tolist() == [reference[doc_id] for doc_id in sorted(reference)]
+    assert not postings.remove(next_id + 1)
+
+
+def test_dictionary_copy_is_independent():
+    words = ['apple', 'banana']
+    dictionary = PostingDictionary.build(words, [0, 0, 1], [1, 5, 3], [2, 1, 4])
+    dictionary.for_update('apple').add(9, 1)
+    copy = dictionary.copy()
+
+    copy.for_update('apple').add(12, 3)
+    copy.for_update('banana').remove(3)
+    del copy['banana']
+    copy.for_update('cherry').add(2, 1)
+
+    assert dictionary['apple'].doc_ids().tolist() == [1, 5, 9]
+    assert dictionary['banana'].doc_ids().tolist() == [3]
+    assert 'cherry' not in dictionary
+    assert copy['apple'].doc_ids().tolist() == [1, 5, 9, 12]
+    assert 'banana' not in copy
@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from RoaringBitmap import ARRAY_LIMIT, RoaringBitmap
+
+
+def _random_set(rng, dense):
+    """跨越多個容器的集合；dense 時部分容器超過 ARRAY_LIMIT，會以點陣保存"""
+    values = set()
+    for high in rng.sample(range(6), 4):
+        count = rng.randint(ARRAY_LIMIT + 1, 3 * ARRAY_LIMIT) if dense and rng.random() < 0.5 else rng.randint(0, 300)
+        values.update((high << 16) + low for low in rng.sample(range(1 << 16), count))
+    return values
+
+
+def _bitmap(values):
+    return RoaringBitmap.from_sorted(sorted(values))
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_operations_match_set_algebra(seed):
+    rng = random.Random(seed)
+    left, right = _random_set(rng, dense=seed % 2 == 0), _random_set(rng, dense=seed % 3 == 0)
+    a, b = _bitmap(left), _bitmap(right)
+
+    assert a.to_array().tolist() == sorted(left)
+    assert len(a) == len(left)
+    assert (a & b).to_array().tolist() == sorted(left & right)
+    assert (a | b).to_array().tolist() == sorted(left | right)
+    assert (a - b).to_array().tolist() == sorted(left - right)
+    assert (b - a).to_array().tolist() == sorted(right - left)
+    assert len(a & b) == len(left & right)
+
+
+def test_empty_results():
+    values = _random_set(random.Random(9), dense=True)
+    bitmap = _bitmap(values)
+    empty = RoaringBitmap.from_sorted([])
+
+    assert not (bitmap - bitmap)
+    assert not (bitmap & empty)
+    assert (bitmap | empty).to_array().tolist() == sorted(values)
+    assert len(empty) == 0
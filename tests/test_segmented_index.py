@@ -0,0 +1,137 @@
+import random
+import sys
+import threading
+
+import pytest
+
+import SegmentedIndex
+from InvertedIndex import InvertedIndex
+from SegmentedIndex import Segment
+
+WORDS = ['apple', 'banana', 'cherry', 'date', 'elder', 'fig', 'grape', 'honey', 'kiwi', 'lemon']
+QUERIES = ['apple banana', 'cherry', 'fig grape honey', 'kiwi lemon apple', 'date']
+
+
+def _texts(rng, doc_ids):
+    return {doc_id: ' '.join(rng.choices(WORDS, k=rng.randint(1, 8))) for doc_id in doc_ids}
+
+
+def _build(texts):
+    base = dict(texts)
+    return SegmentedIndex.SegmentedIndex(Segment(InvertedIndex(base), sorted(base)), base.get)
+
+
+def _scores(index, query):
+    doc_ids, scores = index.tfidf_scores(query)
+    return dict(zip(doc_ids.tolist(), scores.tolist()))
+
+
+@pytest.fixture
+def fast_switching():
+    """縮短執行緒切換間隔，讓讀寫交錯的機會變多"""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_tfidf_matches_rebuilt_index_after_concurrent_writes(monkeypatch, fast_switching):
+    """寫入與查詢同時進行時，快取的文檔長度不能與別的版本的 IDF 混用"""
+    monkeypatch.setattr(SegmentedIndex, 'BUFFER_LIMIT', 25)
+    rng = random.Random(21)
+    texts = _texts(rng, range(200))
+    index = SegmentedIndex.SegmentedIndex(Segment(InvertedIndex(texts), sorted(texts)), lambda doc_id: texts.get(doc_id))
+
+    done = threading.Event()
+    errors = []
+
+    def write():
+        try:
+            next_id = 200
+            for _ in range(60):
+                batch = _texts(rng, range(next_id, next_id + rng.randint(1, 8)))
+                next_id += len(batch)
+                texts.update(batch)
+                index.add_documents(batch)
+                for doc_id in rng.sample(sorted(texts), 2):
+                    index.remove_document(doc_id, texts.pop(doc_id))
+        except Exception as error:
+            errors.append(error)
+        finally:
+            done.set()
+
+    def read():
+        try:
+            while not done.is_set():
+                for scores in [_scores(index, query) for query in QUERIES]:
+                    assert all(score <= 1 + 1e-9 for score in scores.values())
+                for ranked in index.tfidf_top_k_batch(QUERIES, 10):
+                    assert all(score <= 1 + 1e-9 for score, _ in ranked)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    index.wait_for_merges()
+    assert not errors, errors
+
+    rebuilt = _build(texts)
+    for query in QUERIES:
+        expected = _scores(rebuilt, query)
+        found = _scores(index, query)
+        assert found.keys() == expected.keys()
+        assert all(found[doc_id] == pytest.approx(expected[doc_id]) for doc_id in expected)
+
+
+def _sklearn_scores(texts, query):
+    """以 TfidfVectorizer 在全部文檔上計算的餘弦相似度，作為參考答案"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from Analyzer import analyzer
+    doc_ids = sorted(texts)
+    vectorizer = TfidfVectorizer(analyzer=analyzer)
+    matrix = vectorizer.fit_transform([texts[doc_id] for doc_id in doc_ids])
+    similarities = (matrix @ vectorizer.transform([query]).T).toarray().ravel()
+    return {doc_id: score for doc_id, score in zip(doc_ids, similarities.tolist()) if score > 0}
+
+
+def _assert_scores(found, expected):
+    assert found.keys() == expected.keys()
+    assert all(found[doc_id] == pytest.approx(expected[doc_id]) for doc_id in expected)
+
+
+def test_tfidf_uses_corpus_wide_idf(monkeypatch):
+    """段、緩衝區與刪除標記分開保存，IDF 與餘弦相似度仍與整個語料上的 TfidfVectorizer 相同"""
+    monkeypatch.setattr(SegmentedIndex, 'BUFFER_LIMIT', 40)
+    rng = random.Random(8)
+    texts = _texts(rng, range(300))
+    base = {doc_id: texts[doc_id] for doc_id in range(100)}
+    index = SegmentedIndex.SegmentedIndex(Segment(InvertedIndex(base), sorted(base)), texts.get)
+    for start in range(100, 300, 20):
+        index.add_documents({doc_id: texts[doc_id] for doc_id in range(start, start + 20)})
+    index.wait_for_merges()
+    for doc_id in rng.sample(sorted(texts), 50):
+        index.remove_document(doc_id, texts.pop(doc_id))
+    assert len(index.parts()) > 2
+
+    for query in QUERIES + ['Apple apple unknown']:
+        _assert_scores(_scores(index, query), _sklearn_scores(texts, query))
+    batch = index.tfidf_top_k_batch(QUERIES, 5)
+    assert batch == [index.tfidf_top_k(query, 5) for query in QUERIES]
+
+
+def test_tfidf_with_collection_statistics_matches_single_index():
+    """分片只保存部分文檔，以整個語料的統計量評分時分數與單一索引相同"""
+    from ShardedSearch import CollectionStatistics
+    texts = _texts(random.Random(9), range(200))
+    collection = CollectionStatistics.of(InvertedIndex.tokenize(text) for text in texts.values())
+    shards = [{doc_id: text for doc_id, text in texts.items() if doc_id % 3 == shard} for shard in range(3)]
+    indexes = [_build(shard) for shard in shards]
+    for query in QUERIES:
+        found = {}
+        for index in indexes:
+            doc_ids, scores = index.tfidf_scores(query, collection)
+            found.update(zip(doc_ids.tolist(), scores.tolist()))
+        _assert_scores(found, _sklearn_scores(texts, query))
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+from rapidfuzz.distance import OSA
+
+from InvertedIndex import InvertedIndex
+from SegmentedIndex import Segment, SegmentedIndex
+from SpellingCorrector import PREFIX_LENGTH, SpellingCorrector
+
+
+@pytest.fixture(scope='module')
+def vocabulary():
+    rng = random.Random(19)
+    # 包含比 PREFIX_LENGTH 長的詞，確認只索引前綴不會漏掉候選
+    return sorted({''.join(rng.choices('abcdef', k=rng.randint(1, PREFIX_LENGTH + 4))) for _ in range(3000)})
+
+
+def test_lookup_matches_brute_force(vocabulary):
+    corrector = SpellingCorrector(vocabulary)
+    rng = random.Random(37)
+    queries = rng.sample(vocabulary, 40) + [''.join(rng.choices('abcdefg', k=rng.randint(1, 12))) for _ in range(40)]
+    for word in queries:
+        for distance in (1, 2):
+            expected = {term: OSA.distance(word, term) for term in vocabulary if OSA.distance(word, term) <= distance}
+            assert dict(corrector.lookup(word, distance)) == expected, (word, distance)
+
+
+def test_transposition_is_one_edit():
+    corrector = SpellingCorrector(['quick', 'queries'])
+    assert corrector.lookup('quikc', 1) == [('quick', 1)]
+
+
+@pytest.fixture
+def index():
+    texts = {0: 'search engine ranking', 1: 'search results', 2: 'research papers', 3: 'seared tuna',
+             4: 'searches and searching'}
+    segmented = SegmentedIndex(Segment(InvertedIndex({doc_id: texts[doc_id] for doc_id in range(3)}), range(3)),
+                               texts.get)
+    segmented.add_documents({doc_id: texts[doc_id] for doc_id in range(3, 5)})
+    return segmented
+
+
+def test_correct_prefers_the_closest_then_the_most_frequent(index):
+    assert index.correct('seerch') == 'search'
+    assert index.correct('serch') == 'search'
+    # searches 同樣只差一個字，search 的文檔頻率較高
+    assert index.correct('searchs') == 'search'
+    assert index.correct('xyzzy') is None
+    assert index.correct('sea') is None
+
+
+def test_did_you_mean_only_replaces_unknown_words(index):
+    assert index.did_you_mean('serch resluts') == 'search results'
+    assert index.did_you_mean('Search tuna') is None
+    assert index.did_you_mean('search xyzzy') is None
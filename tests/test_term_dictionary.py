@@ -0,0 +1,54 @@
+import fnmatch
+import random
+
+import pytest
+
+import SegmentedIndex
+from InvertedIndex import InvertedIndex
+from SegmentedIndex import Segment
+from TermDictionary import TermDictionary
+
+LAST = chr(0x10FFFF)
+
+
+@pytest.fixture
+def dictionary():
+    rng = random.Random(11)
+    words = sorted({''.join(rng.choices('abcde', k=rng.randint(1, 6))) for _ in range(600)})
+    weights = [rng.randint(1, 50) for _ in words]
+    return TermDictionary(words, weights), dict(zip(words, weights))
+
+
+def _expected(weights, matches, limit=None):
+    return sorted(((word, weight) for word, weight in weights.items() if matches(word)),
+                  key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def test_complete_matches_brute_force(dictionary):
+    terms, weights = dictionary
+    for prefix in ['', 'a', 'ab', 'abc', 'eeee', 'zz']:
+        assert terms.complete(prefix, 7) == _expected(weights, lambda word: word.startswith(prefix), 7)
+        assert terms.complete(prefix, None) == _expected(weights, lambda word: word.startswith(prefix))
+
+
+def test_wildcards_match_brute_force(dictionary):
+    terms, weights = dictionary
+    for pattern in ['a*', '*e', 'a*e', 'ab*ba', '?b*', 'a?c*d?', '*', 'abcde', 'a*b*c', '*dd*']:
+        assert terms.match(pattern) == _expected(weights, lambda word: fnmatch.fnmatchcase(word, pattern)), pattern
+
+
+def test_prefix_ending_in_the_last_code_point():
+    words = ['a', 'a' + LAST, 'a' + LAST + 'b', 'b', LAST, LAST + LAST]
+    terms = TermDictionary(words, [6, 5, 4, 3, 2, 1])
+    assert terms.complete('a' + LAST) == [('a' + LAST, 5), ('a' + LAST + 'b', 4)]
+    assert terms.complete(LAST) == [(LAST, 2), (LAST + LAST, 1)]
+    assert terms.match(LAST + '*') == [(LAST, 2), (LAST + LAST, 1)]
+
+
+def test_wildcard_expanding_to_too_many_terms_is_rejected():
+    texts = {doc_id: f'term{doc_id} common' for doc_id in range(20)}
+    index = SegmentedIndex.SegmentedIndex(Segment(InvertedIndex(texts), sorted(texts)), texts.get)
+    assert len(index.wildcard_terms('term*', 20)) == 20
+    assert index.wildcard_terms('term1*', 11) == ['term1'] + [f'term{doc_id}' for doc_id in range(10, 20)]
+    with pytest.raises(ValueError, match='pattern too broad'):
+        index.wildcard_terms('term*', 19)